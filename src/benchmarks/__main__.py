@@ -0,0 +1,313 @@
+"""Drives the message handler with synthetic slot machine updates.
+
+OpenAI and the Telegram Bot API are replaced by local fake servers, so this runs
+offline. Run it from the src directory: python -m benchmarks --help
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import resource
+import statistics
+import time
+from datetime import timedelta
+from typing import cast
+from zoneinfo import ZoneInfo
+
+from bs_nats_updater import NatsConfig
+from rate_limiter import RateLimiter, RateLimitingRepo, repo
+from telegram import Bot as TelegramBot
+from telegram import Update
+
+from horoscopebot.bot import Bot, TelegramContext
+from horoscopebot.config import (
+    CircuitBreakerConfig,
+    HttpClientConfig,
+    JobQueueConfig,
+    OpenAiConfig,
+    PoolConfig,
+    ResultCacheConfig,
+    SendRateConfig,
+    TelegramConfig,
+    TimeoutConfig,
+)
+from horoscopebot.dementia_responder import WeekDementiaResponder
+from horoscopebot.horoscope.weekly_openai import WeeklyOpenAiHoroscope
+from horoscopebot.housekeeping import Housekeeper
+from horoscopebot.idempotency import LocalUpdateGuard
+from horoscopebot.job_queue import ClaimedJob, GenerationJob, LocalJobQueue
+from horoscopebot.leader import LocalLeaderLock
+from horoscopebot.partitions import LocalChatPartitions
+from horoscopebot.rate_limit_policy import WeeklyLimitPolicy
+from horoscopebot.update_processor import ChatOrderedUpdateProcessor
+
+from .fake_openai import FakeOpenAi
+from .fake_telegram import FakeTelegram
+
+_LOG = logging.getLogger(__name__)
+
+_TOKEN = "123456:benchmark"
+_FIRST_CHAT_ID = -1000
+
+
+class _TrackingJobQueue(LocalJobQueue):
+    """Lets the benchmark wait until the job of an update has been completed."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        # By message ID
+        self.completions: dict[int, asyncio.Future[None]] = {}
+
+    async def enqueue(self, job: GenerationJob) -> None:
+        self.completions[job.message_id] = asyncio.get_running_loop().create_future()
+        await super().enqueue(job)
+
+    async def complete(self, claimed: ClaimedJob) -> None:
+        await super().complete(claimed)
+        completion = self.completions.get(claimed.job.message_id)
+        if completion is not None and not completion.done():
+            completion.set_result(None)
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--users", type=int, default=250)
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--completion-latency-ms", type=int, default=50)
+    parser.add_argument("--image-latency-ms", type=int, default=200)
+    parser.add_argument("--telegram-latency-ms", type=int, default=20)
+    parser.add_argument("--text-length", type=int, default=1500)
+    parser.add_argument("--image-size", type=int, default=1024 * 1024)
+    parser.add_argument("--pipeline-images", action="store_true")
+    parser.add_argument("--structured-output", action="store_true")
+    parser.add_argument("--cache-max-bytes", type=int, default=0)
+    parser.add_argument("--cache-reuse-probability", type=float, default=0.5)
+    parser.add_argument(
+        "--rate-limiter",
+        choices=["memory", "postgres"],
+        default="memory",
+    )
+    parser.add_argument("--db-host", default="localhost")
+    parser.add_argument("--db-name", default="horoscope")
+    parser.add_argument("--db-user", default="postgres")
+    parser.add_argument("--db-password", default="postgres")
+    return parser.parse_args()
+
+
+async def _create_repo(args: argparse.Namespace) -> RateLimitingRepo:
+    if args.rate_limiter == "memory":
+        return repo.InMemoryRateLimitingRepo()
+
+    # The schema has to be migrated beforehand, like in production
+    return await repo.PostgresRateLimitingRepo.connect(
+        host=args.db_host,
+        database=args.db_name,
+        username=args.db_user,
+        password=args.db_password,
+        min_connections=2,
+        max_connections=8,
+    )
+
+
+def _create_update(
+    bot: TelegramBot,
+    update_id: int,
+    chat_id: int,
+    user_id: int,
+) -> Update:
+    return Update.de_json(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "group", "title": "Benchmark"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+                "dice": {"emoji": "🎰", "value": random.randint(1, 64)},
+            },
+        },
+        bot,
+    )
+
+
+def _percentile(values: list[float], percentile: int) -> float:
+    return statistics.quantiles(values, n=100)[percentile - 1]
+
+
+async def _run(args: argparse.Namespace) -> None:
+    fake_openai = FakeOpenAi(
+        completion_latency=timedelta(milliseconds=args.completion_latency_ms),
+        image_latency=timedelta(milliseconds=args.image_latency_ms),
+        text_length=args.text_length,
+        image_size=args.image_size,
+    )
+    fake_telegram = FakeTelegram(
+        latency=timedelta(milliseconds=args.telegram_latency_ms),
+    )
+    await fake_openai.start()
+    await fake_telegram.start()
+
+    os.environ["OPENAI_BASE_URL"] = f"{fake_openai.url}/v1"
+    telegram_bot = TelegramBot(_TOKEN, base_url=f"{fake_telegram.url}/bot")
+    await telegram_bot.initialize()
+
+    timezone = ZoneInfo("Europe/Berlin")
+    chat_ids = [_FIRST_CHAT_ID - index for index in range(args.chats)]
+    horoscope = WeeklyOpenAiHoroscope(
+        OpenAiConfig(
+            breaker=CircuitBreakerConfig(failure_threshold=5, reset_seconds=30),
+            cache=ResultCacheConfig(
+                image_reuse_probability=args.cache_reuse_probability,
+                max_bytes=args.cache_max_bytes,
+                text_reuse_probability=args.cache_reuse_probability,
+            ),
+            deadline_seconds=90,
+            debug_mode=False,
+            http=HttpClientConfig(
+                connect_timeout_seconds=5,
+                http2=False,
+                keepalive_expiry_seconds=120,
+                max_connections=args.concurrency,
+                max_keepalive_connections=args.concurrency,
+                read_timeout_seconds=120,
+            ),
+            image_compression=None,
+            image_format="png",
+            image_model_name="fake",
+            image_moderation_level="low",
+            image_quality="low",
+            model_name="fake",
+            pipeline_images=args.pipeline_images,
+            pool=PoolConfig(size=0, refill_delay_seconds=0, refill_hours=[]),
+            structured_output=args.structured_output,
+            timeouts=TimeoutConfig(
+                completion_max_seconds=600,
+                completion_min_seconds=5,
+                image_max_seconds=600,
+                image_min_seconds=10,
+                image_prompt_max_seconds=600,
+                image_prompt_min_seconds=5,
+            ),
+            token="benchmark",
+        ),
+        timezone,
+    )
+    rate_limiter = RateLimiter(
+        policy=WeeklyLimitPolicy(),
+        repo=await _create_repo(args),
+        timezone=timezone,
+        retention_time=timedelta(days=14),
+    )
+    job_queue = _TrackingJobQueue()
+    partitions = LocalChatPartitions(count=1, index=0)
+    await partitions.acquire()
+    bot = Bot(
+        TelegramConfig(
+            drain_timeout_seconds=0,
+            enabled_chats=chat_ids,
+            max_concurrent_generations=args.concurrency,
+            max_concurrent_updates=args.concurrency,
+            partition_count=1,
+            partition_index=0,
+            # The fake server has no flood control
+            send_rate=SendRateConfig(
+                burst=1000,
+                global_per_second=1000,
+                group_per_minute=60_000,
+                private_per_second=1000,
+            ),
+            token=_TOKEN,
+        ),
+        # Only needed by Bot.run
+        cast(NatsConfig, None),
+        horoscope=horoscope,
+        rate_limiter=rate_limiter,
+        dementia_responder=WeekDementiaResponder(),
+        housekeeper=Housekeeper(
+            rate_limiter,
+            LocalLeaderLock(),
+            interval=timedelta(days=1),
+            jitter=timedelta(),
+        ),
+        update_guard=LocalUpdateGuard(),
+        partitions=partitions,
+        job_queue=job_queue,
+        job_queue_config=JobQueueConfig(
+            lease_seconds=300,
+            max_attempts=1,
+            poll_interval_seconds=1,
+            retry_base_seconds=1,
+            retry_max_seconds=1,
+        ),
+        timezone=timezone,
+    )
+    processor = ChatOrderedUpdateProcessor(
+        args.concurrency,
+        update_filter=bot._update_filter,
+    )
+
+    updates = [
+        _create_update(
+            telegram_bot,
+            update_id=index,
+            chat_id=chat_ids[index % args.chats],
+            user_id=index % args.users,
+        )
+        for index in range(args.updates)
+    ]
+
+    latencies: list[float] = []
+
+    async def handle(update: Update) -> None:
+        start = time.perf_counter()
+        await processor.process_update(
+            update,
+            bot._handle_message(update, cast(TelegramContext, None)),
+        )
+        # Updates without a job, e.g. repeated rolls, are already done
+        if completion := job_queue.completions.get(update.update_id):
+            await completion
+        latencies.append(time.perf_counter() - start)
+
+    workers = [
+        asyncio.create_task(bot._run_generation_worker(telegram_bot))
+        for _ in range(args.concurrency)
+    ]
+
+    _LOG.info("Handling %d updates", len(updates))
+    start = time.perf_counter()
+    await asyncio.gather(*(handle(update) for update in updates))
+    duration = time.perf_counter() - start
+
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+
+    await horoscope.close()
+    await rate_limiter.close()
+    await telegram_bot.shutdown()
+    await fake_openai.close()
+    await fake_telegram.close()
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"rate limiter:   {args.rate_limiter}")
+    print(f"updates:        {len(updates)}")
+    print(f"updates/s:      {len(updates) / duration:.1f}")
+    for percentile in [50, 95, 99]:
+        latency = _percentile(latencies, percentile) * 1000
+        print(f"p{percentile} latency:    {latency:.1f} ms")
+    print(f"peak RSS:       {peak_rss / 1024:.1f} MiB")
+    print(f"uploaded:       {fake_telegram.uploaded_bytes / 1024 / 1024:.1f} MiB")
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(_run(_parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import asyncio
+import base64
+import json
+import os
+from datetime import timedelta
+from typing import Any
+
+from .fake_server import FakeHttpServer
+
+
+class FakeOpenAi(FakeHttpServer):
+    def __init__(
+        self,
+        *,
+        completion_latency: timedelta,
+        image_latency: timedelta,
+        text_length: int,
+        image_size: int,
+    ):
+        super().__init__()
+        self._completion_latency = completion_latency.total_seconds()
+        self._image_latency = image_latency.total_seconds()
+        words = ("Lorem ipsum dolor sit amet " * (text_length // 27 + 1)).split()
+        self._text = " ".join(words)[:text_length]
+        self._image = base64.b64encode(os.urandom(image_size)).decode()
+
+    async def handle(self, method: str, path: str, body: bytes) -> Any:
+        if path.endswith("/chat/completions"):
+            await asyncio.sleep(self._completion_latency)
+            content = self._text
+            if "response_format" in json.loads(body):
+                content = json.dumps(
+                    {"horoscope": self._text, "image_description": "Lorem ipsum"},
+                )
+            return {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "fake",
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }
+                ],
+            }
+
+        if path.endswith("/images/generations"):
+            await asyncio.sleep(self._image_latency)
+            return {"created": 0, "data": [{"b64_json": self._image}]}
+
+        raise ValueError(f"Unexpected OpenAI request: {method} {path}")
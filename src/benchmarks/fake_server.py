@@ -0,0 +1,66 @@
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from typing import Any
+
+_LOG = logging.getLogger(__name__)
+
+
+class FakeHttpServer(ABC):
+    """Minimal HTTP/1.1 server with keep-alive, just enough for httpx clients."""
+
+    def __init__(self) -> None:
+        self._server: asyncio.Server | None = None
+        self._connections: set[asyncio.StreamWriter] = set()
+        self.port = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @abstractmethod
+    async def handle(self, method: str, path: str, body: bytes) -> Any:
+        """Returns the JSON response body for the request."""
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Idle keep-alive connections would otherwise keep wait_closed waiting
+            for writer in self._connections:
+                writer.close()
+            await self._server.wait_closed()
+
+    async def _serve(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        self._connections.add(writer)
+        try:
+            while request_line := await reader.readline():
+                method, path, _ = request_line.decode().split(" ", 2)
+                content_length = 0
+                while (header := await reader.readline()) not in (b"\r\n", b""):
+                    name, _, value = header.decode().partition(":")
+                    if name.strip().lower() == "content-length":
+                        content_length = int(value)
+
+                body = await reader.readexactly(content_length)
+                response = json.dumps(await self.handle(method, path, body)).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/json\r\n"
+                    b"Content-Length: %d\r\n\r\n" % len(response)
+                )
+                writer.write(response)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
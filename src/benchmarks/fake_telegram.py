@@ -0,0 +1,65 @@
+import asyncio
+import itertools
+import json
+import time
+from datetime import timedelta
+from typing import Any
+from urllib.parse import parse_qs
+
+from .fake_server import FakeHttpServer
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Horoscope", "username": "bot"}
+
+
+def _parse_params(body: bytes) -> dict[str, Any]:
+    text = body.decode()
+    if text.startswith("{"):
+        return json.loads(text)
+
+    return {key: values[0] for key, values in parse_qs(text).items()}
+
+
+class FakeTelegram(FakeHttpServer):
+    def __init__(self, *, latency: timedelta):
+        super().__init__()
+        self._latency = latency.total_seconds()
+        self._message_ids = itertools.count(1_000_000)
+        self._file_ids = itertools.count()
+        self.uploaded_bytes = 0
+
+    def _message(self, chat_id: int) -> dict[str, Any]:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "group", "title": "Benchmark"},
+            "from": BOT_USER,
+        }
+
+    async def handle(self, method: str, path: str, body: bytes) -> Any:
+        await asyncio.sleep(self._latency)
+
+        api_method = path.rsplit("/", 1)[-1]
+        match api_method:
+            case "getMe":
+                result: Any = BOT_USER
+            case "sendMessage":
+                params = _parse_params(body)
+                result = self._message(int(params.get("chat_id", 0)))
+                result["text"] = params.get("text", "")
+            case "sendPhoto":
+                self.uploaded_bytes += len(body)
+                file_id = f"file-{next(self._file_ids)}"
+                # Multipart bodies aren't parsed, the chat ID doesn't matter here
+                result = self._message(0)
+                result["photo"] = [
+                    {
+                        "file_id": file_id,
+                        "file_unique_id": file_id,
+                        "width": 1024,
+                        "height": 1024,
+                    }
+                ]
+            case _:
+                result = True
+
+        return {"ok": True, "result": result}
@@ -1,8 +1,10 @@
+import asyncio
 import logging
+import os
 from datetime import datetime, timedelta, tzinfo
+from pathlib import Path
 from zoneinfo import ZoneInfo
 
-import sentry_sdk
 import uvloop
 from bs_config import Env
 from opentelemetry.instrumentation.logging import LoggingInstrumentor
@@ -18,9 +20,11 @@ from rate_limiter import (
 from horoscopebot.bot import Bot
 from horoscopebot.config import (
     Config,
+    DatabaseConfig,
     HoroscopeConfig,
     HoroscopeMode,
     RateLimitConfig,
+    TelegramConfig,
 )
 from horoscopebot.dementia_responder import (
     DayDementiaResponder,
@@ -28,8 +32,24 @@ from horoscopebot.dementia_responder import (
     WeekDementiaResponder,
 )
 from horoscopebot.horoscope.horoscope import Horoscope
+from horoscopebot.horoscope.store import ResultStore
 from horoscopebot.horoscope.weekly_openai import WeeklyOpenAiHoroscope
+from horoscopebot.housekeeping import Housekeeper
+from horoscopebot.idempotency import (
+    LocalUpdateGuard,
+    PostgresUpdateGuard,
+    UpdateGuard,
+)
+from horoscopebot.job_queue import JobQueue, LocalJobQueue, PostgresJobQueue
+from horoscopebot.leader import LeaderLock, LocalLeaderLock, PostgresLeaderLock
+from horoscopebot.partitions import (
+    ChatPartitions,
+    LocalChatPartitions,
+    PostgresChatPartitions,
+)
+from horoscopebot.rate_limit_cache import CachingRateLimitingRepo
 from horoscopebot.rate_limit_policy import UserPassPolicy, WeeklyLimitPolicy
+from horoscopebot.rate_limit_timeout import TimeoutRateLimitingRepo
 from horoscopebot.telemetry import setup_telemetry
 
 _LOG = logging.getLogger(__package__)
@@ -45,16 +65,27 @@ def _setup_sentry(dsn: str | None, release: str) -> None:
         _LOG.warning("Sentry DSN not found")
         return
 
+    # Only imported if needed, because it takes a while
+    import sentry_sdk
+
     sentry_sdk.init(
         dsn=dsn,
         release=release,
     )
 
 
-def _load_horoscope(config: HoroscopeConfig) -> Horoscope:
+def _load_horoscope(config: HoroscopeConfig, timezone: tzinfo) -> Horoscope:
+    store: ResultStore | None = None
+    if config.store_path:
+        store = ResultStore(Path(config.store_path))
+
     match config.mode:
         case HoroscopeMode.OpenAiWeekly:
-            return WeeklyOpenAiHoroscope(config.openai)  # type: ignore
+            return WeeklyOpenAiHoroscope(
+                config.openai,  # type: ignore
+                timezone,
+                store=store,
+            )
         case invalid:
             raise ValueError(f"Invalid horoscope mode: {invalid}")
 
@@ -72,6 +103,26 @@ class _StubRateLimitPolicy(RateLimitingPolicy):
         return None
 
 
+def _configure_libpq(config: DatabaseConfig) -> None:
+    # The rate limiter library doesn't expose connection options, but libpq reads
+    # this from the environment for every connection it opens. Its statement
+    # timeout is enforced by TimeoutRateLimitingRepo instead, so housekeeping isn't
+    # affected by it.
+    os.environ.setdefault("PGCONNECT_TIMEOUT", str(config.connect_timeout_seconds))
+
+
+async def _warm_up_repo(repository: RateLimitingRepo, connections: int) -> None:
+    _LOG.info("Warming up %d database connections", connections)
+    # Concurrent queries make the pool open all minimum connections and warm up the
+    # server-side caches for the usage query before the first update arrives.
+    await asyncio.gather(
+        *(
+            repository.get_usages(context_id="warm-up", user_id="warm-up", limit=1)
+            for _ in range(connections)
+        )
+    )
+
+
 async def _load_rate_limiter(
     timezone: tzinfo,
     config: RateLimitConfig,
@@ -91,15 +142,29 @@ async def _load_rate_limiter(
         _LOG.warning("Using in-memory rate limiting repo")
         repository = repo.InMemoryRateLimitingRepo()
     else:
+        _configure_libpq(db_config)
         repository = await repo.PostgresRateLimitingRepo.connect(
             host=db_config.db_host,
             database=db_config.db_name,
             username=db_config.db_user,
             password=db_config.db_password,
-            min_connections=1,
-            max_connections=2,
+            min_connections=db_config.min_connections,
+            max_connections=db_config.max_connections,
+        )
+        await _warm_up_repo(repository, db_config.min_connections)
+        repository = TimeoutRateLimitingRepo(
+            repository,
+            timeout=timedelta(milliseconds=db_config.statement_timeout_millis),
         )
 
+        if config.cache_size > 0:
+            repository = CachingRateLimitingRepo(
+                repository,
+                max_entries=config.cache_size,
+                ttl=timedelta(seconds=config.cache_ttl_seconds),
+                timezone=timezone,
+            )
+
     _LOG.info(
         "Admin pass is %s",
         "enabled" if config.admin_pass else "disabled",
@@ -130,6 +195,50 @@ async def _load_rate_limiter(
     ), dementia_responder
 
 
+def _load_leader_lock(config: RateLimitConfig) -> LeaderLock:
+    if config.rate_limiter_type == "stub" or config.db_config is None:
+        return LocalLeaderLock()
+
+    return PostgresLeaderLock(config.db_config)
+
+
+async def _load_update_guard(config: RateLimitConfig) -> UpdateGuard:
+    if config.rate_limiter_type == "stub" or config.db_config is None:
+        return LocalUpdateGuard()
+
+    return await PostgresUpdateGuard.connect(config.db_config)
+
+
+def _load_partitions(
+    config: RateLimitConfig,
+    telegram_config: TelegramConfig,
+) -> ChatPartitions:
+    count = telegram_config.partition_count
+    index = telegram_config.partition_index
+    if config.rate_limiter_type == "stub" or config.db_config is None:
+        return LocalChatPartitions(count=count, index=index)
+
+    return PostgresChatPartitions(config.db_config, count=count, index=index)
+
+
+async def _load_job_queue(
+    config: RateLimitConfig,
+    telegram_config: TelegramConfig,
+    partitions: ChatPartitions,
+) -> JobQueue:
+    if config.rate_limiter_type == "stub" or config.db_config is None:
+        _LOG.warning("Using in-memory job queue, jobs will be lost on restart")
+        return LocalJobQueue()
+
+    # Every worker holds a connection while claiming, completing or retrying a job,
+    # and the update handler needs one to enqueue.
+    return await PostgresJobQueue.connect(
+        config.db_config,
+        max_size=telegram_config.max_concurrent_generations + 1,
+        partitions=partitions,
+    )
+
+
 async def main() -> None:
     _setup_logging()
 
@@ -139,15 +248,24 @@ async def main() -> None:
 
     timezone = ZoneInfo("Europe/Berlin")
 
-    horoscope = _load_horoscope(config.horoscope)
+    horoscope = _load_horoscope(config.horoscope, timezone)
     rate_limiter, dementia_responder = await _load_rate_limiter(
         timezone,
         config.rate_limit,
         is_weekly=config.horoscope.mode == HoroscopeMode.OpenAiWeekly,
     )
 
-    _LOG.info("Doing housekeeping of rate limiter DB")
-    await rate_limiter.do_housekeeping()
+    update_guard = await _load_update_guard(config.rate_limit)
+    partitions = _load_partitions(config.rate_limit, config.telegram)
+    job_queue = await _load_job_queue(config.rate_limit, config.telegram, partitions)
+    housekeeper = Housekeeper(
+        rate_limiter,
+        _load_leader_lock(config.rate_limit),
+        interval=timedelta(seconds=config.rate_limit.housekeeping_interval_seconds),
+        jitter=timedelta(seconds=config.rate_limit.housekeeping_jitter_seconds),
+        update_guard=update_guard,
+        job_queue=job_queue,
+    )
 
     _LOG.info("Launching bot")
     bot = Bot(
@@ -156,6 +274,11 @@ async def main() -> None:
         horoscope=horoscope,
         rate_limiter=rate_limiter,
         dementia_responder=dementia_responder,
+        housekeeper=housekeeper,
+        update_guard=update_guard,
+        partitions=partitions,
+        job_queue=job_queue,
+        job_queue_config=config.jobs,
         timezone=timezone,
     )
     await bot.run()
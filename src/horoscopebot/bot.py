@@ -1,31 +1,75 @@
 import asyncio
 import logging
 import signal
-from collections.abc import AsyncIterator
+from collections.abc import AsyncIterator, Awaitable, Callable
 from contextlib import asynccontextmanager
-from datetime import tzinfo
-from typing import Any, cast
+from datetime import datetime, timedelta, tzinfo
+from typing import cast
 
 from bs_nats_updater import NatsConfig, create_updater
-from opentelemetry import trace
-from rate_limiter import RateLimiter
-from telegram import Chat, Message, ReplyParameters, Update
+from opentelemetry import metrics, trace
+from rate_limiter import RateLimiter, Usage
+from telegram import Bot as TelegramBot
+from telegram import Chat, Dice, Message, ReplyParameters, Update
 from telegram.constants import ParseMode
-from telegram.error import BadRequest
+from telegram.error import BadRequest, ChatMigrated, Forbidden
 from telegram.ext import (
     Application,
     ContextTypes,
     MessageHandler,
-    filters,
 )
 
-from horoscopebot.config import TelegramConfig
+from horoscopebot.config import JobQueueConfig, TelegramConfig
 from horoscopebot.dementia_responder import DementiaResponder
 from horoscopebot.horoscope.horoscope import Horoscope, HoroscopeResult
+from horoscopebot.housekeeping import Housekeeper
+from horoscopebot.idempotency import UpdateGuard
+from horoscopebot.job_queue import (
+    ClaimedJob,
+    GenerationJob,
+    JobProgress,
+    JobQueue,
+    backoff_delay,
+)
+from horoscopebot.metrics import record_duration
+from horoscopebot.partitions import ChatPartitions
+from horoscopebot.reservation import UsageReservations
+from horoscopebot.send_queue import SendScheduler
+from horoscopebot.update_filter import EnabledSlotMachineFilter
+from horoscopebot.update_processor import ChatOrderedUpdateProcessor
 
 _LOG = logging.getLogger(__name__)
 tracer = trace.get_tracer(__name__)
+meter = metrics.get_meter(__name__)
+
+_generations_in_flight = meter.create_up_down_counter(
+    "horoscope.generations.in_flight",
+    description="Horoscopes currently being generated and sent",
+)
+_job_delay = meter.create_histogram(
+    "horoscope.jobs.delay",
+    unit="s",
+    description="Time from the dice roll until a worker starts generating",
+)
+_job_failures = meter.create_counter(
+    "horoscope.jobs.failed",
+    description="Failed generation attempts, by whether the job is retried",
+)
+_send_duration = meter.create_histogram(
+    "horoscope.telegram.send.duration",
+    unit="s",
+    description="Duration of Telegram send requests, including uploads",
+)
+_uploaded_image_bytes = meter.create_counter(
+    "horoscope.telegram.uploaded_image_bytes",
+    unit="By",
+    description="Image bytes uploaded to Telegram",
+)
 
+# Sent if no horoscope can be generated for a roll that has already been counted
+_FAILURE_TEXT = (
+    "Die Sterne schweigen heute. Ich konnte dir leider kein Horoskop erstellen."
+)
 
 type TelegramContext = ContextTypes.DEFAULT_TYPE
 
@@ -33,11 +77,17 @@ type TelegramContext = ContextTypes.DEFAULT_TYPE
 @asynccontextmanager
 async def telegram_span(*, update: Update, name: str) -> AsyncIterator[trace.Span]:
     with tracer.start_as_current_span(name) as span:
-        span.set_attribute(
-            "telegram.update_keys",
-            list(update.to_dict(recursive=False).keys()),
-        )
+        if not span.is_recording():
+            yield span
+            return
+
         span.set_attribute("telegram.update_id", update.update_id)
+        update_type = next(
+            (key for key in Update.ALL_TYPES if getattr(update, key) is not None),
+            None,
+        )
+        if update_type is not None:
+            span.set_attribute("telegram.update_type", update_type)
 
         if message := update.effective_message:
             span.set_attribute("telegram.message_id", message.message_id)
@@ -65,19 +115,41 @@ class Bot:
         horoscope: Horoscope,
         rate_limiter: RateLimiter,
         dementia_responder: DementiaResponder,
+        housekeeper: Housekeeper,
+        update_guard: UpdateGuard,
+        partitions: ChatPartitions,
+        job_queue: JobQueue,
+        job_queue_config: JobQueueConfig,
         timezone: tzinfo,
     ):
         self.config = config
         self._nats_config = nats_config
         self.horoscope = horoscope
         self._rate_limiter = rate_limiter
+        self._reservations = UsageReservations(rate_limiter)
         self._timezone = timezone
         self._dementia_responder = dementia_responder
+        self._housekeeper = housekeeper
+        self._update_guard = update_guard
+        self._partitions = partitions
+        self._job_queue = job_queue
+        self._job_queue_config = job_queue_config
         self._should_terminate = False
+        self._jobs_in_flight = 0
+        self._send_scheduler = SendScheduler(config.send_rate)
+        self._update_filter = EnabledSlotMachineFilter(
+            config.enabled_chats,
+            partitions=partitions,
+        )
 
-    async def __post_shutdown(self, _: Any) -> None:
-        _LOG.info("Post shutdown hook called")
+    async def _close(self) -> None:
+        # Only run_polling and run_webhook would call a post_shutdown hook
+        _LOG.info("Closing resources")
+        await self.horoscope.close()
         await self._rate_limiter.close()
+        await self._update_guard.close()
+        await self._job_queue.close()
+        await self._partitions.close()
 
     async def run(self) -> None:
         updater = create_updater(self.config.token, self._nats_config)
@@ -85,39 +157,98 @@ class Bot:
         app = (
             Application.builder()
             .updater(updater)
-            .post_shutdown(self.__post_shutdown)
+            .concurrent_updates(
+                ChatOrderedUpdateProcessor(
+                    self.config.max_concurrent_updates,
+                    # Most updates are dropped here, before any tracing or locking
+                    update_filter=self._update_filter,
+                )
+            )
             .build()
         )
 
         app.add_handler(
             MessageHandler(
-                filters=filters.Dice.SLOT_MACHINE,
+                filters=self._update_filter,
                 callback=self._handle_message,
             )
         )
 
-        async with app:
-            _LOG.info("Running bot")
-            await app.start()
-            await updater.start_polling()
-
-            finish_line = asyncio.Event()
-            loop = asyncio.get_running_loop()
-            for sig in [signal.SIGTERM, signal.SIGINT]:
-                loop.add_signal_handler(
-                    sig,
-                    finish_line.set,
-                )
-
-            _LOG.info("Waiting for exit signal")
-            await finish_line.wait()
-            _LOG.info("Exit signal received.")
+        try:
+            async with app:
+                _LOG.info("Running bot")
+                await app.start()
+                await updater.start_polling()
+                # Updates are only handled once the partition has been handed back by
+                # the replica which took it over, if any
+                await self._partitions.acquire()
+                partitions_task = asyncio.create_task(self._partitions.run())
+                await self.horoscope.start()
+                housekeeping_task = asyncio.create_task(self._housekeeper.run())
+                worker_tasks = [
+                    asyncio.create_task(self._run_generation_worker(app.bot))
+                    for _ in range(self.config.max_concurrent_generations)
+                ]
+
+                finish_line = asyncio.Event()
+                loop = asyncio.get_running_loop()
+                for sig in [signal.SIGTERM, signal.SIGINT]:
+                    loop.add_signal_handler(
+                        sig,
+                        finish_line.set,
+                    )
 
-            _LOG.info("Stopping updater")
-            await updater.stop()
-            _LOG.info("Stopping application")
-            await app.stop()
-            _LOG.info("Exiting app context manager")
+                _LOG.info("Waiting for exit signal")
+                await finish_line.wait()
+                _LOG.info("Exit signal received.")
+                # The drain timeout counts from the signal, since that is when the
+                # grace period of the pod starts
+                drain_deadline = loop.time() + self.config.drain_timeout_seconds
+                self._request_termination()
+                housekeeping_task.cancel()
+                partitions_task.cancel()
+                _LOG.info("Handing over partitions")
+                await self._partitions.release()
+
+                _LOG.info("Stopping updater")
+                await updater.stop()
+                _LOG.info("Stopping application")
+                # This waits for update handlers that are still running
+                await app.stop()
+                await self._drain_workers(worker_tasks, drain_deadline)
+                _LOG.info("Exiting app context manager")
+        finally:
+            await self._close()
+
+    def _request_termination(self) -> None:
+        # Workers stop claiming jobs right away, the remaining ones are left to the
+        # next start. Idle workers are woken up instead of waiting for the next poll.
+        self._should_terminate = True
+        self._job_queue.interrupt_waits()
+
+    async def _drain_workers(
+        self,
+        worker_tasks: list[asyncio.Task[None]],
+        deadline: float,
+    ) -> None:
+        """Lets the workers finish their current jobs.
+
+        Workers still busy at the deadline (in event loop time) are cancelled, which
+        hands their jobs back to the queue.
+        """
+        if not worker_tasks:
+            return
+
+        _LOG.info("Draining %d in-flight generations", self._jobs_in_flight)
+        _, pending = await asyncio.wait(
+            worker_tasks,
+            timeout=max(deadline - asyncio.get_running_loop().time(), 0),
+        )
+        if pending:
+            _LOG.warning("Cancelling %d workers after drain timeout", len(pending))
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
 
     @staticmethod
     def _split_text(text: str, first_limit: int) -> list[str]:
@@ -144,7 +275,8 @@ class Bot:
         text: str,
         reply_to_message_id: int | None,
         use_html_parsing: bool = False,
-        image: bytes | None = None,
+        # Either the raw image or the file ID of a previously uploaded image
+        image: bytes | str | None = None,
     ) -> Message:
         _LOG.info("Sending message with text length %d", len(text))
 
@@ -160,22 +292,45 @@ class Bot:
                 allow_sending_without_reply=False,
             )
 
-        message: Message
-
-        try:
+        async def send_first() -> Message:
             if image is None:
-                message = await chat.send_message(
-                    text=text_parts[0],
-                    reply_parameters=reply_parameters,
-                    parse_mode=parse_mode,
-                )
-            else:
+                with record_duration(_send_duration, {"type": "text"}):
+                    return await chat.send_message(
+                        text=text_parts[0],
+                        reply_parameters=reply_parameters,
+                        parse_mode=parse_mode,
+                    )
+
+            is_upload = isinstance(image, bytes)
+            with record_duration(
+                _send_duration,
+                {"type": "photo", "upload": is_upload},
+            ):
                 message = await chat.send_photo(
                     photo=image,
-                    caption=text_parts[0],
+                    caption=text_parts[0] if text_parts else None,
                     reply_parameters=reply_parameters,
                     parse_mode=parse_mode,
                 )
+            if is_upload:
+                _uploaded_image_bytes.add(len(image))
+            return message
+
+        def send_followup(text_part: str) -> Callable[[], Awaitable[Message]]:
+            async def send() -> Message:
+                with record_duration(_send_duration, {"type": "text"}):
+                    return await chat.send_message(
+                        text=text_part,
+                        parse_mode=parse_mode,
+                    )
+
+            return send
+
+        try:
+            messages = await self._send_scheduler.send(
+                chat.id,
+                [send_first, *(send_followup(part) for part in text_parts[1:])],
+            )
         except BadRequest as e:
             if reply_to_message_id is not None:
                 # Most likely the reply message is gone.
@@ -183,18 +338,203 @@ class Bot:
 
             raise e
 
-        for text_part in text_parts[1:]:
-            await chat.send_message(
-                text=text_part,
-                parse_mode=parse_mode,
+        return messages[0]
+
+    async def _send_result_message(
+        self,
+        chat: Chat,
+        result: HoroscopeResult,
+        text: str,
+        reply_to_message_id: int | None,
+    ) -> Message:
+        message = await self._send_message(
+            chat=chat,
+            text=text,
+            image=result.image_file_id or result.image,
+            use_html_parsing=result.should_use_html_parsing,
+            reply_to_message_id=reply_to_message_id,
+        )
+
+        if message.photo and result.image_file_id is None:
+            # Any further sends of this image can just reference the uploaded file
+            result.image_file_id = message.photo[-1].file_id
+            result.image = None
+
+        return message
+
+    async def _send_result(
+        self,
+        chat: Chat,
+        result: HoroscopeResult,
+        reply_to_message_id: int | None,
+    ) -> Message:
+        pending_image = result.pending_image
+        if pending_image is None:
+            return await self._send_result_message(
+                chat=chat,
+                result=result,
+                text=result.formatted_message,
+                reply_to_message_id=reply_to_message_id,
             )
 
+        # Telegram can't turn a text message into a photo message, so we send the
+        # text right away and post the image as a reply to it once it's done.
+        message = await self._send_message(
+            chat=chat,
+            text=result.formatted_message,
+            use_html_parsing=result.should_use_html_parsing,
+            reply_to_message_id=reply_to_message_id,
+        )
+
+        with tracer.start_as_current_span("await_pending_image"):
+            try:
+                result.image = await pending_image
+            except Exception as e:
+                _LOG.error("Image generation failed after text was sent", exc_info=e)
+                return message
+            finally:
+                result.pending_image = None
+
+        if result.image is None:
+            return message
+
+        try:
+            await self._send_result_message(
+                chat=chat,
+                result=result,
+                text="",
+                reply_to_message_id=message.message_id,
+            )
+        except ReplyMessageGoneException as e:
+            _LOG.error("Could not attach image to horoscope", exc_info=e)
+
         return message
 
     @staticmethod
     def _is_lemons(dice: int) -> bool:
         return dice == 43
 
+    async def _find_response_id(self, user_id: int, usage: Usage) -> str | None:
+        if usage.response_id is not None or usage.reference_id is None:
+            return usage.response_id
+
+        # Usages are recorded before their horoscope is sent
+        try:
+            response_id = await self._job_queue.find_response(
+                chat_id=int(usage.context_id),
+                user_id=user_id,
+                reference_id=usage.reference_id,
+            )
+        except Exception as e:
+            _LOG.error("Could not look up response message", exc_info=e)
+            return None
+
+        return None if response_id is None else str(response_id)
+
+    async def _send_dementia_response(
+        self,
+        message: Message,
+        user_id: int,
+        time: datetime,
+        usage: Usage,
+    ) -> None:
+        dice_value = cast(Dice, message.dice).value
+        if self._is_lemons(dice_value):
+            # The other bot will send the picture anyway, so we'll be quiet
+            return
+
+        usage = Usage(
+            context_id=usage.context_id,
+            user_id=usage.user_id,
+            time=usage.time,
+            reference_id=usage.reference_id,
+            response_id=await self._find_response_id(user_id, usage),
+        )
+
+        response = self._dementia_responder.create_response(
+            current_message_id=message.message_id,
+            current_message_time=time,
+            usage=usage,
+        )
+        reply_message_id = response.reply_message_id or message.message_id
+        try:
+            await self._send_message(
+                chat=message.chat,
+                reply_to_message_id=reply_message_id,
+                text=response.text,
+            )
+        except ReplyMessageGoneException as e:
+            _LOG.error("Could not reply to message", exc_info=e)
+
+    async def _provide_and_send_horoscope(
+        self,
+        chat: Chat,
+        claimed: ClaimedJob,
+        time: datetime,
+    ) -> None:
+        job = claimed.job
+        progress = claimed.progress
+        if progress is None:
+            with tracer.start_as_current_span("provide_horoscope"):
+                horoscope_results = await self.horoscope.provide_horoscope(
+                    dice=job.dice,
+                    context_id=chat.id,
+                    user_id=job.user_id,
+                    message_id=job.message_id,
+                    message_time=time,
+                )
+
+            # A retry only sends what hasn't been sent yet instead of generating again
+            progress = JobProgress(results=horoscope_results)
+            claimed.progress = progress
+            await self._job_queue.save_progress(claimed)
+        elif progress.sent_results:
+            _LOG.info(
+                "Resuming job %d after %d sent results",
+                claimed.id,
+                progress.sent_results,
+            )
+
+        if not progress.results:
+            _LOG.debug(
+                "Not sending horoscope because horoscope returned None for %d",
+                job.dice,
+            )
+            return
+
+        # The send scheduler spaces these out within the chat's rate limit
+        for index in range(progress.sent_results, len(progress.results)):
+            result = progress.results[index]
+            if result.image_dropped:
+                with tracer.start_as_current_span("restore_image"):
+                    await self.horoscope.restore_image(result)
+            if index > 0:
+                response_message = await self._send_result(
+                    chat=chat,
+                    result=result,
+                    reply_to_message_id=None,
+                )
+            else:
+                try:
+                    response_message = await self._send_result(
+                        chat=chat,
+                        result=result,
+                        reply_to_message_id=job.message_id,
+                    )
+                except ReplyMessageGoneException as e:
+                    # The horoscope has already been paid for, so we still send it
+                    _LOG.warning("Could not reply to message, retrying", exc_info=e)
+                    response_message = await self._send_result(
+                        chat=chat,
+                        result=result,
+                        reply_to_message_id=None,
+                    )
+            await self.horoscope.on_result_sent(result)
+
+            progress.sent_results += 1
+            progress.response_id = response_message.message_id
+            await self._job_queue.save_progress(claimed)
+
     async def _handle_message(self, update: Update, ctx: TelegramContext) -> None:
         async with telegram_span(update=update, name="handle_message"):
             message = cast(Message, update.message)
@@ -206,97 +546,174 @@ class Bot:
             user_id = user.id
             time = message.date.astimezone(self._timezone)
 
-            if chat.id not in self.config.enabled_chats:
-                _LOG.debug("Not enabled in chat %d", chat.id)
-                return
+            # The chat and the emoji have already been checked by the update filter
 
-            dice = message.dice
-            if not dice:
-                _LOG.warning("Skipping non-dice message")
+            if not await self._update_guard.claim(update.update_id):
+                _LOG.info("Skipping redelivered update %d", update.update_id)
                 return
 
-            if dice.emoji != "🎰":
-                _LOG.warning("Skipping non-slot-machine message")
-                return
-
-            dice_value = dice.value
-
-            conflicting_usage = await self._rate_limiter.get_offending_usage(
+            reservation = await self._reservations.reserve(
                 context_id=chat.id,
                 user_id=user_id,
                 at_time=time,
+                reference_id=str(message.message_id),
             )
-
+            conflicting_usage = reservation.conflicting_usage
             if conflicting_usage is not None:
-                if self._is_lemons(dice_value):
-                    # The other bot will send the picture anyway, so we'll be quiet
-                    return
-
-                response = self._dementia_responder.create_response(
-                    current_message_id=message.message_id,
-                    current_message_time=time,
+                await self._send_dementia_response(
+                    message=message,
+                    user_id=user_id,
+                    time=time,
                     usage=conflicting_usage,
                 )
-                reply_message_id = response.reply_message_id or message.message_id
-                try:
-                    await self._send_message(
-                        chat=chat,
-                        reply_to_message_id=reply_message_id,
-                        text=response.text,
-                    )
-                except ReplyMessageGoneException as e:
-                    _LOG.error("Could not reply to message", exc_info=e)
+                return
 
+            dice_value = cast(Dice, message.dice).value
+            if self._is_lemons(dice_value):
+                # Lemons count as a usage, but there is no horoscope for them
                 return
 
-            horoscope_results: list[HoroscopeResult] = []
-            if not self._is_lemons(dice_value):
-                with tracer.start_as_current_span("provide_horoscope"):
-                    horoscope_results = await self.horoscope.provide_horoscope(
-                        dice=dice_value,
-                        context_id=chat.id,
+            # The horoscope is sent by one of the workers, which stores the response
+            # message with the completed job.
+            try:
+                await self._job_queue.enqueue(
+                    GenerationJob(
+                        chat_id=chat.id,
+                        chat_type=chat.type,
                         user_id=user_id,
                         message_id=message.message_id,
                         message_time=time,
+                        dice=dice_value,
                     )
-
-            response_id: str | None = None
-            if not horoscope_results:
-                _LOG.debug(
-                    "Not sending horoscope because horoscope returned None for %d",
-                    dice.value,
                 )
-            else:
-                first_result = horoscope_results[0]
-                try:
-                    response_message = await self._send_message(
-                        chat=chat,
-                        text=first_result.formatted_message,
-                        image=first_result.image,
-                        use_html_parsing=first_result.should_use_html_parsing,
-                        reply_to_message_id=message.message_id,
-                    )
-                except ReplyMessageGoneException as e:
-                    _LOG.error("Could not reply to message", exc_info=e)
-                    return
+            except Exception:
+                await self._send_failure_reply(chat, message.message_id)
+                raise
+
+    async def _run_generation_worker(self, telegram_bot: TelegramBot) -> None:
+        poll_interval = timedelta(seconds=self._job_queue_config.poll_interval_seconds)
+        while not self._should_terminate:
+            try:
+                has_processed = await self._process_next_job(telegram_bot)
+            except Exception as e:
+                _LOG.error("Generation worker failed", exc_info=e)
+                has_processed = False
+
+            if not has_processed:
+                await self._job_queue.wait(poll_interval)
+
+    async def _process_next_job(self, telegram_bot: TelegramBot) -> bool:
+        """Claims the next due job and generates and sends its horoscope.
+
+        Returns `False` if there was no job to process.
+        """
+        config = self._job_queue_config
+        claimed = await self._job_queue.claim(
+            lease=timedelta(seconds=config.lease_seconds),
+        )
+        if claimed is None:
+            return False
+
+        if claimed.attempt > config.max_attempts:
+            # The job has been abandoned too often, e.g. by crashing workers
+            _LOG.error(
+                "Dropping job %d after %d attempts",
+                claimed.id,
+                config.max_attempts,
+            )
+            await self._give_up(telegram_bot, claimed)
+            return True
+
+        with tracer.start_as_current_span("process_job") as span:
+            span.set_attribute("horoscope.job.id", claimed.id)
+            span.set_attribute("horoscope.job.attempt", claimed.attempt)
+            span.set_attribute("telegram.chat_id", claimed.job.chat_id)
+            span.set_attribute("telegram.message_id", claimed.job.message_id)
+            try:
+                await self._process_job(telegram_bot, claimed)
+            except asyncio.CancelledError:
+                # Another worker can pick it up right away instead of after the lease
+                await self._job_queue.retry(claimed, delay=timedelta())
+                raise
+            except Exception as e:
+                is_retried = claimed.attempt < config.max_attempts and (
+                    self._is_retryable(e)
+                )
+                _job_failures.add(1, {"retried": is_retried})
+                if not is_retried:
+                    _LOG.error("Giving up on job %d", claimed.id, exc_info=e)
+                    await self._give_up(telegram_bot, claimed)
+                    return True
+
+                delay = backoff_delay(claimed.attempt, config)
+                _LOG.warning(
+                    "Job %d failed, retrying in %s",
+                    claimed.id,
+                    delay,
+                    exc_info=e,
+                )
+                await self._job_queue.retry(claimed, delay=delay)
+                return True
 
-                for result in horoscope_results[1:]:
-                    await asyncio.sleep(2)
-                    response_message = await self._send_message(
-                        chat=chat,
-                        text=result.formatted_message,
-                        image=result.image,
-                        use_html_parsing=result.should_use_html_parsing,
-                        reply_to_message_id=None,
-                    )
+        await self._job_queue.complete(claimed)
+        return True
 
-                response_message_id = response_message.message_id
-                response_id = str(response_message_id)
+    async def _give_up(self, telegram_bot: TelegramBot, claimed: ClaimedJob) -> None:
+        """Completes a failed job and tells the user if nothing was sent."""
+        progress = claimed.progress
+        if progress is None or not progress.sent_results:
+            job = claimed.job
+            chat = Chat(id=job.chat_id, type=job.chat_type)
+            chat.set_bot(telegram_bot)
+            await self._send_failure_reply(chat, job.message_id)
 
-            await self._rate_limiter.add_usage(
-                context_id=chat.id,
-                user_id=user_id,
+        await self._job_queue.complete(claimed)
+
+    async def _send_failure_reply(self, chat: Chat, message_id: int) -> None:
+        """Tells the user that there is no horoscope for their counted roll.
+
+        The rate limiter can't remove a recorded usage, so the user would otherwise
+        lose their roll without any reply.
+        """
+        try:
+            await self._send_message(
+                chat=chat,
+                text=_FAILURE_TEXT,
+                reply_to_message_id=message_id,
+            )
+        except Exception as e:
+            _LOG.error("Could not send failure reply", exc_info=e)
+
+    def _is_retryable(self, e: Exception) -> bool:
+        if isinstance(
+            e,
+            BadRequest | ChatMigrated | Forbidden | ReplyMessageGoneException,
+        ):
+            # Telegram won't accept the message on the next attempt either
+            return False
+
+        return self.horoscope.is_retryable(e)
+
+    async def _process_job(
+        self,
+        telegram_bot: TelegramBot,
+        claimed: ClaimedJob,
+    ) -> None:
+        job = claimed.job
+        time = job.message_time.astimezone(self._timezone)
+        _job_delay.record((datetime.now(self._timezone) - time).total_seconds())
+
+        chat = Chat(id=job.chat_id, type=job.chat_type)
+        chat.set_bot(telegram_bot)
+
+        _generations_in_flight.add(1)
+        self._jobs_in_flight += 1
+        try:
+            await self._provide_and_send_horoscope(
+                chat=chat,
+                claimed=claimed,
                 time=time,
-                reference_id=str(message.message_id),
-                response_id=response_id,
             )
+        finally:
+            _generations_in_flight.add(-1)
+            self._jobs_in_flight -= 1
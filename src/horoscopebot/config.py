@@ -15,6 +15,10 @@ class DatabaseConfig:
     db_name: str
     db_user: str
     db_password: str
+    min_connections: int
+    max_connections: int
+    connect_timeout_seconds: int
+    statement_timeout_millis: int
 
     @classmethod
     def from_env(cls, env: Env) -> Self | None:
@@ -24,29 +28,173 @@ class DatabaseConfig:
                 db_name=env.get_string("NAME", required=True),
                 db_user=env.get_string("USER", required=True),
                 db_password=env.get_string("PASSWORD", required=True),
+                min_connections=env.get_int("MIN_CONNECTIONS", default=2),
+                max_connections=env.get_int("MAX_CONNECTIONS", default=8),
+                connect_timeout_seconds=env.get_int(
+                    "CONNECT_TIMEOUT_SECONDS",
+                    default=5,
+                ),
+                statement_timeout_millis=env.get_int(
+                    "STATEMENT_TIMEOUT_MILLIS",
+                    default=5000,
+                ),
             )
         except ValueError as e:
             _LOG.warning("Could not load database config: %s", e)
             return None
 
 
+@dataclass
+class PoolConfig:
+    size: int
+    refill_delay_seconds: int
+    refill_hours: list[int]
+
+    @classmethod
+    def from_env(cls, env: Env) -> Self:
+        return cls(
+            size=env.get_int("SIZE", default=0),
+            refill_delay_seconds=env.get_int("REFILL_DELAY_SECONDS", default=30),
+            refill_hours=env.get_int_list("REFILL_HOURS", default=[]),
+        )
+
+
+@dataclass
+class CircuitBreakerConfig:
+    failure_threshold: int
+    reset_seconds: int
+
+    @classmethod
+    def from_env(cls, env: Env) -> Self:
+        return cls(
+            failure_threshold=env.get_int("FAILURE_THRESHOLD", default=5),
+            reset_seconds=env.get_int("RESET_SECONDS", default=30),
+        )
+
+
+@dataclass
+class TimeoutConfig:
+    completion_max_seconds: int
+    completion_min_seconds: int
+    image_max_seconds: int
+    image_min_seconds: int
+    image_prompt_max_seconds: int
+    image_prompt_min_seconds: int
+
+    @classmethod
+    def from_env(cls, env: Env) -> Self:
+        # The timeouts adapt to the observed latencies within these bounds. The
+        # maximums must stay below the job lease, see Config.
+        return cls(
+            completion_max_seconds=env.get_int("COMPLETION_MAX_SECONDS", default=120),
+            completion_min_seconds=env.get_int("COMPLETION_MIN_SECONDS", default=5),
+            image_max_seconds=env.get_int("IMAGE_MAX_SECONDS", default=180),
+            image_min_seconds=env.get_int("IMAGE_MIN_SECONDS", default=10),
+            image_prompt_max_seconds=env.get_int(
+                "IMAGE_PROMPT_MAX_SECONDS",
+                default=120,
+            ),
+            image_prompt_min_seconds=env.get_int(
+                "IMAGE_PROMPT_MIN_SECONDS",
+                default=5,
+            ),
+        )
+
+
+@dataclass
+class HttpClientConfig:
+    connect_timeout_seconds: int
+    http2: bool
+    keepalive_expiry_seconds: int
+    max_connections: int
+    max_keepalive_connections: int
+    read_timeout_seconds: int
+
+    @classmethod
+    def from_env(cls, env: Env) -> Self:
+        return cls(
+            connect_timeout_seconds=env.get_int("CONNECT_TIMEOUT_SECONDS", default=5),
+            http2=env.get_bool("HTTP2", default=False),
+            keepalive_expiry_seconds=env.get_int(
+                "KEEPALIVE_EXPIRY_SECONDS",
+                default=120,
+            ),
+            max_connections=env.get_int("MAX_CONNECTIONS", default=64),
+            max_keepalive_connections=env.get_int(
+                "MAX_KEEPALIVE_CONNECTIONS",
+                default=32,
+            ),
+            read_timeout_seconds=env.get_int("READ_TIMEOUT_SECONDS", default=120),
+        )
+
+
+@dataclass
+class ResultCacheConfig:
+    image_reuse_probability: float
+    max_bytes: int
+    text_reuse_probability: float
+
+    @staticmethod
+    def _validate_probability(value: str) -> float:
+        probability = float(value)
+        if not 0 <= probability <= 1:
+            raise ValueError(f"Invalid probability: {value}")
+        return probability
+
+    @classmethod
+    def from_env(cls, env: Env) -> Self:
+        return cls(
+            image_reuse_probability=cls._validate_probability(
+                env.get_string("IMAGE_REUSE_PROBABILITY", default="0"),
+            ),
+            # The cache is disabled if this is 0
+            max_bytes=env.get_int("MAX_BYTES", default=0),
+            text_reuse_probability=cls._validate_probability(
+                env.get_string("TEXT_REUSE_PROBABILITY", default="0"),
+            ),
+        )
+
+
 class HoroscopeMode(Enum):
     OpenAiWeekly = "openai_weekly"
 
 
+type OpenAiImageFormat = Literal["png", "jpeg", "webp"]
 type OpenAiImageQuality = Literal["low", "medium", "high"]
 type OpenAiModerationLevel = Literal["auto", "low"]
 
 
 @dataclass
 class OpenAiConfig:
+    breaker: CircuitBreakerConfig
+    cache: ResultCacheConfig
+    deadline_seconds: int
     debug_mode: bool
+    http: HttpClientConfig
+    image_compression: int | None
+    image_format: OpenAiImageFormat
     image_model_name: str
     image_moderation_level: OpenAiModerationLevel
     image_quality: OpenAiImageQuality
     model_name: str
+    pipeline_images: bool
+    pool: PoolConfig
+    structured_output: bool
+    timeouts: TimeoutConfig
     token: str
 
+    @staticmethod
+    def _validate_image_format(value: str) -> OpenAiImageFormat:
+        if value not in ["png", "jpeg", "webp"]:
+            raise ValueError(f"Invalid image format: {value}")
+        return cast(OpenAiImageFormat, value)
+
+    @staticmethod
+    def _validate_image_compression(value: int | None) -> int | None:
+        if value is not None and not 0 <= value <= 100:
+            raise ValueError(f"Invalid image compression: {value}")
+        return value
+
     @staticmethod
     def _validate_image_quality(value: str) -> OpenAiImageQuality:
         if value not in ["low", "medium", "high"]:
@@ -62,8 +210,18 @@ class OpenAiConfig:
     @classmethod
     def from_env(cls, env: Env) -> Self:
         return cls(
+            breaker=CircuitBreakerConfig.from_env(env.scoped("BREAKER_")),
+            cache=ResultCacheConfig.from_env(env.scoped("CACHE_")),
+            deadline_seconds=env.get_int("DEADLINE_SECONDS", default=90),
             debug_mode=env.get_bool("DEBUG", default=False),
+            http=HttpClientConfig.from_env(env.scoped("HTTP_")),
             token=env.get_string("TOKEN", required=True),
+            image_compression=cls._validate_image_compression(
+                env.get_int("IMAGE_COMPRESSION"),
+            ),
+            image_format=cls._validate_image_format(
+                env.get_string("IMAGE_FORMAT", default="png"),
+            ),
             image_model_name=env.get_string("IMAGE_MODEL", required=True),
             image_moderation_level=cls._validate_image_moderation_level(
                 env.get_string("IMAGE_MODERATION_LEVEL", default="low"),
@@ -72,6 +230,10 @@ class OpenAiConfig:
                 env.get_string("IMAGE_QUALITY", default="medium"),
             ),
             model_name=env.get_string("MODEL", required=True),
+            pipeline_images=env.get_bool("PIPELINE_IMAGES", default=False),
+            pool=PoolConfig.from_env(env.scoped("POOL_")),
+            structured_output=env.get_bool("STRUCTURED_OUTPUT", default=False),
+            timeouts=TimeoutConfig.from_env(env.scoped("TIMEOUT_")),
         )
 
 
@@ -79,6 +241,7 @@ class OpenAiConfig:
 class HoroscopeConfig:
     mode: HoroscopeMode
     openai: OpenAiConfig | None
+    store_path: str | None
 
     @classmethod
     def from_env(cls, env: Env) -> Self:
@@ -92,6 +255,7 @@ class HoroscopeConfig:
         return cls(
             mode=mode,
             openai=openai,
+            store_path=env.get_string("RESULT_STORE_PATH"),
         )
 
 
@@ -100,6 +264,10 @@ class RateLimitConfig:
     rate_limiter_type: str
     db_config: DatabaseConfig | None
     admin_pass: bool
+    cache_size: int
+    cache_ttl_seconds: int
+    housekeeping_interval_seconds: int
+    housekeeping_jitter_seconds: int
 
     @classmethod
     def from_env(cls, env: Env) -> Self:
@@ -110,23 +278,101 @@ class RateLimitConfig:
             ),
             db_config=DatabaseConfig.from_env(env.scoped("DB_")),
             admin_pass=env.get_bool("RATE_LIMIT_ADMIN_PASS", default=True),
+            cache_size=env.get_int("RATE_LIMIT_CACHE_SIZE", default=1024),
+            cache_ttl_seconds=env.get_int("RATE_LIMIT_CACHE_TTL_SECONDS", default=3600),
+            housekeeping_interval_seconds=env.get_int(
+                "RATE_LIMIT_HOUSEKEEPING_INTERVAL_SECONDS",
+                default=6 * 60 * 60,
+            ),
+            housekeeping_jitter_seconds=env.get_int(
+                "RATE_LIMIT_HOUSEKEEPING_JITTER_SECONDS",
+                default=10 * 60,
+            ),
+        )
+
+
+@dataclass
+class SendRateConfig:
+    burst: int
+    global_per_second: int
+    group_per_minute: int
+    private_per_second: int
+
+    @classmethod
+    def from_env(cls, env: Env) -> Self:
+        # The defaults are the limits documented in the Bot API FAQ
+        return cls(
+            burst=env.get_int("BURST", default=3),
+            global_per_second=env.get_int("GLOBAL_PER_SECOND", default=30),
+            group_per_minute=env.get_int("GROUP_PER_MINUTE", default=20),
+            private_per_second=env.get_int("PRIVATE_PER_SECOND", default=1),
+        )
+
+
+@dataclass
+class JobQueueConfig:
+    lease_seconds: int
+    max_attempts: int
+    poll_interval_seconds: int
+    retry_base_seconds: int
+    retry_max_seconds: int
+
+    @classmethod
+    def from_env(cls, env: Env) -> Self:
+        return cls(
+            # Must be longer than generating and sending a horoscope takes, or the
+            # job will be handed to a second worker
+            lease_seconds=env.get_int("LEASE_SECONDS", default=300),
+            max_attempts=env.get_int("MAX_ATTEMPTS", default=5),
+            poll_interval_seconds=env.get_int("POLL_INTERVAL_SECONDS", default=2),
+            retry_base_seconds=env.get_int("RETRY_BASE_SECONDS", default=5),
+            retry_max_seconds=env.get_int("RETRY_MAX_SECONDS", default=300),
         )
 
 
 @dataclass
 class TelegramConfig:
+    drain_timeout_seconds: int
     enabled_chats: list[int]
+    max_concurrent_generations: int
+    max_concurrent_updates: int
+    partition_count: int
+    partition_index: int
+    send_rate: SendRateConfig
     token: str
 
     @classmethod
     def from_env(cls, env: Env) -> Self:
         token = env.get_string("TELEGRAM_TOKEN", required=True)
+        # Each replica only answers the chats in its own partition
+        partition_count = env.get_int("TELEGRAM_PARTITION_COUNT", default=1)
+        partition_index = env.get_int("TELEGRAM_PARTITION_INDEX", default=0)
+        if partition_count < 1 or not 0 <= partition_index < partition_count:
+            raise ValueError(
+                f"Invalid partition {partition_index} of {partition_count}"
+            )
 
         return cls(
+            # Should be shorter than the termination grace period of the pod
+            drain_timeout_seconds=env.get_int(
+                "TELEGRAM_DRAIN_TIMEOUT_SECONDS",
+                default=100,
+            ),
             enabled_chats=env.get_int_list(
                 "TELEGRAM_ENABLED_CHATS",
                 default=[133399998],
             ),
+            max_concurrent_generations=env.get_int(
+                "TELEGRAM_MAX_CONCURRENT_GENERATIONS",
+                default=8,
+            ),
+            max_concurrent_updates=env.get_int(
+                "TELEGRAM_MAX_CONCURRENT_UPDATES",
+                default=256,
+            ),
+            partition_count=partition_count,
+            partition_index=partition_index,
+            send_rate=SendRateConfig.from_env(env.scoped("TELEGRAM_SEND_")),
             token=token,
         )
 
@@ -137,14 +383,35 @@ class Config:
     enable_telemetry: bool
     timezone_name: str
     horoscope: HoroscopeConfig
+    jobs: JobQueueConfig
     nats: NatsConfig
     rate_limit: RateLimitConfig
     sentry_dsn: str | None
     telegram: TelegramConfig
+    trace_sample_ratio: float
+
+    def _validate_lease(self) -> None:
+        openai = self.horoscope.openai
+        if openai is None:
+            return
+
+        timeouts = openai.timeouts
+        # A call that outlives the lease lets a second worker claim the same job
+        longest = max(
+            openai.deadline_seconds,
+            timeouts.completion_max_seconds,
+            timeouts.image_max_seconds,
+            timeouts.image_prompt_max_seconds,
+        )
+        if longest >= self.jobs.lease_seconds:
+            raise ValueError(
+                f"OpenAI timeouts of up to {longest}s exceed the job lease of"
+                f" {self.jobs.lease_seconds}s"
+            )
 
     @classmethod
     def from_env(cls, env: Env) -> Self:
-        return cls(
+        config = cls(
             app_version=env.get_string(
                 "APP_VERSION",
                 default="debug",
@@ -158,8 +425,14 @@ class Config:
                 default="Europe/Berlin",
             ),
             horoscope=HoroscopeConfig.from_env(env),
+            jobs=JobQueueConfig.from_env(env.scoped("JOBS_")),
             nats=NatsConfig.from_env(env.scoped("NATS_")),
             rate_limit=RateLimitConfig.from_env(env),
             sentry_dsn=env.get_string("SENTRY_DSN"),
             telegram=TelegramConfig.from_env(env),
+            trace_sample_ratio=float(
+                env.get_string("TRACE_SAMPLE_RATIO", default="1.0"),
+            ),
         )
+        config._validate_lease()
+        return config
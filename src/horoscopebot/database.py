@@ -0,0 +1,58 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any
+
+from psycopg import AsyncConnection
+from psycopg_pool import AsyncConnectionPool
+
+from horoscopebot.config import DatabaseConfig
+
+
+def connection_kwargs(config: DatabaseConfig) -> dict[str, Any]:
+    """Returns the psycopg connection arguments, including the timeouts."""
+    return dict(
+        host=config.db_host,
+        dbname=config.db_name,
+        user=config.db_user,
+        password=config.db_password,
+        connect_timeout=config.connect_timeout_seconds,
+        options=f"-c statement_timeout={config.statement_timeout_millis}",
+    )
+
+
+@asynccontextmanager
+async def without_statement_timeout(
+    connection: AsyncConnection[Any],
+) -> AsyncIterator[None]:
+    """Runs the context in a transaction without statement timeout.
+
+    Meant for maintenance statements like bulk deletes, which may take much longer
+    than the queries made while handling an update.
+    """
+    async with connection.transaction():
+        await connection.execute("SET LOCAL statement_timeout = 0")
+        yield
+
+
+async def open_pool(
+    config: DatabaseConfig,
+    *,
+    schema: str,
+    max_size: int,
+) -> AsyncConnectionPool:
+    """Opens an autocommit pool and creates the bot's own tables using `schema`.
+
+    These tables aren't part of the rate limiter schema, so they aren't migrated by
+    the init container.
+    """
+    pool = AsyncConnectionPool(
+        conninfo="",
+        kwargs=dict(**connection_kwargs(config), autocommit=True),
+        min_size=min(config.min_connections, max_size),
+        max_size=max_size,
+        open=False,
+    )
+    await pool.open()
+    async with pool.connection() as connection:
+        await connection.execute(schema)
+    return pool
@@ -1,5 +1,6 @@
 import abc
-from dataclasses import dataclass
+from collections.abc import Awaitable
+from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum, auto
 
@@ -8,6 +9,17 @@ from enum import Enum, auto
 class HoroscopeResult:
     message: str
     image: bytes | None = None
+    # Set instead of image if the image is still being generated in the background
+    pending_image: Awaitable[bytes | None] | None = field(default=None, repr=False)
+    # Telegram file ID of the image once it has been uploaded
+    image_file_id: str | None = None
+    # ID in the ResultStore, if the result was loaded from there
+    store_id: int | None = None
+    # Entry ID of the image in the image cache, if it was cached
+    image_cache_id: int | None = None
+    # Set if the image was left out when the result was persisted, so it has to be
+    # restored before sending
+    image_dropped: bool = False
 
     @property
     def should_use_html_parsing(self) -> bool:
@@ -33,6 +45,27 @@ class Horoscope(abc.ABC):
     ) -> list[HoroscopeResult]:
         pass
 
+    async def on_result_sent(self, result: HoroscopeResult) -> None:
+        # Called once the result has been sent completely. The image_file_id is
+        # set if the image was uploaded.
+        pass
+
+    async def restore_image(self, result: HoroscopeResult) -> None:
+        # Called before sending a result whose image was dropped. Should set the
+        # image and reset image_dropped, otherwise the text is sent on its own.
+        result.image_dropped = False
+
+    def is_retryable(self, e: Exception) -> bool:
+        # Whether a failed generation may succeed if it's attempted again
+        return True
+
+    async def start(self) -> None:
+        # Called once the bot is running, may start background work
+        pass
+
+    async def close(self) -> None:
+        pass
+
 
 class Slot(Enum):
     BAR = auto()
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+from collections import deque
+from collections.abc import Awaitable, Callable, Iterable, Mapping
+from datetime import datetime, timedelta, tzinfo
+from pathlib import Path
+from typing import cast
+
+from .horoscope import HoroscopeResult
+from .store import ResultStore, StoredResult
+
+_LOG = logging.getLogger(__name__)
+
+type Generator = Callable[[int], Awaitable[HoroscopeResult]]
+
+
+_KEY_PREFIX = "pool:"
+
+
+def store_key(dice: int, prompt_hash: str) -> str:
+    """The ResultStore key of pooled horoscopes for the dice value.
+
+    Contains the hash of the prompt, so results generated from an older prompt
+    aren't served anymore once it changes.
+    """
+    return f"{_KEY_PREFIX}{dice}:{prompt_hash}"
+
+
+def import_dir(store_path: Path) -> Path:
+    """The directory from which the pool imports segments written by other processes.
+
+    Segments must only be moved there (with a `.seg` suffix) once they are complete.
+    """
+    return store_path.with_name(f"{store_path.name}.import")
+
+
+class HoroscopePool:
+    """Keeps a number of ready-made horoscopes per dice value.
+
+    The pool is refilled in the background by `run`, optionally restricted to a set
+    of (quiet) hours. Consumers call `take` and fall back to live generation if the
+    bucket for their dice value is empty.
+
+    If there is a store, `run` also imports the segments in its `import_dir`, so
+    results can be pre-generated while the bot is running. Stored results are only
+    used if they match the current prompt hash of their dice value.
+    """
+
+    def __init__(
+        self,
+        *,
+        generate: Generator,
+        prompt_hashes: Mapping[int, str],
+        size: int,
+        refill_hours: Iterable[int],
+        refill_delay: timedelta,
+        timezone: tzinfo,
+        store: ResultStore | None = None,
+    ):
+        if size < 1:
+            raise ValueError(f"Pool size must be positive, but was {size}")
+
+        self._generate = generate
+        self._size = size
+        self._refill_hours = frozenset(refill_hours)
+        self._refill_delay = refill_delay
+        self._timezone = timezone
+        self._store = store
+        self._import_dir = None if store is None else import_dir(store.path)
+        self._buckets: dict[int, deque[HoroscopeResult | StoredResult]] = {
+            dice: deque() for dice in prompt_hashes
+        }
+        self._keys = {
+            dice: store_key(dice, prompt_hash)
+            for dice, prompt_hash in prompt_hashes.items()
+        }
+        self._dice_by_key = {key: dice for dice, key in self._keys.items()}
+
+        if store is not None:
+            self._restore(store)
+            _LOG.info(
+                "Restored %d pooled horoscopes from store",
+                sum(len(bucket) for bucket in self._buckets.values()),
+            )
+
+    def _restore(self, store: ResultStore) -> None:
+        for entry in store.entries():
+            dice = self._dice_by_key.get(entry.key)
+            if dice is not None:
+                self._buckets[dice].append(entry)
+            elif entry.key.startswith(_KEY_PREFIX):
+                _LOG.info("Dropping stale pooled horoscope with key %s", entry.key)
+                store.delete(entry)
+
+    def take(self, dice: int) -> HoroscopeResult | None:
+        """Returns a pooled horoscope for the dice value, if there is one.
+
+        Stored results stay in the store until they have been sent, so they are
+        restored on the next start if the bot stops before sending them. The caller
+        must delete them once sent.
+        """
+        bucket = self._buckets.get(dice)
+        while bucket:
+            entry = bucket.popleft()
+            if isinstance(entry, HoroscopeResult):
+                _LOG.info("Serving horoscope for %d from pool", dice)
+                return entry
+
+            store = cast(ResultStore, self._store)
+            # Deleted if it was already sent by a job restored after a restart
+            if store.get(entry.id) is not None:
+                _LOG.info("Serving horoscope for %d from pool", dice)
+                return store.load(entry)
+
+        _LOG.info("Pool bucket for %d is empty", dice)
+        return None
+
+    def put(self, dice: int, entry: HoroscopeResult | StoredResult) -> None:
+        self._buckets[dice].append(entry)
+
+    def _import_segments(self) -> list[tuple[int, StoredResult]]:
+        if self._store is None or self._import_dir is None:
+            return []
+
+        imported: list[tuple[int, StoredResult]] = []
+        for path in sorted(self._import_dir.glob("*.seg")):
+            segment = ResultStore(path)
+            try:
+                for entry in segment.entries():
+                    dice = self._dice_by_key.get(entry.key)
+                    if dice is None:
+                        _LOG.warning("Not importing result with key %s", entry.key)
+                    else:
+                        stored = self._store.append(entry.key, segment.load(entry))
+                        imported.append((dice, stored))
+                    # Deleted right away, so nothing is imported twice after a crash
+                    segment.delete(entry)
+            finally:
+                segment.close()
+
+            path.unlink()
+            _LOG.info("Imported segment %s", path)
+
+        return imported
+
+    async def import_once(self) -> int:
+        """Imports the results of all complete segments in the import directory.
+
+        Returns the number of imported results.
+        """
+        imported = await asyncio.to_thread(self._import_segments)
+        for dice, stored in imported:
+            self.put(dice, stored)
+
+        return len(imported)
+
+    def _is_refill_time(self) -> bool:
+        if not self._refill_hours:
+            return True
+
+        return datetime.now(self._timezone).hour in self._refill_hours
+
+    def _emptiest_bucket(self) -> int | None:
+        dice, bucket = min(self._buckets.items(), key=lambda item: len(item[1]))
+        if len(bucket) >= self._size:
+            return None
+
+        return dice
+
+    async def refill_once(self) -> bool:
+        """Generates a single horoscope for the emptiest bucket.
+
+        Returns `False` if there was nothing to do.
+        """
+        dice = self._emptiest_bucket()
+        if dice is None:
+            return False
+
+        _LOG.debug("Pre-generating horoscope for %d", dice)
+        result = await self._generate(dice)
+        if self._store is None:
+            self.put(dice, result)
+        else:
+            stored = await asyncio.to_thread(
+                self._store.append,
+                self._keys[dice],
+                result,
+            )
+            self.put(dice, stored)
+
+        return True
+
+    async def run(self) -> None:
+        _LOG.info("Starting horoscope pool refill loop")
+        while True:
+            try:
+                if imported := await self.import_once():
+                    _LOG.info("Imported %d pooled horoscopes", imported)
+            except Exception as e:
+                _LOG.error("Could not import pooled horoscopes", exc_info=e)
+
+            if not self._is_refill_time():
+                await asyncio.sleep(60)
+                continue
+
+            try:
+                did_refill = await self.refill_once()
+            except Exception as e:
+                _LOG.error("Could not pre-generate horoscope", exc_info=e)
+                did_refill = True
+
+            if did_refill:
+                await asyncio.sleep(self._refill_delay.total_seconds())
+            else:
+                await asyncio.sleep(60)
@@ -0,0 +1,161 @@
+import logging
+import statistics
+import time
+from collections import deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from enum import Enum, auto
+
+_LOG = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class _State(Enum):
+    CLOSED = auto()
+    OPEN = auto()
+    HALF_OPEN = auto()
+
+
+class CircuitBreaker:
+    """Stops calling a degraded dependency instead of waiting for it to time out.
+
+    After `failure_threshold` consecutive failures, the breaker opens and all calls
+    fail fast for `reset_timeout` seconds. After that, a single probe call is let
+    through. If it succeeds, the breaker closes again, otherwise it stays open for
+    another `reset_timeout`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_threshold: int,
+        reset_timeout: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = _State.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return self._state != _State.CLOSED
+
+    def _before_call(self) -> None:
+        match self._state:
+            case _State.CLOSED:
+                return
+            case _State.OPEN:
+                if self._clock() - self._opened_at < self._reset_timeout:
+                    raise CircuitOpenError(f"Circuit {self._name} is open")
+                _LOG.info("Circuit %s is half-open, probing", self._name)
+                self._state = _State.HALF_OPEN
+            case _State.HALF_OPEN:
+                # Only the probe may pass
+                raise CircuitOpenError(f"Circuit {self._name} is half-open")
+
+    def _on_success(self) -> None:
+        if self._state != _State.CLOSED:
+            _LOG.info("Circuit %s is closed again", self._name)
+        self._state = _State.CLOSED
+        self._failures = 0
+
+    def _on_failure(self) -> None:
+        self._failures += 1
+        if self._state == _State.HALF_OPEN or self._failures >= self._failure_threshold:
+            if self._state != _State.OPEN:
+                _LOG.warning(
+                    "Opening circuit %s after %d failures",
+                    self._name,
+                    self._failures,
+                )
+            self._state = _State.OPEN
+            self._opened_at = self._clock()
+
+    def _on_inconclusive(self) -> None:
+        # A half-open probe must not block the breaker forever
+        if self._state == _State.HALF_OPEN:
+            self._state = _State.OPEN
+            self._opened_at = self._clock()
+
+    @contextmanager
+    def guard(
+        self,
+        is_failure: Callable[[Exception], bool] = lambda e: True,
+        is_inconclusive: Callable[[Exception], bool] = lambda e: False,
+    ) -> Iterator[None]:
+        """Raises CircuitOpenError instead of entering the context if the breaker is
+        open.
+
+        Exceptions raised from the context count as failures if `is_failure` says
+        so, otherwise they count as successes, because the dependency did respond.
+        Exceptions for which `is_inconclusive` is true, e.g. because the call was
+        cut short by the caller, count as neither.
+        """
+        self._before_call()
+        try:
+            yield
+        except Exception as e:
+            if is_inconclusive(e):
+                self._on_inconclusive()
+            elif is_failure(e):
+                self._on_failure()
+            else:
+                self._on_success()
+            raise
+        except BaseException:
+            # Cancellation says nothing about the dependency
+            self._on_inconclusive()
+            raise
+        else:
+            self._on_success()
+
+
+class AdaptiveTimeout:
+    """Derives a timeout from the latencies observed for recent calls.
+
+    The timeout is the given percentile of the last `window` latencies times
+    `multiplier`, clamped to `[minimum, maximum]`. Until enough samples are
+    available, `maximum` is used. Calls that timed out should be observed with their
+    timeout, so the timeout grows again if the latency does.
+    """
+
+    def __init__(
+        self,
+        *,
+        minimum: float,
+        maximum: float,
+        percentile: int = 95,
+        multiplier: float = 2.0,
+        window: int = 100,
+        min_samples: int = 10,
+    ):
+        self._minimum = minimum
+        self._maximum = maximum
+        self._percentile = percentile
+        self._multiplier = multiplier
+        self._min_samples = min_samples
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._timeout = maximum
+
+    @property
+    def timeout(self) -> float:
+        return self._timeout
+
+    def observe(self, latency: float) -> None:
+        self._latencies.append(latency)
+        if len(self._latencies) < self._min_samples:
+            return
+
+        quantile = statistics.quantiles(self._latencies, n=100)[self._percentile - 1]
+        self._timeout = min(
+            self._maximum,
+            max(self._minimum, quantile * self._multiplier),
+        )
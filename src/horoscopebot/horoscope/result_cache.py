@@ -0,0 +1,122 @@
+import logging
+import random
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+_LOG = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CacheKey:
+    prompt_hash: str
+    model: str
+    # ISO week, like 2025-W07. Results are only reused within the same week.
+    week: str
+
+    @staticmethod
+    def week_of(time: datetime) -> str:
+        year, week, _ = time.isocalendar()
+        return f"{year}-W{week:02d}"
+
+
+@dataclass(frozen=True)
+class CachedValue[T: (str, bytes)]:
+    id: int
+    value: T
+    # Telegram file ID of the image once it has been uploaded
+    file_id: str | None
+
+
+def _size_of(value: str | bytes) -> int:
+    return len(value.encode() if isinstance(value, str) else value)
+
+
+class ResultCache[T: (str, bytes)]:
+    """Keeps generated texts or images for reuse by later horoscopes.
+
+    Several values may be cached per key. A lookup only reuses one of them with
+    `reuse_probability`, so operators can trade novelty against cost and latency.
+    Values are evicted oldest first once their total size exceeds `max_bytes`,
+    because a few images take up more memory than thousands of texts. Values from
+    previous weeks are dropped as soon as a value for a new week is added.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_bytes: int,
+        reuse_probability: float,
+        rng: random.Random | None = None,
+    ):
+        self._max_bytes = max_bytes
+        self._reuse_probability = reuse_probability
+        self._rng = rng or random.Random()
+        self._entries: OrderedDict[int, tuple[CacheKey, T]] = OrderedDict()
+        self._ids_by_key: dict[CacheKey, list[int]] = {}
+        self._file_ids: dict[int, str] = {}
+        self._next_id = 0
+        self._size = 0
+        self._week: str | None = None
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get(self, key: CacheKey) -> CachedValue[T] | None:
+        ids = self._ids_by_key.get(key)
+        if not ids or self._rng.random() >= self._reuse_probability:
+            return None
+
+        _LOG.debug("Reusing cached result for %s", key)
+        entry_id = self._rng.choice(ids)
+        return CachedValue(
+            id=entry_id,
+            value=self._entries[entry_id][1],
+            file_id=self._file_ids.get(entry_id),
+        )
+
+    def put(self, key: CacheKey, value: T) -> int | None:
+        """Adds the value and returns its entry ID, unless it wasn't cached."""
+        if self._week is None or key.week > self._week:
+            self._clear()
+            self._week = key.week
+        elif key.week < self._week:
+            return None
+
+        size = _size_of(value)
+        if size > self._max_bytes:
+            return None
+
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (key, value)
+        self._ids_by_key.setdefault(key, []).append(entry_id)
+        self._size += size
+
+        while self._size > self._max_bytes:
+            self._evict_oldest()
+
+        return entry_id if entry_id in self._entries else None
+
+    def set_file_id(self, entry_id: int, file_id: str) -> None:
+        """Remembers the Telegram file ID of a cached image, so it isn't uploaded
+        again when the image is reused.
+        """
+        if entry_id in self._entries:
+            self._file_ids[entry_id] = file_id
+
+    def _evict_oldest(self) -> None:
+        entry_id, (key, value) = self._entries.popitem(last=False)
+        self._file_ids.pop(entry_id, None)
+        self._size -= _size_of(value)
+        ids = self._ids_by_key[key]
+        ids.remove(entry_id)
+        if not ids:
+            del self._ids_by_key[key]
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        self._ids_by_key.clear()
+        self._file_ids.clear()
+        self._size = 0
@@ -0,0 +1,309 @@
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from enum import IntEnum
+from pathlib import Path
+from typing import BinaryIO
+
+from .horoscope import HoroscopeResult
+
+_LOG = logging.getLogger(__name__)
+
+# Segments of older versions don't match and are discarded as an incomplete tail
+_MAGIC = b"HRS2"
+
+# magic, kind, key length, text length, image length, record ID, timestamp.
+# Results carry their own ID, tombstones the ID of the result they delete.
+_HEADER = struct.Struct("<4sBHIIQd")
+
+
+class _RecordKind(IntEnum):
+    RESULT = 1
+    TOMBSTONE = 2
+
+
+@dataclass(frozen=True)
+class StoredResult:
+    id: int
+    # Of the record in the segment, changes when the segment is compacted
+    offset: int
+    key: str
+    created_at: datetime
+    text_offset: int
+    text_length: int
+    image_offset: int
+    image_length: int
+
+
+class ResultStore:
+    """Append-only store for generated horoscopes.
+
+    All records live in a single segment file which is memory-mapped for reading,
+    so images can be handed out as zero-copy views instead of living on the heap.
+    The index is kept in memory and rebuilt from the record headers on open.
+    Deleting a result appends a tombstone. Once deleted results and tombstones make
+    up most of the segment, it is compacted the next time the store is opened. IDs
+    are kept when compacting.
+
+    Only one process may have the store open at a time, because the index isn't
+    shared.
+    """
+
+    def __init__(self, path: Path, *, compact_min_bytes: int = 64 * 1024 * 1024):
+        self._path = path
+        self._lock = threading.Lock()
+        self._index: dict[int, StoredResult] = {}
+        self._map: mmap.mmap | None = None
+        self._next_id = 1
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self._open_locked(path)
+        self._size = self._file.seek(0, 2)
+        self._load_index()
+
+        dead_bytes = self._size - self._live_bytes()
+        if dead_bytes >= compact_min_bytes and dead_bytes > self._size / 2:
+            self._compact()
+
+        _LOG.info("Opened result store at %s with %d results", path, len(self._index))
+
+    @staticmethod
+    def _open_locked(path: Path) -> BinaryIO:
+        file = path.open("a+b")
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError as e:
+            file.close()
+            raise ValueError(f"Result store at {path} is in use") from e
+        return file
+
+    @staticmethod
+    def _record_size(stored: StoredResult) -> int:
+        return stored.image_offset + stored.image_length - stored.offset
+
+    def _live_bytes(self) -> int:
+        return sum(self._record_size(stored) for stored in self._index.values())
+
+    def _compact(self) -> None:
+        """Rewrites the segment with only the live results."""
+        _LOG.info(
+            "Compacting result store at %s from %d to %d bytes",
+            self._path,
+            self._size,
+            self._live_bytes(),
+        )
+        data = self._map
+        if data is None:
+            return
+
+        compacted_path = self._path.with_name(f"{self._path.name}.compact")
+        with compacted_path.open("wb") as compacted:
+            for stored in self._index.values():
+                key_offset = stored.offset + _HEADER.size
+                compacted.write(
+                    _HEADER.pack(
+                        _MAGIC,
+                        _RecordKind.RESULT,
+                        stored.text_offset - key_offset,
+                        stored.text_length,
+                        stored.image_length,
+                        stored.id,
+                        stored.created_at.timestamp(),
+                    )
+                )
+                compacted.write(data[key_offset : stored.image_offset])
+                compacted.write(self._view(stored.image_offset, stored.image_length))
+            compacted.flush()
+            os.fsync(compacted.fileno())
+
+        # The lock is moved to the new file right after replacing the old one
+        compacted_path.replace(self._path)
+        old_file = self._file
+        self._file = self._open_locked(self._path)
+        old_file.close()
+
+        self._index.clear()
+        self._map = None
+        self._size = self._file.seek(0, 2)
+        self._load_index()
+
+    def _remap(self) -> mmap.mmap | None:
+        if self._size == 0:
+            return None
+
+        # Old maps are not closed explicitly because views into them may still be
+        # in use. They are released once the last view is gone.
+        self._map = mmap.mmap(self._file.fileno(), self._size, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _load_index(self) -> None:
+        data = self._remap()
+        if data is None:
+            return
+
+        offset = 0
+        while offset + _HEADER.size <= len(data):
+            magic, kind, key_length, text_length, image_length, ref, timestamp = (
+                _HEADER.unpack_from(data, offset)
+            )
+            end = offset + _HEADER.size + key_length + text_length + image_length
+            if magic != _MAGIC or end > len(data):
+                break
+
+            match kind:
+                case _RecordKind.RESULT:
+                    record_id = ref
+                    self._next_id = max(self._next_id, record_id + 1)
+                    key_offset = offset + _HEADER.size
+                    text_offset = key_offset + key_length
+                    self._index[record_id] = StoredResult(
+                        id=record_id,
+                        offset=offset,
+                        key=data[key_offset:text_offset].decode(),
+                        created_at=datetime.fromtimestamp(timestamp, UTC),
+                        text_offset=text_offset,
+                        text_length=text_length,
+                        image_offset=text_offset + text_length,
+                        image_length=image_length,
+                    )
+                case _RecordKind.TOMBSTONE:
+                    self._index.pop(ref, None)
+                case unknown:
+                    _LOG.warning("Skipping record of unknown kind %d", unknown)
+
+            offset = end
+
+        if offset != len(data):
+            _LOG.warning(
+                "Truncating incomplete record at the end of %s (%d bytes)",
+                self._path,
+                len(data) - offset,
+            )
+            self._map = None
+            self._file.truncate(offset)
+            self._size = offset
+
+    def _append_record(
+        self,
+        kind: _RecordKind,
+        *,
+        key: bytes = b"",
+        text: bytes = b"",
+        image: bytes = b"",
+        ref: int = 0,
+        time: datetime,
+    ) -> int:
+        header = _HEADER.pack(
+            _MAGIC,
+            kind,
+            len(key),
+            len(text),
+            len(image),
+            ref,
+            time.timestamp(),
+        )
+        offset = self._size
+        self._file.write(b"".join([header, key, text, image]))
+        self._file.flush()
+        self._size += _HEADER.size + len(key) + len(text) + len(image)
+        return offset
+
+    def append(self, key: str, result: HoroscopeResult) -> StoredResult:
+        if result.pending_image is not None:
+            raise ValueError("Can't store a result with a pending image")
+
+        encoded_key = key.encode()
+        text = result.message.encode()
+        image = result.image or b""
+        now = datetime.now(UTC)
+
+        with self._lock:
+            record_id = self._next_id
+            self._next_id += 1
+            offset = self._append_record(
+                _RecordKind.RESULT,
+                key=encoded_key,
+                text=text,
+                image=image,
+                ref=record_id,
+                time=now,
+            )
+
+        text_offset = offset + _HEADER.size + len(encoded_key)
+        stored = StoredResult(
+            id=record_id,
+            offset=offset,
+            key=key,
+            created_at=now,
+            text_offset=text_offset,
+            text_length=len(text),
+            image_offset=text_offset + len(text),
+            image_length=len(image),
+        )
+        self._index[record_id] = stored
+        return stored
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def get(self, store_id: int) -> StoredResult | None:
+        return self._index.get(store_id)
+
+    def delete(self, stored: StoredResult) -> None:
+        with self._lock:
+            if self._index.pop(stored.id, None) is None:
+                return
+
+            self._append_record(
+                _RecordKind.TOMBSTONE,
+                ref=stored.id,
+                time=datetime.now(UTC),
+            )
+
+    def entries(self, key: str | None = None) -> Iterator[StoredResult]:
+        for stored in list(self._index.values()):
+            if key is None or stored.key == key:
+                yield stored
+
+    def _view(self, offset: int, length: int) -> memoryview:
+        data = self._map
+        if data is None or len(data) < offset + length:
+            with self._lock:
+                data = self._remap()
+
+        if data is None:
+            raise ValueError("Store is empty")
+
+        return memoryview(data)[offset : offset + length]
+
+    def read_text(self, stored: StoredResult) -> str:
+        return str(self._view(stored.text_offset, stored.text_length), "utf-8")
+
+    def read_image(self, stored: StoredResult) -> memoryview | None:
+        if not stored.image_length:
+            return None
+
+        return self._view(stored.image_offset, stored.image_length)
+
+    def load(self, stored: StoredResult) -> HoroscopeResult:
+        image = self.read_image(stored)
+        # Copied, because python-telegram-bot reads anything but bytes into bytes
+        # before uploading anyway. It also keeps results from pinning old maps
+        # after a compaction, and is only done for results that are about to be
+        # sent.
+        return HoroscopeResult(
+            message=self.read_text(stored),
+            image=None if image is None else image.tobytes(),
+            store_id=stored.id,
+        )
+
+    def close(self) -> None:
+        self._map = None
+        self._file.close()
@@ -1,22 +1,70 @@
+import asyncio
 import base64
+import hashlib
+import json
 import logging
-from collections.abc import Sequence
+from collections.abc import Awaitable, Callable, Sequence
 from dataclasses import dataclass
-from datetime import datetime
-from typing import cast
+from datetime import datetime, timedelta, tzinfo
+from typing import Any, cast
 
+import httpx
 from openai import (
+    NOT_GIVEN,
+    APIConnectionError,
     AsyncOpenAI,
     BadRequestError,
+    DefaultAsyncHttpxClient,
+    InternalServerError,
     OpenAIError,
+    RateLimitError,
 )
-from openai.types.chat import ChatCompletionMessageParam
+from openai.types.chat import ChatCompletion, ChatCompletionMessageParam
+from openai.types.shared_params import ResponseFormatJSONSchema
+from opentelemetry import metrics, trace
 
-from horoscopebot.config import OpenAiConfig
+from horoscopebot.config import HttpClientConfig, OpenAiConfig
+from horoscopebot.metrics import record_duration
 
 from .horoscope import SLOT_MACHINE_VALUES, Horoscope, HoroscopeResult, Slot
+from .pool import HoroscopePool
+from .resilience import AdaptiveTimeout, CircuitBreaker, CircuitOpenError
+from .result_cache import CacheKey, ResultCache
+from .store import ResultStore
 
 _LOG = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+_completion_duration = meter.create_histogram(
+    "horoscope.openai.completion.duration",
+    unit="s",
+    description="Duration of horoscope text completions",
+)
+_image_prompt_duration = meter.create_histogram(
+    "horoscope.openai.image_prompt.duration",
+    unit="s",
+    description="Duration of image prompt improvement completions",
+)
+_image_duration = meter.create_histogram(
+    "horoscope.openai.image.duration",
+    unit="s",
+    description="Duration of image generations",
+)
+_tokens_used = meter.create_counter(
+    "horoscope.openai.tokens",
+    unit="{token}",
+    description="Tokens used by chat completions",
+)
+_cache_hits = meter.create_counter(
+    "horoscope.cache.hits",
+    unit="{result}",
+    description="Texts and images reused from the result cache",
+)
+_skipped_images = meter.create_counter(
+    "horoscope.openai.images.skipped",
+    unit="{image}",
+    description="Images skipped because OpenAI was too slow or unavailable",
+)
 
 _BASE_PROMPT = (
     "Sag mir den Verlauf meines Jahres voraus. Es ist egal, ob die"
@@ -32,6 +80,28 @@ _IMAGE_IMPROVEMENT_PROMPT = (
     "Beschreibe in wenigen Worten ein Bild, das deine Vorhersage illustriert."
 )
 
+# Lets the model write the image prompt along with the horoscope, which saves the
+# separate image prompt completion
+_STRUCTURED_RESPONSE_FORMAT: ResponseFormatJSONSchema = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "horoscope",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "horoscope": {"type": "string"},
+                "image_description": {
+                    "type": "string",
+                    "description": _IMAGE_IMPROVEMENT_PROMPT,
+                },
+            },
+            "required": ["horoscope", "image_description"],
+            "additionalProperties": False,
+        },
+    },
+}
+
 _REFINEMENT_BY_SECOND_SLOT = {
     Slot.GRAPE: "Die Ereignisse sollten im Verlauf des Jahres chaotischer werden.",
     Slot.LEMON: "In der Mitte des Jahres sollten negative Ereignisse auftauchen.",
@@ -57,6 +127,12 @@ class Variant:
         return "\n\n".join([self.base_prompt, slot_refinement, "Horoskop:"])
 
 
+@dataclass
+class _StructuredHoroscope:
+    text: str
+    image_prompt: str
+
+
 @dataclass
 class Geggo:
     messages: list[HoroscopeResult]
@@ -81,14 +157,222 @@ _VARIANT_BY_FIRST_SLOT: dict[Slot, Variant] = {
 }
 
 
+def _is_outage(e: Exception) -> bool:
+    # Anything else means OpenAI did respond, just not the way we wanted
+    return isinstance(
+        e,
+        TimeoutError | APIConnectionError | InternalServerError | RateLimitError,
+    )
+
+
+def _create_http_client(config: HttpClientConfig) -> httpx.AsyncClient:
+    # Each horoscope makes up to three sequential requests, which should all reuse a
+    # warm connection instead of doing another TLS handshake.
+    return DefaultAsyncHttpxClient(
+        http2=config.http2,
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry_seconds,
+        ),
+        timeout=_create_timeout(config),
+    )
+
+
+def _create_timeout(config: HttpClientConfig) -> httpx.Timeout:
+    return httpx.Timeout(
+        config.read_timeout_seconds,
+        connect=config.connect_timeout_seconds,
+    )
+
+
+# The bot doesn't respond to three lemons
+PREGENERATED_DICE_VALUES = [
+    dice
+    for dice, slots in SLOT_MACHINE_VALUES.items()
+    if slots != (Slot.LEMON, Slot.LEMON, Slot.LEMON)
+]
+
+
+def _parse_structured(content: str | None) -> _StructuredHoroscope | None:
+    try:
+        data = json.loads(content or "")
+        text = data["horoscope"]
+        image_prompt = data["image_description"]
+    except (ValueError, KeyError, TypeError) as e:
+        _LOG.warning("Received invalid structured output", exc_info=e)
+        return None
+
+    if not isinstance(text, str) or not isinstance(image_prompt, str) or not text:
+        _LOG.warning("Received structured output with invalid field types")
+        return None
+
+    return _StructuredHoroscope(text=text, image_prompt=image_prompt)
+
+
+# Bump this whenever the prompts change in a way that should invalidate results
+# cached or stored for the old prompts
+PROMPT_VERSION = 1
+
+
+@dataclass(frozen=True)
+class HoroscopePrompt:
+    dice: int
+    text: str
+    # Stable across processes and releases, as long as the prompt doesn't change
+    hash: str
+
+
+def _build_prompt(dice: int) -> HoroscopePrompt:
+    slots = SLOT_MACHINE_VALUES[dice]
+    variant = _VARIANT_BY_FIRST_SLOT[slots[0]]
+    text = variant.build_prompt(slots[1], slots[2])
+    digest = hashlib.sha256(f"{PROMPT_VERSION}\0{text}".encode())
+    return HoroscopePrompt(dice=dice, text=text, hash=digest.hexdigest()[:16])
+
+
+# Indexed by dice value - 1, built once at import time
+_PROMPTS: tuple[HoroscopePrompt, ...] = tuple(
+    _build_prompt(dice) for dice in sorted(SLOT_MACHINE_VALUES)
+)
+
+
+def get_prompt(dice: int) -> HoroscopePrompt:
+    if not 1 <= dice <= len(_PROMPTS):
+        raise ValueError(f"Invalid dice value: {dice}")
+    return _PROMPTS[dice - 1]
+
+
 class WeeklyOpenAiHoroscope(Horoscope):
-    def __init__(self, config: OpenAiConfig):
+    def __init__(
+        self,
+        config: OpenAiConfig,
+        timezone: tzinfo,
+        store: ResultStore | None = None,
+    ):
         self._debug_mode = config.debug_mode
         self._model_name = config.model_name
         self._image_moderation_level = config.image_moderation_level
         self._image_model_name = config.image_model_name
         self._image_quality = config.image_quality
-        self._open_ai = AsyncOpenAI(api_key=config.token)
+        self._image_format = config.image_format
+        self._image_compression = config.image_compression
+        self._pipeline_images = config.pipeline_images
+        self._structured_output = config.structured_output
+        self._token = config.token
+        self._http_config = config.http
+        self._client: AsyncOpenAI | None = None
+        self._store = store
+        self._deadline = timedelta(seconds=config.deadline_seconds)
+        self._breaker = CircuitBreaker(
+            "openai",
+            failure_threshold=config.breaker.failure_threshold,
+            reset_timeout=config.breaker.reset_seconds,
+        )
+        timeouts = config.timeouts
+        self._completion_timeout = AdaptiveTimeout(
+            minimum=timeouts.completion_min_seconds,
+            maximum=timeouts.completion_max_seconds,
+        )
+        self._image_prompt_timeout = AdaptiveTimeout(
+            minimum=timeouts.image_prompt_min_seconds,
+            maximum=timeouts.image_prompt_max_seconds,
+        )
+        self._image_timeout = AdaptiveTimeout(
+            minimum=timeouts.image_min_seconds,
+            maximum=timeouts.image_max_seconds,
+        )
+
+        self._text_cache: ResultCache[str] | None = None
+        self._image_cache: ResultCache[bytes] | None = None
+        cache_config = config.cache
+        if cache_config.max_bytes > 0:
+            self._text_cache = ResultCache(
+                # Texts are tiny, so they don't get a separate budget
+                max_bytes=cache_config.max_bytes,
+                reuse_probability=cache_config.text_reuse_probability,
+            )
+            self._image_cache = ResultCache(
+                max_bytes=cache_config.max_bytes,
+                reuse_probability=cache_config.image_reuse_probability,
+            )
+
+        self._pool: HoroscopePool | None = None
+        self._pool_task: asyncio.Task[None] | None = None
+        pool_config = config.pool
+        if pool_config.size > 0 and not self._debug_mode:
+            self._pool = HoroscopePool(
+                generate=self._generate_for_pool,
+                prompt_hashes={
+                    dice: get_prompt(dice).hash for dice in PREGENERATED_DICE_VALUES
+                },
+                size=pool_config.size,
+                refill_hours=pool_config.refill_hours,
+                refill_delay=timedelta(seconds=pool_config.refill_delay_seconds),
+                timezone=timezone,
+                store=store,
+            )
+
+    @property
+    def _open_ai(self) -> AsyncOpenAI:
+        # Creating the client and its connection pool is deferred to the first
+        # request, so it doesn't delay the start of the bot.
+        if self._client is None:
+            self._client = AsyncOpenAI(
+                api_key=self._token,
+                http_client=_create_http_client(self._http_config),
+                timeout=_create_timeout(self._http_config),
+            )
+        return self._client
+
+    async def start(self) -> None:
+        if self._pool is not None:
+            self._pool_task = asyncio.create_task(self._pool.run())
+
+    async def close(self) -> None:
+        if self._pool_task is not None:
+            self._pool_task.cancel()
+            self._pool_task = None
+
+        if self._store is not None:
+            self._store.close()
+
+        if self._client is not None:
+            # Also closes the HTTP client and its pooled connections
+            await self._client.close()
+            self._client = None
+
+    async def restore_image(self, result: HoroscopeResult) -> None:
+        store = self._store
+        stored = None
+        if store is not None and result.store_id is not None:
+            stored = store.get(result.store_id)
+
+        if store is not None and stored is not None:
+            result.image = store.load(stored).image
+        else:
+            # Only the image is generated again, the text has been paid for already
+            result.image = await self._create_image(
+                [dict(role="assistant", content=result.message)],
+                deadline=self._deadline_from_now(),
+            )
+        result.image_dropped = False
+
+    def is_retryable(self, e: Exception) -> bool:
+        # E.g. a rejected prompt will be rejected again
+        return _is_outage(e) or not isinstance(e, OpenAIError)
+
+    async def on_result_sent(self, result: HoroscopeResult) -> None:
+        store = self._store
+        if store is not None and result.store_id is not None:
+            # Pooled results are only deleted now, so an unsent one isn't lost
+            if stored := store.get(result.store_id):
+                await asyncio.to_thread(store.delete, stored)
+
+        image_cache = self._image_cache
+        file_id = result.image_file_id
+        if image_cache is not None and result.image_cache_id is not None and file_id:
+            image_cache.set_file_id(result.image_cache_id, file_id)
 
     async def provide_horoscope(
         self,
@@ -98,19 +382,27 @@ class WeeklyOpenAiHoroscope(Horoscope):
         message_id: int,
         message_time: datetime,
     ) -> list[HoroscopeResult]:
-        slots = SLOT_MACHINE_VALUES[dice]
-        return await self._create_horoscope(user_id, slots, message_time)
+        return await self._create_horoscope(user_id, dice, message_time)
+
+    async def _generate_for_pool(self, dice: int) -> HoroscopeResult:
+        prompt = get_prompt(dice)
+        result = await self._create_completion(None, prompt.text, pipeline_image=False)
+        if result.image is None:
+            # Raising lets the refill loop try again instead of pooling a bare text
+            raise ValueError("Could not generate image for pooled horoscope")
+        return result
 
     async def _create_horoscope(
         self,
         user_id: int,
-        slots: tuple[Slot, Slot, Slot],
+        dice: int,
         time: datetime,
     ) -> list[HoroscopeResult]:
         if self._debug_mode:
             return [HoroscopeResult(message="debug mode is turned on")]
 
-        geggo = await self._make_geggo(user_id, time)
+        deadline = self._deadline_from_now()
+        geggo = await self._make_geggo(user_id, time, deadline)
         if geggo and geggo.add_real_horoscope:
             result = geggo.messages
         elif geggo and not geggo.add_real_horoscope:
@@ -118,14 +410,143 @@ class WeeklyOpenAiHoroscope(Horoscope):
         else:
             result = []
 
-        variant = _VARIANT_BY_FIRST_SLOT[slots[0]]
-        prompt = variant.build_prompt(slots[1], slots[2])
-        completion = await self._create_completion(user_id, prompt)
+        prompt = get_prompt(dice)
+        trace.get_current_span().set_attribute("horoscope.prompt_hash", prompt.hash)
+
+        completion = self._pool.take(dice) if self._pool is not None else None
+        if completion is None:
+            completion = await self._create_cached_completion(
+                user_id,
+                prompt,
+                time,
+                deadline,
+            )
         result.append(completion)
 
         return result
 
-    async def _make_geggo(self, user_id: int, time: datetime) -> Geggo | None:
+    async def _create_cached_completion(
+        self,
+        user_id: int,
+        prompt: HoroscopePrompt,
+        time: datetime,
+        deadline: float,
+    ) -> HoroscopeResult:
+        text_cache = self._text_cache
+        image_cache = self._image_cache
+        if text_cache is None or image_cache is None:
+            return await self._create_completion(
+                user_id,
+                prompt.text,
+                pipeline_image=self._pipeline_images,
+                deadline=deadline,
+            )
+
+        week = CacheKey.week_of(time)
+        text_key = CacheKey(prompt.hash, self._model_name, week)
+        image_key = CacheKey(prompt.hash, self._image_model_name, week)
+
+        cached_image = image_cache.get(image_key)
+        image = None
+        if cached_image is not None:
+            _cache_hits.add(1, {"type": "image"})
+            image = cached_image.value
+
+        cached_text = text_cache.get(text_key)
+        if cached_text is None:
+            result = await self._create_completion(
+                user_id,
+                prompt.text,
+                pipeline_image=self._pipeline_images,
+                deadline=deadline,
+                cached_image=image,
+            )
+            text_cache.put(text_key, result.message)
+        else:
+            _cache_hits.add(1, {"type": "text"})
+            result = await self._illustrate(
+                [dict(role="user", content=prompt.text)],
+                cached_text.value,
+                cached_image=image,
+                pipeline_image=self._pipeline_images,
+                deadline=deadline,
+            )
+
+        if cached_image is not None:
+            result.image_cache_id = cached_image.id
+            if cached_image.file_id is not None:
+                # Telegram already has the image, so it doesn't need to be uploaded
+                result.image = None
+                result.image_file_id = cached_image.file_id
+        elif result.image is not None:
+            result.image_cache_id = image_cache.put(image_key, result.image)
+        elif result.pending_image is not None:
+            result.pending_image = asyncio.create_task(
+                self._cache_pending_image(result, result.pending_image, image_key),
+            )
+
+        return result
+
+    async def _cache_pending_image(
+        self,
+        result: HoroscopeResult,
+        pending_image: Awaitable[bytes | None],
+        key: CacheKey,
+    ) -> bytes | None:
+        image = await pending_image
+        if image is not None and self._image_cache is not None:
+            result.image_cache_id = self._image_cache.put(key, image)
+        return image
+
+    def _deadline_from_now(self) -> float:
+        return asyncio.get_running_loop().time() + self._deadline.total_seconds()
+
+    async def _call[T](
+        self,
+        call: Callable[[], Awaitable[T]],
+        timeout: AdaptiveTimeout,
+        deadline: float | None,
+    ) -> T:
+        """Calls OpenAI through the circuit breaker.
+
+        The call is cancelled after the adaptive timeout, or when the deadline (in
+        event loop time) has passed, whichever comes first. That also bounds the
+        retries done by the SDK.
+
+        Raises CircuitOpenError or TimeoutError if the call was not made or cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        seconds = timeout.timeout
+        if deadline is not None:
+            seconds = min(seconds, deadline - loop.time())
+            if seconds <= 0:
+                raise TimeoutError("Horoscope deadline exceeded")
+        limited_by_deadline = seconds < timeout.timeout
+
+        def is_inconclusive(e: Exception) -> bool:
+            # Running out of budget doesn't mean that OpenAI is degraded, but it
+            # didn't respond either
+            return limited_by_deadline and isinstance(e, TimeoutError)
+
+        with self._breaker.guard(_is_outage, is_inconclusive):
+            start = loop.time()
+            try:
+                async with asyncio.timeout(seconds):
+                    result = await call()
+            except TimeoutError:
+                if not limited_by_deadline:
+                    timeout.observe(seconds)
+                raise
+
+            timeout.observe(loop.time() - start)
+            return result
+
+    async def _make_geggo(
+        self,
+        user_id: int,
+        time: datetime,
+        deadline: float,
+    ) -> Geggo | None:
         if time.month == 1 and time.day == 1:
             prompt = (
                 "Sag mir den Verlauf meines Jahres voraus. Es ist egal, ob die"
@@ -145,6 +566,7 @@ class WeeklyOpenAiHoroscope(Horoscope):
                         max_tokens=200,
                         frequency_penalty=0,
                         presence_penalty=0,
+                        deadline=deadline,
                     )
                 ],
                 add_real_horoscope=False,
@@ -161,6 +583,7 @@ class WeeklyOpenAiHoroscope(Horoscope):
                     ),
                 ],
                 improve_prompt=False,
+                deadline=deadline,
             )
             return Geggo(
                 messages=[
@@ -177,55 +600,208 @@ class WeeklyOpenAiHoroscope(Horoscope):
 
     async def _create_completion(
         self,
-        user_id: int,
+        user_id: int | None,
         prompt: str,
         temperature: float = 1.1,
         max_tokens: int = 350,
         frequency_penalty: float = 0.35,
         presence_penalty: float = 0.75,
+        pipeline_image: bool = False,
+        deadline: float | None = None,
+        cached_image: bytes | None = None,
     ) -> HoroscopeResult:
-        _LOG.info("Requesting chat completion")
         messages: list[ChatCompletionMessageParam] = [dict(role="user", content=prompt)]
-        response = await self._open_ai.chat.completions.create(
-            model=self._model_name,
-            user=str(user_id),
-            messages=messages,
+
+        structured = None
+        if self._structured_output:
+            structured = await self._create_structured_completion(
+                user_id,
+                messages,
+                deadline,
+            )
+
+        if structured is not None:
+            return await self._illustrate(
+                messages,
+                structured.text,
+                image_prompt=structured.image_prompt,
+                cached_image=cached_image,
+                pipeline_image=pipeline_image,
+                deadline=deadline,
+            )
+
+        _LOG.info("Requesting chat completion")
+        with record_duration(_completion_duration, {"model": self._model_name}):
+            response = await self._call(
+                lambda: self._open_ai.chat.completions.create(
+                    model=self._model_name,
+                    user=NOT_GIVEN if user_id is None else str(user_id),
+                    messages=messages,
+                ),
+                self._completion_timeout,
+                deadline,
+            )
+        self._record_token_usage(response)
+        return await self._illustrate(
+            messages,
+            cast(str, response.choices[0].message.content),
+            cached_image=cached_image,
+            pipeline_image=pipeline_image,
+            deadline=deadline,
         )
-        message = response.choices[0].message
-        image = await self._create_image(
-            [
-                *messages,
-                dict(role=message.role, content=message.content),
-            ]
+
+    async def _illustrate(
+        self,
+        messages: list[ChatCompletionMessageParam],
+        text: str,
+        *,
+        image_prompt: str | None = None,
+        cached_image: bytes | None = None,
+        pipeline_image: bool = False,
+        deadline: float | None = None,
+    ) -> HoroscopeResult:
+        if cached_image is not None:
+            return HoroscopeResult(message=text, image=cached_image)
+
+        image_messages: list[ChatCompletionMessageParam]
+        if image_prompt is None:
+            image_messages = [*messages, dict(role="assistant", content=text)]
+        else:
+            image_messages = [dict(role="assistant", content=image_prompt)]
+
+        create_image = self._create_image(
+            image_messages,
+            improve_prompt=image_prompt is None,
+            deadline=deadline,
         )
-        return HoroscopeResult(
-            message=cast(str, message.content),
-            image=image,
+        if pipeline_image:
+            # The text can already be sent while the image is being generated
+            return HoroscopeResult(
+                message=text,
+                pending_image=asyncio.create_task(create_image),
+            )
+
+        return HoroscopeResult(message=text, image=await create_image)
+
+    def create_batch_body(self, dice: int) -> dict[str, Any]:
+        """Returns the chat completion request for the dice value, to be submitted
+        through the Batch API.
+        """
+        body: dict[str, Any] = {
+            "model": self._model_name,
+            "messages": [dict(role="user", content=get_prompt(dice).text)],
+        }
+        if self._structured_output:
+            body["response_format"] = _STRUCTURED_RESPONSE_FORMAT
+        return body
+
+    async def complete_batch_result(
+        self,
+        dice: int,
+        response: ChatCompletion,
+    ) -> HoroscopeResult:
+        """Turns the response to a request from `create_batch_body` into a result.
+
+        This generates the image live, because the Batch API doesn't support images.
+        """
+        self._record_token_usage(response)
+        messages: list[ChatCompletionMessageParam] = [
+            dict(role="user", content=get_prompt(dice).text),
+        ]
+        content = response.choices[0].message.content
+        if self._structured_output and (structured := _parse_structured(content)):
+            result = await self._illustrate(
+                messages,
+                structured.text,
+                image_prompt=structured.image_prompt,
+            )
+        elif not content:
+            raise ValueError("Did not receive a message")
+        else:
+            result = await self._illustrate(messages, content)
+
+        if result.image is None:
+            raise ValueError("Could not generate image for batch result")
+        return result
+
+    async def _create_structured_completion(
+        self,
+        user_id: int | None,
+        messages: list[ChatCompletionMessageParam],
+        deadline: float | None,
+    ) -> _StructuredHoroscope | None:
+        """Requests the horoscope text and the image prompt in a single completion.
+
+        Returns None if the model didn't comply, in which case the caller should fall
+        back to separate completions.
+        """
+        _LOG.info("Requesting structured chat completion")
+        try:
+            with record_duration(_completion_duration, {"model": self._model_name}):
+                response = await self._call(
+                    lambda: self._open_ai.chat.completions.create(
+                        model=self._model_name,
+                        user=NOT_GIVEN if user_id is None else str(user_id),
+                        messages=messages,
+                        response_format=_STRUCTURED_RESPONSE_FORMAT,
+                    ),
+                    self._completion_timeout,
+                    deadline,
+                )
+        except BadRequestError as e:
+            _LOG.warning("Model rejected structured output request", exc_info=e)
+            return None
+
+        self._record_token_usage(response)
+        return _parse_structured(response.choices[0].message.content)
+
+    def _record_token_usage(self, response: ChatCompletion) -> None:
+        usage = response.usage
+        if usage is None:
+            return
+
+        _tokens_used.add(
+            usage.prompt_tokens,
+            {"model": response.model, "type": "prompt"},
+        )
+        _tokens_used.add(
+            usage.completion_tokens,
+            {"model": response.model, "type": "completion"},
         )
 
     async def _improve_image_prompt(
         self,
         messages: Sequence[ChatCompletionMessageParam],
+        deadline: float | None,
     ) -> ChatCompletionMessageParam | None:
         _LOG.info("Improving image prompt")
         try:
-            response = await self._open_ai.chat.completions.create(
-                model=self._model_name,
-                messages=[
-                    *messages,
-                    dict(
-                        role="user",
-                        content=_IMAGE_IMPROVEMENT_PROMPT,
+            with record_duration(
+                _image_prompt_duration,
+                {"model": self._model_name},
+            ):
+                response = await self._call(
+                    lambda: self._open_ai.chat.completions.create(
+                        model=self._model_name,
+                        messages=[
+                            *messages,
+                            dict(
+                                role="user",
+                                content=_IMAGE_IMPROVEMENT_PROMPT,
+                            ),
+                        ],
                     ),
-                ],
-            )
+                    self._image_prompt_timeout,
+                    deadline,
+                )
+            self._record_token_usage(response)
             choices = response.choices
             _LOG.info("Finished because of %s", choices[0].finish_reason)
             message = choices[0].message
             if not message.content:
                 raise ValueError("Did not receive a message")
             return dict(role=message.role, content=message.content)
-        except OpenAIError as e:
+        except (OpenAIError, TimeoutError, CircuitOpenError) as e:
             _LOG.error("Could not improve image generation prompt", exc_info=e)
             return None
 
@@ -234,10 +810,11 @@ class WeeklyOpenAiHoroscope(Horoscope):
         messages: list[ChatCompletionMessageParam],
         *,
         improve_prompt: bool = True,
+        deadline: float | None = None,
     ) -> bytes | None:
         if improve_prompt:
             improvement_message = (
-                await self._improve_image_prompt(messages) or messages[-1]
+                await self._improve_image_prompt(messages, deadline) or messages[-1]
             )
         else:
             improvement_message = messages[-1]
@@ -253,14 +830,36 @@ class WeeklyOpenAiHoroscope(Horoscope):
 
         _LOG.info("Requesting image with prompt %s", prompt)
         try:
-            ai_response = await self._open_ai.images.generate(
-                model=self._image_model_name,
-                quality=self._image_quality,
-                moderation=self._image_moderation_level,
-                prompt=prompt,
-                size="1024x1024",
-                timeout=60,
-            )
+            with record_duration(
+                _image_duration,
+                {"model": self._image_model_name},
+            ):
+                ai_response = await self._call(
+                    lambda: self._open_ai.images.generate(
+                        model=self._image_model_name,
+                        quality=self._image_quality,
+                        moderation=self._image_moderation_level,
+                        output_format=self._image_format,
+                        output_compression=(
+                            NOT_GIVEN
+                            if self._image_compression is None
+                            or self._image_format == "png"
+                            else self._image_compression
+                        ),
+                        prompt=prompt,
+                        size="1024x1024",
+                    ),
+                    self._image_timeout,
+                    deadline,
+                )
+        except TimeoutError:
+            _LOG.warning("Skipping image because OpenAI took too long")
+            _skipped_images.add(1, {"reason": "timeout"})
+            return None
+        except CircuitOpenError:
+            _LOG.warning("Skipping image because OpenAI is unavailable")
+            _skipped_images.add(1, {"reason": "circuit_open"})
+            return None
         except BadRequestError as e:
             # Only ever saw this because of their profanity filter. Of course the error
             # code was fucking None, so I would have to check the message to make sure
@@ -280,4 +879,9 @@ class WeeklyOpenAiHoroscope(Horoscope):
         if not base64_data:
             raise ValueError("Did not receive image in response")
 
-        return base64.b64decode(base64_data)
+        return await self._decode_image(base64_data)
+
+    async def _decode_image(self, base64_data: str) -> bytes:
+        # Keeps multi-megabyte payloads off the event loop. A process pool doesn't
+        # pay off, since pickling the result costs more than decoding it.
+        return await asyncio.to_thread(base64.b64decode, base64_data)
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import random
+from datetime import timedelta
+
+from opentelemetry import trace
+from rate_limiter import RateLimiter
+
+from horoscopebot.idempotency import UpdateGuard
+from horoscopebot.job_queue import JobQueue
+from horoscopebot.leader import LeaderLock
+
+_LOG = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+
+class Housekeeper:
+    def __init__(
+        self,
+        rate_limiter: RateLimiter,
+        leader_lock: LeaderLock,
+        *,
+        interval: timedelta,
+        jitter: timedelta,
+        update_guard: UpdateGuard | None = None,
+        job_queue: JobQueue | None = None,
+    ):
+        self._rate_limiter = rate_limiter
+        self._update_guard = update_guard
+        self._job_queue = job_queue
+        self._leader_lock = leader_lock
+        self._interval = interval
+        self._jitter = jitter
+
+    def _jittered(self, delay: timedelta) -> float:
+        jitter = random.uniform(0, self._jitter.total_seconds())
+        return delay.total_seconds() + jitter
+
+    async def run_once(self) -> None:
+        with tracer.start_as_current_span("housekeeping"):
+            async with self._leader_lock.hold(
+                "rate-limiter-housekeeping",
+                interval=self._interval,
+            ) as is_leader:
+                if not is_leader:
+                    return
+
+                _LOG.info("Doing housekeeping of rate limiter DB")
+                await self._rate_limiter.do_housekeeping()
+
+                if self._update_guard is not None:
+                    # Redeliveries happen within minutes, not days
+                    await self._update_guard.prune(older_than=timedelta(days=2))
+
+                if self._job_queue is not None:
+                    # Conflicting usages are at most a week old
+                    await self._job_queue.prune_responses(
+                        older_than=timedelta(days=8),
+                    )
+
+    async def run(self) -> None:
+        # The first run is only delayed by the jitter, so replicas started at the
+        # same time don't all try at once.
+        delay = self._jittered(timedelta())
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.run_once()
+            except Exception as e:
+                _LOG.error("Rate limiter housekeeping failed", exc_info=e)
+
+            delay = self._jittered(self._interval)
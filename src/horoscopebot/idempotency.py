@@ -0,0 +1,91 @@
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Self
+
+from psycopg_pool import AsyncConnectionPool
+
+from horoscopebot.config import DatabaseConfig
+from horoscopebot.database import open_pool, without_statement_timeout
+
+_LOG = logging.getLogger(__name__)
+
+
+class UpdateGuard(ABC):
+    """Makes sure every update is only answered once, even if it's redelivered."""
+
+    @abstractmethod
+    async def claim(self, update_id: int) -> bool:
+        """Returns `True` if nobody has claimed the update before."""
+
+    async def prune(self, older_than: timedelta) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalUpdateGuard(UpdateGuard):
+    """Only remembers the most recent updates seen by this process."""
+
+    def __init__(self, max_entries: int = 10_000):
+        self._max_entries = max_entries
+        self._seen: OrderedDict[int, None] = OrderedDict()
+
+    async def claim(self, update_id: int) -> bool:
+        if update_id in self._seen:
+            return False
+
+        self._seen[update_id] = None
+        while len(self._seen) > self._max_entries:
+            self._seen.popitem(last=False)
+        return True
+
+
+class PostgresUpdateGuard(UpdateGuard):
+    """Claims updates in a table shared by all replicas."""
+
+    def __init__(self, pool: AsyncConnectionPool):
+        self._pool = pool
+
+    @classmethod
+    async def connect(cls, config: DatabaseConfig) -> Self:
+        pool = await open_pool(
+            config,
+            schema=(
+                "CREATE TABLE IF NOT EXISTS horoscope_processed_updates ("
+                " update_id BIGINT PRIMARY KEY,"
+                " processed_at TIMESTAMPTZ NOT NULL DEFAULT now()"
+                ")"
+            ),
+            max_size=2,
+        )
+        return cls(pool)
+
+    async def claim(self, update_id: int) -> bool:
+        async with self._pool.connection() as connection:
+            cursor = await connection.execute(
+                "INSERT INTO horoscope_processed_updates (update_id) VALUES (%s)"
+                " ON CONFLICT DO NOTHING",
+                (update_id,),
+            )
+            is_new = cursor.rowcount == 1
+            if not is_new:
+                _LOG.info("Update %d has already been claimed", update_id)
+            return is_new
+
+    async def prune(self, older_than: timedelta) -> None:
+        async with (
+            self._pool.connection() as connection,
+            without_statement_timeout(connection),
+        ):
+            cursor = await connection.execute(
+                "DELETE FROM horoscope_processed_updates"
+                " WHERE processed_at < now() - %s",
+                (older_than,),
+            )
+            _LOG.info("Pruned %d processed update IDs", cursor.rowcount)
+
+    async def close(self) -> None:
+        await self._pool.close()
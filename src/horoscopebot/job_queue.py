@@ -0,0 +1,467 @@
+import asyncio
+import contextlib
+import logging
+import random
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from typing import Any, Self
+
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from psycopg_pool import AsyncConnectionPool
+
+from horoscopebot.config import DatabaseConfig, JobQueueConfig
+from horoscopebot.database import open_pool, without_statement_timeout
+from horoscopebot.horoscope.horoscope import HoroscopeResult
+from horoscopebot.partitions import ChatPartitions
+
+_LOG = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class GenerationJob:
+    chat_id: int
+    chat_type: str
+    user_id: int
+    message_id: int
+    message_time: datetime
+    dice: int
+
+
+@dataclass
+class JobProgress:
+    """What has already been done for a job, so a retry doesn't repeat it."""
+
+    results: list[HoroscopeResult]
+    # The first results which have been sent completely
+    sent_results: int = 0
+    # Message ID of the last sent result
+    response_id: int | None = None
+
+
+@dataclass
+class ClaimedJob:
+    id: int
+    # Starts at 1 for the first attempt
+    attempt: int
+    job: GenerationJob
+    # Set once the horoscope has been generated
+    progress: JobProgress | None = None
+
+
+def backoff_delay(attempt: int, config: JobQueueConfig) -> timedelta:
+    """Returns the delay before retrying a job that failed on the given attempt.
+
+    The jitter keeps jobs failed by the same outage from all retrying at once.
+    """
+    delay = min(
+        config.retry_base_seconds * 2 ** (attempt - 1),
+        config.retry_max_seconds,
+    )
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+class JobQueue(ABC):
+    """Holds generation jobs until a worker has sent their result.
+
+    A claimed job is leased to the worker. If the worker doesn't complete or retry it
+    within the lease time, e.g. because its process died, the job is handed out
+    again.
+
+    The usage of a job is recorded before its horoscope is sent, so the queue also
+    remembers the sent response of completed jobs for the dementia responder.
+    """
+
+    def __init__(self) -> None:
+        self._has_new_jobs = asyncio.Event()
+        self._is_interrupted = False
+
+    @abstractmethod
+    async def enqueue(self, job: GenerationJob) -> None:
+        pass
+
+    @abstractmethod
+    async def claim(self, lease: timedelta) -> ClaimedJob | None:
+        """Returns the oldest job that is due, if any.
+
+        Jobs are only handed out once all earlier jobs of the same chat are done, so
+        a retried job stays ahead of later ones.
+        """
+
+    @abstractmethod
+    async def complete(self, claimed: ClaimedJob) -> None:
+        """Removes the job and remembers its response, if one was sent."""
+
+    @abstractmethod
+    async def retry(self, claimed: ClaimedJob, delay: timedelta) -> None:
+        pass
+
+    @abstractmethod
+    async def save_progress(self, claimed: ClaimedJob) -> None:
+        """Stores the progress of the claimed job for its next attempts."""
+
+    @abstractmethod
+    async def find_response(
+        self,
+        *,
+        chat_id: int,
+        user_id: int,
+        reference_id: str,
+    ) -> int | None:
+        """Returns the message ID of the response to a completed job, if any.
+
+        The reference ID is the ID of the message that the job was created for.
+        """
+
+    async def prune_responses(self, older_than: timedelta) -> None:
+        pass
+
+    async def wait(self, timeout: timedelta) -> None:
+        """Waits until this process enqueues a job or the timeout expires.
+
+        Jobs enqueued by other replicas are only noticed after the timeout.
+        """
+        with contextlib.suppress(TimeoutError):
+            async with asyncio.timeout(timeout.total_seconds()):
+                await self._has_new_jobs.wait()
+        if not self._is_interrupted:
+            self._has_new_jobs.clear()
+
+    def interrupt_waits(self) -> None:
+        """Makes current and future calls to `wait` return right away."""
+        self._is_interrupted = True
+        self._has_new_jobs.set()
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalJobQueue(JobQueue):
+    """Keeps jobs in memory, so they don't survive a restart."""
+
+    def __init__(
+        self,
+        clock: Callable[[], float] = time.monotonic,
+        *,
+        max_responses: int = 10_000,
+    ):
+        super().__init__()
+        self._clock = clock
+        self._next_id = 0
+        self._jobs: dict[int, tuple[float, ClaimedJob]] = {}
+        self._max_responses = max_responses
+        self._responses: OrderedDict[tuple[int, int, str], int] = OrderedDict()
+
+    async def enqueue(self, job: GenerationJob) -> None:
+        self._next_id += 1
+        claimed = ClaimedJob(id=self._next_id, attempt=0, job=job)
+        self._jobs[claimed.id] = (self._clock(), claimed)
+        self._has_new_jobs.set()
+
+    async def claim(self, lease: timedelta) -> ClaimedJob | None:
+        now = self._clock()
+        seen_chats: set[int] = set()
+        # Jobs are kept in the order they were enqueued in
+        for due_at, claimed in self._jobs.values():
+            chat_id = claimed.job.chat_id
+            if chat_id in seen_chats:
+                continue
+
+            seen_chats.add(chat_id)
+            if due_at <= now:
+                claimed = replace(claimed, attempt=claimed.attempt + 1)
+                self._jobs[claimed.id] = (now + lease.total_seconds(), claimed)
+                return claimed
+
+        return None
+
+    async def complete(self, claimed: ClaimedJob) -> None:
+        self._jobs.pop(claimed.id, None)
+
+        progress = claimed.progress
+        if progress is None or progress.response_id is None:
+            return
+
+        job = claimed.job
+        key = (job.chat_id, job.user_id, str(job.message_id))
+        self._responses[key] = progress.response_id
+        while len(self._responses) > self._max_responses:
+            self._responses.popitem(last=False)
+
+    async def find_response(
+        self,
+        *,
+        chat_id: int,
+        user_id: int,
+        reference_id: str,
+    ) -> int | None:
+        return self._responses.get((chat_id, user_id, reference_id))
+
+    async def retry(self, claimed: ClaimedJob, delay: timedelta) -> None:
+        if claimed.id in self._jobs:
+            self._jobs[claimed.id] = (self._clock() + delay.total_seconds(), claimed)
+
+    async def save_progress(self, claimed: ClaimedJob) -> None:
+        if job := self._jobs.get(claimed.id):
+            due_at, stored = job
+            self._jobs[claimed.id] = (
+                due_at,
+                replace(stored, progress=claimed.progress),
+            )
+
+
+def _progress_to_json(progress: JobProgress) -> dict[str, Any]:
+    # Images are only referenced by their Telegram file ID or store ID, because the
+    # row is updated after every sent result. Otherwise, they are restored on retry.
+    return {
+        "results": [
+            {
+                "message": result.message,
+                "image_dropped": result.image_dropped
+                or (
+                    result.image_file_id is None
+                    and (result.image is not None or result.pending_image is not None)
+                ),
+                "image_file_id": result.image_file_id,
+                "store_id": result.store_id,
+                "image_cache_id": result.image_cache_id,
+            }
+            for result in progress.results
+        ],
+        "sent_results": progress.sent_results,
+        "response_id": progress.response_id,
+    }
+
+
+def _progress_from_json(data: dict[str, Any]) -> JobProgress:
+    return JobProgress(
+        results=[
+            HoroscopeResult(
+                message=result["message"],
+                image_dropped=result["image_dropped"],
+                image_file_id=result["image_file_id"],
+                store_id=result["store_id"],
+                image_cache_id=result["image_cache_id"],
+            )
+            for result in data["results"]
+        ],
+        sent_results=data["sent_results"],
+        response_id=data["response_id"],
+    )
+
+
+class PostgresJobQueue(JobQueue):
+    """Stores jobs in a table shared by all replicas.
+
+    The lease is implemented by moving `due_at` into the future when a job is
+    claimed, so an abandoned job becomes due again without any cleanup.
+
+    Each replica only claims the jobs of the chats in the partitions it currently
+    owns, like the EnabledSlotMachineFilter.
+    """
+
+    def __init__(
+        self,
+        pool: AsyncConnectionPool,
+        *,
+        partitions: ChatPartitions | None = None,
+    ):
+        super().__init__()
+        self._pool = pool
+        self._partitions = partitions
+
+    @classmethod
+    async def connect(
+        cls,
+        config: DatabaseConfig,
+        *,
+        max_size: int,
+        partitions: ChatPartitions | None = None,
+    ) -> Self:
+        pool = await open_pool(
+            config,
+            schema=(
+                "CREATE TABLE IF NOT EXISTS horoscope_generation_jobs ("
+                " id BIGSERIAL PRIMARY KEY,"
+                " chat_id BIGINT NOT NULL,"
+                " chat_type TEXT NOT NULL,"
+                " user_id BIGINT NOT NULL,"
+                " message_id BIGINT NOT NULL,"
+                " message_time TIMESTAMPTZ NOT NULL,"
+                " dice INTEGER NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " due_at TIMESTAMPTZ NOT NULL DEFAULT now()"
+                ");"
+                "ALTER TABLE horoscope_generation_jobs"
+                " ADD COLUMN IF NOT EXISTS progress JSONB;"
+                "CREATE INDEX IF NOT EXISTS horoscope_generation_jobs_due_at"
+                " ON horoscope_generation_jobs (due_at);"
+                "CREATE INDEX IF NOT EXISTS horoscope_generation_jobs_chat_id"
+                " ON horoscope_generation_jobs (chat_id, id);"
+                "CREATE TABLE IF NOT EXISTS horoscope_responses ("
+                " chat_id BIGINT NOT NULL,"
+                " user_id BIGINT NOT NULL,"
+                " reference_id TEXT NOT NULL,"
+                " response_id BIGINT NOT NULL,"
+                " created_at TIMESTAMPTZ NOT NULL DEFAULT now(),"
+                " PRIMARY KEY (chat_id, user_id, reference_id)"
+                ");"
+                "CREATE INDEX IF NOT EXISTS horoscope_responses_created_at"
+                " ON horoscope_responses (created_at)"
+            ),
+            max_size=max_size,
+        )
+        return cls(pool, partitions=partitions)
+
+    async def enqueue(self, job: GenerationJob) -> None:
+        async with self._pool.connection() as connection:
+            await connection.execute(
+                "INSERT INTO horoscope_generation_jobs"
+                " (chat_id, chat_type, user_id, message_id, message_time, dice)"
+                " VALUES (%s, %s, %s, %s, %s, %s)",
+                (
+                    job.chat_id,
+                    job.chat_type,
+                    job.user_id,
+                    job.message_id,
+                    job.message_time,
+                    job.dice,
+                ),
+            )
+        self._has_new_jobs.set()
+
+    async def claim(self, lease: timedelta) -> ClaimedJob | None:
+        partitions = self._partitions
+        if partitions is None:
+            partition_count, owned = 1, [0]
+        else:
+            partition_count, owned = partitions.count, sorted(partitions.owned)
+        if not owned:
+            return None
+
+        async with self._pool.connection() as connection:
+            cursor = connection.cursor(row_factory=dict_row)
+            await cursor.execute(
+                "UPDATE horoscope_generation_jobs"
+                " SET attempts = attempts + 1, due_at = now() + %s"
+                " WHERE id = ("
+                "  SELECT id FROM horoscope_generation_jobs AS job"
+                "  WHERE due_at <= now()"
+                # Postgres keeps the sign of negative chat IDs, unlike Python
+                "  AND mod(mod(chat_id, %s) + %s, %s) = ANY(%s)"
+                "  AND NOT EXISTS ("
+                "   SELECT FROM horoscope_generation_jobs AS earlier"
+                "   WHERE earlier.chat_id = job.chat_id AND earlier.id < job.id"
+                "  )"
+                "  ORDER BY id"
+                "  LIMIT 1"
+                "  FOR UPDATE SKIP LOCKED"
+                " )"
+                " RETURNING *",
+                (
+                    lease,
+                    partition_count,
+                    partition_count,
+                    partition_count,
+                    owned,
+                ),
+            )
+            row = await cursor.fetchone()
+
+        if row is None:
+            return None
+
+        return ClaimedJob(
+            id=row["id"],
+            attempt=row["attempts"],
+            job=GenerationJob(
+                chat_id=row["chat_id"],
+                chat_type=row["chat_type"],
+                user_id=row["user_id"],
+                message_id=row["message_id"],
+                message_time=row["message_time"],
+                dice=row["dice"],
+            ),
+            progress=(
+                None
+                if row["progress"] is None
+                else _progress_from_json(row["progress"])
+            ),
+        )
+
+    async def complete(self, claimed: ClaimedJob) -> None:
+        progress = claimed.progress
+        job = claimed.job
+        # Both happen in the same transaction
+        async with self._pool.connection() as connection:
+            await connection.execute(
+                "DELETE FROM horoscope_generation_jobs WHERE id = %s",
+                (claimed.id,),
+            )
+            if progress is not None and progress.response_id is not None:
+                await connection.execute(
+                    "INSERT INTO horoscope_responses"
+                    " (chat_id, user_id, reference_id, response_id)"
+                    " VALUES (%s, %s, %s, %s)"
+                    " ON CONFLICT DO NOTHING",
+                    (
+                        job.chat_id,
+                        job.user_id,
+                        str(job.message_id),
+                        progress.response_id,
+                    ),
+                )
+
+    async def retry(self, claimed: ClaimedJob, delay: timedelta) -> None:
+        async with self._pool.connection() as connection:
+            await connection.execute(
+                "UPDATE horoscope_generation_jobs SET due_at = now() + %s"
+                " WHERE id = %s",
+                (delay, claimed.id),
+            )
+
+    async def save_progress(self, claimed: ClaimedJob) -> None:
+        progress = claimed.progress
+        async with self._pool.connection() as connection:
+            await connection.execute(
+                "UPDATE horoscope_generation_jobs SET progress = %s WHERE id = %s",
+                (
+                    None if progress is None else Jsonb(_progress_to_json(progress)),
+                    claimed.id,
+                ),
+            )
+
+    async def find_response(
+        self,
+        *,
+        chat_id: int,
+        user_id: int,
+        reference_id: str,
+    ) -> int | None:
+        async with self._pool.connection() as connection:
+            cursor = await connection.execute(
+                "SELECT response_id FROM horoscope_responses"
+                " WHERE chat_id = %s AND user_id = %s AND reference_id = %s",
+                (chat_id, user_id, reference_id),
+            )
+            row = await cursor.fetchone()
+
+        return None if row is None else row[0]
+
+    async def prune_responses(self, older_than: timedelta) -> None:
+        async with (
+            self._pool.connection() as connection,
+            without_statement_timeout(connection),
+        ):
+            cursor = await connection.execute(
+                "DELETE FROM horoscope_responses WHERE created_at < now() - %s",
+                (older_than,),
+            )
+            _LOG.info("Pruned %d job responses", cursor.rowcount)
+
+    async def close(self) -> None:
+        await self._pool.close()
@@ -0,0 +1,94 @@
+import logging
+import zlib
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
+from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from datetime import timedelta
+
+import psycopg
+
+from horoscopebot.config import DatabaseConfig
+from horoscopebot.database import connection_kwargs
+
+_LOG = logging.getLogger(__name__)
+
+
+class LeaderLock(ABC):
+    @abstractmethod
+    def hold(
+        self,
+        name: str,
+        *,
+        interval: timedelta,
+    ) -> AbstractAsyncContextManager[bool]:
+        """Tries to become the only replica doing the work called `name`.
+
+        The yielded value is `True` if the lock was acquired and no replica has
+        completed the work within the last `interval`. The lock is held until the
+        context exits, and the work counts as completed if it exits without an
+        exception.
+        """
+
+
+class LocalLeaderLock(LeaderLock):
+    @asynccontextmanager
+    async def hold(self, name: str, *, interval: timedelta) -> AsyncIterator[bool]:
+        yield True
+
+
+class PostgresLeaderLock(LeaderLock):
+    def __init__(self, config: DatabaseConfig):
+        self._config = config
+
+    @staticmethod
+    def _lock_key(name: str) -> int:
+        return zlib.crc32(name.encode())
+
+    @asynccontextmanager
+    async def hold(self, name: str, *, interval: timedelta) -> AsyncIterator[bool]:
+        connection = await psycopg.AsyncConnection.connect(
+            **connection_kwargs(self._config),
+        )
+        async with connection:
+            await connection.execute(
+                "CREATE TABLE IF NOT EXISTS horoscope_leader_runs ("
+                " name TEXT PRIMARY KEY,"
+                " last_run_at TIMESTAMPTZ NOT NULL"
+                ")"
+            )
+            await connection.commit()
+
+            # The transaction-level lock is released automatically when the
+            # transaction ends, even if this process dies in the meantime.
+            async with connection.transaction():
+                cursor = await connection.execute(
+                    "SELECT pg_try_advisory_xact_lock(%s)",
+                    (self._lock_key(name),),
+                )
+                row = await cursor.fetchone()
+                if not (row and row[0]):
+                    _LOG.info("Another replica holds the %s lock", name)
+                    yield False
+                    return
+
+                # The lock alone only prevents overlapping runs, the other replicas
+                # would still do the work right after this one.
+                cursor = await connection.execute(
+                    "SELECT 1 FROM horoscope_leader_runs"
+                    " WHERE name = %s AND last_run_at > now() - %s",
+                    (name, interval),
+                )
+                if await cursor.fetchone():
+                    _LOG.info("Another replica did %s recently", name)
+                    yield False
+                    return
+
+                yield True
+
+                # Rolled back with the transaction if the work failed
+                await connection.execute(
+                    "INSERT INTO horoscope_leader_runs (name, last_run_at)"
+                    " VALUES (%s, now())"
+                    " ON CONFLICT (name) DO UPDATE SET last_run_at = now()",
+                    (name,),
+                )
@@ -0,0 +1,18 @@
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from opentelemetry.metrics import Histogram
+from opentelemetry.util.types import Attributes
+
+
+@contextmanager
+def record_duration(
+    histogram: Histogram,
+    attributes: Attributes = None,
+) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.record(time.perf_counter() - start, attributes)
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from typing import Any
+
+import psycopg
+
+from horoscopebot.config import DatabaseConfig
+from horoscopebot.database import connection_kwargs, without_statement_timeout
+
+_LOG = logging.getLogger(__name__)
+
+# First key of the two-key advisory locks, the partition index is the second one
+_LOCK_CLASS = 0x484F52
+
+
+class ChatPartitions(ABC):
+    """Tracks the chat partitions this replica currently handles.
+
+    Each replica owns the chats whose ID modulo `count` is its `index`. That keeps
+    all messages of a chat on the same replica, in order.
+    """
+
+    def __init__(self, *, count: int, index: int):
+        self.count = count
+        self.index = index
+        self._owned: set[int] = set()
+
+    @property
+    def owned(self) -> frozenset[int]:
+        return frozenset(self._owned)
+
+    def owns_chat(self, chat_id: int) -> bool:
+        return chat_id % self.count in self._owned
+
+    @abstractmethod
+    async def acquire(self) -> None:
+        """Waits until this replica owns its own partition."""
+
+    async def run(self) -> None:
+        """Takes over the partitions of missing replicas until they are back."""
+
+    @abstractmethod
+    async def release(self) -> None:
+        """Hands all partitions of this replica over to the other replicas."""
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalChatPartitions(ChatPartitions):
+    """Only knows about this process, so it never takes over other partitions."""
+
+    async def acquire(self) -> None:
+        self._owned = {self.index}
+
+    async def release(self) -> None:
+        self._owned.clear()
+
+
+class PostgresChatPartitions(ChatPartitions):
+    """Owns partitions by holding a session-level advisory lock for each of them.
+
+    A StatefulSet can't start a new pod before stopping the old one, so the other
+    replicas take over the partition of a replica while it is restarted. The lock of
+    a replica that died is released together with its connection. A replica that
+    starts waits for its lock, which makes the replica that took its partition over
+    hand it back.
+    """
+
+    def __init__(
+        self,
+        config: DatabaseConfig,
+        *,
+        count: int,
+        index: int,
+        check_interval: timedelta = timedelta(seconds=1),
+    ):
+        super().__init__(count=count, index=index)
+        self._config = config
+        self._check_interval = check_interval
+        self._connection: psycopg.AsyncConnection[Any] | None = None
+
+    async def _connect(self) -> psycopg.AsyncConnection[Any]:
+        if self._connection is None:
+            self._connection = await psycopg.AsyncConnection.connect(
+                **connection_kwargs(self._config),
+                autocommit=True,
+            )
+        return self._connection
+
+    async def acquire(self) -> None:
+        connection = await self._connect()
+        _LOG.info("Waiting for partition %d", self.index)
+        async with without_statement_timeout(connection):
+            await connection.execute(
+                "SELECT pg_advisory_lock(%s, %s)",
+                (_LOCK_CLASS, self.index),
+            )
+        self._owned.add(self.index)
+        _LOG.info("Acquired partition %d", self.index)
+
+    async def _check(self) -> None:
+        connection = await self._connect()
+        for index in range(self.count):
+            if index in self._owned:
+                continue
+
+            cursor = await connection.execute(
+                "SELECT pg_try_advisory_lock(%s, %s)",
+                (_LOCK_CLASS, index),
+            )
+            row = await cursor.fetchone()
+            if row and row[0]:
+                _LOG.warning("Taking over partition %d", index)
+                self._owned.add(index)
+
+        cursor = await connection.execute(
+            "SELECT objid::bigint FROM pg_locks"
+            " WHERE locktype = 'advisory' AND NOT granted"
+            " AND classid::bigint = %s AND objsubid = 2",
+            (_LOCK_CLASS,),
+        )
+        waiting = {row[0] for row in await cursor.fetchall()}
+        for index in self._owned & waiting:
+            if index == self.index:
+                continue
+
+            _LOG.info("Handing partition %d back", index)
+            self._owned.discard(index)
+            await connection.execute(
+                "SELECT pg_advisory_unlock(%s, %s)",
+                (_LOCK_CLASS, index),
+            )
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self._check_interval.total_seconds())
+            try:
+                await self._check()
+            except Exception as e:
+                _LOG.error("Could not check partitions", exc_info=e)
+
+    async def release(self) -> None:
+        connection = self._connection
+        if connection is None:
+            return
+
+        await connection.execute("SELECT pg_advisory_unlock_all()")
+        # Updates are still accepted until the other replicas had time to take
+        # over, duplicates are discarded by the UpdateGuard.
+        await asyncio.sleep(2 * self._check_interval.total_seconds())
+        self._owned.clear()
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
@@ -0,0 +1,201 @@
+"""Pre-generates pooled horoscopes through the OpenAI Batch API.
+
+The completions for all slot machine combinations are submitted as a single batch
+job, which is cheaper than live completions and may take up to 24 hours. Once the
+batch has completed, the images are generated and the results are written to a
+segment in the import directory next to the result store (RESULT_STORE_PATH). The
+running bot picks it up from there and serves the results from its pool
+(OPENAI_POOL_SIZE must be positive), so the job has to run where it can access the
+bot's storage, e.g. in its pod.
+
+An interrupted job can be resumed with --batch-id. Like the bot, the job honours
+OPENAI_BASE_URL, so it can be pointed at a local stand-in server.
+
+Usage: python -m horoscopebot.pregen --help
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import uvloop
+from bs_config import Env
+from openai import AsyncOpenAI
+from openai.types import Batch
+from openai.types.chat import ChatCompletion
+
+from horoscopebot.config import Config
+from horoscopebot.horoscope.pool import import_dir, store_key
+from horoscopebot.horoscope.store import ResultStore
+from horoscopebot.horoscope.weekly_openai import (
+    PREGENERATED_DICE_VALUES,
+    WeeklyOpenAiHoroscope,
+    get_prompt,
+)
+
+_LOG = logging.getLogger(__name__)
+
+_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m horoscopebot.pregen")
+    parser.add_argument(
+        "--count",
+        type=int,
+        default=1,
+        help="Number of horoscopes per dice value",
+    )
+    parser.add_argument(
+        "--batch-id",
+        help="Resume waiting for a previously submitted batch",
+    )
+    parser.add_argument("--poll-interval-seconds", type=int, default=60)
+    parser.add_argument("--image-concurrency", type=int, default=4)
+    return parser.parse_args()
+
+
+def _custom_id(dice: int, index: int) -> str:
+    # A resumed batch may have been submitted with an older prompt
+    return f"{dice}-{get_prompt(dice).hash}-{index}"
+
+
+def _parse_custom_id(custom_id: str) -> tuple[int, str]:
+    """Returns the dice value and prompt hash of the request."""
+    dice, prompt_hash, _ = custom_id.split("-", 2)
+    return int(dice), prompt_hash
+
+
+async def _submit(
+    open_ai: AsyncOpenAI,
+    horoscope: WeeklyOpenAiHoroscope,
+    count: int,
+) -> Batch:
+    lines = [
+        json.dumps(
+            {
+                "custom_id": _custom_id(dice, index),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": horoscope.create_batch_body(dice),
+            }
+        )
+        for dice in PREGENERATED_DICE_VALUES
+        for index in range(count)
+    ]
+    input_file = await open_ai.files.create(
+        file=("pregen.jsonl", "\n".join(lines).encode()),
+        purpose="batch",
+    )
+    batch = await open_ai.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    _LOG.info("Submitted batch %s with %d requests", batch.id, len(lines))
+    return batch
+
+
+async def _wait(open_ai: AsyncOpenAI, batch: Batch, poll_interval: int) -> Batch:
+    while batch.status not in _FINAL_STATUSES:
+        _LOG.info("Batch %s is %s", batch.id, batch.status)
+        await asyncio.sleep(poll_interval)
+        batch = await open_ai.batches.retrieve(batch.id)
+
+    return batch
+
+
+async def _load_results(
+    open_ai: AsyncOpenAI,
+    horoscope: WeeklyOpenAiHoroscope,
+    store: ResultStore,
+    output_file_id: str,
+    image_concurrency: int,
+) -> int:
+    content = await open_ai.files.content(output_file_id)
+    slots = asyncio.Semaphore(image_concurrency)
+
+    async def load(line: str) -> bool:
+        entry = json.loads(line)
+        custom_id = entry["custom_id"]
+        response = entry.get("response")
+        if entry.get("error") or not response or response["status_code"] != 200:
+            _LOG.error("Request %s failed: %s", custom_id, entry.get("error"))
+            return False
+
+        dice, prompt_hash = _parse_custom_id(custom_id)
+        completion = ChatCompletion.model_validate(response["body"])
+        async with slots:
+            try:
+                result = await horoscope.complete_batch_result(dice, completion)
+            except Exception as e:
+                _LOG.error("Could not complete %s", custom_id, exc_info=e)
+                return False
+
+        store.append(store_key(dice, prompt_hash), result)
+        return True
+
+    loaded = await asyncio.gather(
+        *(load(line) for line in content.text.splitlines() if line)
+    )
+    return sum(loaded)
+
+
+async def _run(args: argparse.Namespace) -> None:
+    config = Config.from_env(Env.load(include_default_dotenv=True))
+    openai_config = config.horoscope.openai
+    store_path = config.horoscope.store_path
+    if openai_config is None or not store_path:
+        raise ValueError("Pre-generation requires OpenAI and RESULT_STORE_PATH")
+
+    open_ai = AsyncOpenAI(api_key=openai_config.token)
+    horoscope = WeeklyOpenAiHoroscope(openai_config, ZoneInfo(config.timezone_name))
+    try:
+        if args.batch_id:
+            batch = await open_ai.batches.retrieve(args.batch_id)
+        else:
+            batch = await _submit(open_ai, horoscope, args.count)
+
+        batch = await _wait(open_ai, batch, args.poll_interval_seconds)
+        if batch.error_file_id:
+            _LOG.warning("Batch %s has errors in %s", batch.id, batch.error_file_id)
+
+        if not batch.output_file_id:
+            raise RuntimeError(f"Batch {batch.id} ended as {batch.status}")
+        if batch.status != "completed":
+            # Expired batches still contain the requests that did complete
+            _LOG.warning("Batch %s ended as %s", batch.id, batch.status)
+
+        segment_dir = import_dir(Path(store_path))
+        segment_dir.mkdir(parents=True, exist_ok=True)
+        # Only renamed once complete, so the bot doesn't import it too early
+        partial_path = segment_dir / f"{batch.id}.seg.partial"
+        partial_path.unlink(missing_ok=True)
+        segment = ResultStore(partial_path)
+        try:
+            loaded = await _load_results(
+                open_ai,
+                horoscope,
+                segment,
+                batch.output_file_id,
+                args.image_concurrency,
+            )
+        finally:
+            segment.close()
+        partial_path.replace(segment_dir / f"{batch.id}.seg")
+        _LOG.info("Handed over %d pre-generated horoscopes to the bot", loaded)
+    finally:
+        await horoscope.close()
+        await open_ai.close()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    uvloop.run(_run(_parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta, tzinfo
+
+from rate_limiter import RateLimitingRepo, Usage
+
+_LOG = logging.getLogger(__name__)
+
+
+@dataclass
+class _CacheEntry:
+    usages: list[Usage]
+    limit: int
+    expires_at: datetime
+
+
+class CachingRateLimitingRepo(RateLimitingRepo):
+    """Write-through cache for the most recent usages of each user.
+
+    Entries are evicted in LRU order once `max_entries` is exceeded and expire
+    after `ttl` or at the start of the next week, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        delegate: RateLimitingRepo,
+        *,
+        max_entries: int,
+        ttl: timedelta,
+        timezone: tzinfo,
+    ):
+        self._delegate = delegate
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._timezone = timezone
+        self._entries: OrderedDict[tuple[str, str], _CacheEntry] = OrderedDict()
+
+    def _expiry(self, now: datetime) -> datetime:
+        local_now = now.astimezone(self._timezone)
+        next_monday = local_now.date() + timedelta(days=7 - local_now.weekday())
+        week_end = datetime.combine(next_monday, time(), tzinfo=self._timezone)
+        return min(now + self._ttl, week_end)
+
+    def _get_entry(self, key: tuple[str, str], limit: int) -> _CacheEntry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        if entry.expires_at <= datetime.now(self._timezone):
+            del self._entries[key]
+            return None
+
+        if entry.limit < limit:
+            return None
+
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put_entry(self, key: tuple[str, str], entry: _CacheEntry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    async def add_usage(
+        self,
+        context_id: str,
+        user_id: str,
+        utc_time: datetime,
+        reference_id: str | None,
+        response_id: str | None,
+    ) -> None:
+        await self._delegate.add_usage(
+            context_id=context_id,
+            user_id=user_id,
+            utc_time=utc_time,
+            reference_id=reference_id,
+            response_id=response_id,
+        )
+
+        key = (context_id, user_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+
+        usage = Usage(
+            context_id=context_id,
+            user_id=user_id,
+            time=utc_time,
+            reference_id=reference_id,
+            response_id=response_id,
+        )
+        entry.usages = [usage, *entry.usages][: entry.limit]
+
+    async def get_usages(
+        self,
+        context_id: str,
+        user_id: str,
+        limit: int = 1,
+    ) -> list[Usage]:
+        key = (context_id, user_id)
+        if entry := self._get_entry(key, limit):
+            _LOG.debug("Serving usages from cache")
+            return entry.usages[:limit]
+
+        usages = await self._delegate.get_usages(
+            context_id=context_id,
+            user_id=user_id,
+            limit=limit,
+        )
+        now = datetime.now(self._timezone)
+        self._put_entry(
+            key,
+            _CacheEntry(
+                usages=usages,
+                limit=limit,
+                expires_at=self._expiry(now),
+            ),
+        )
+        return list(usages)
+
+    async def housekeeping(self, keep_after: datetime) -> None:
+        await self._delegate.housekeeping(keep_after)
+        self._entries.clear()
+
+    async def close(self) -> None:
+        self._entries.clear()
+        await self._delegate.close()
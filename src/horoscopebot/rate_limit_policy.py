@@ -1,9 +1,20 @@
 import logging
 from datetime import datetime, timedelta
 
+from opentelemetry import metrics
 from rate_limiter import RateLimitingPolicy, Usage
 
 _LOG = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+_decisions = meter.create_counter(
+    "horoscope.rate_limit.decisions",
+    description="Rate limiting decisions by policy and branch",
+)
+
+
+def _count_decision(policy: str, decision: str, reason: str) -> None:
+    _decisions.add(1, {"policy": policy, "decision": decision, "reason": reason})
 
 
 class WeeklyLimitPolicy(RateLimitingPolicy):
@@ -32,6 +43,7 @@ class WeeklyLimitPolicy(RateLimitingPolicy):
 
         if len(last_usages) < self._limit:
             _LOG.info("ALLOW: Got fewer usages than the limit")
+            _count_decision("weekly", "allow", "below_limit")
             # We haven't reached the limit yet
             return None
 
@@ -39,9 +51,11 @@ class WeeklyLimitPolicy(RateLimitingPolicy):
         for usage in last_usages:
             if usage.time.date() >= monday:
                 _LOG.info("DENY: Usage within this week")
+                _count_decision("weekly", "deny", "used_this_week")
                 return usage
 
         _LOG.info("ALLOW: No usage from this week found")
+        _count_decision("weekly", "allow", "not_used_this_week")
         return None
 
 
@@ -71,11 +85,14 @@ class UserPassPolicy(RateLimitingPolicy):
             if usage.user_id == self.user_id:
                 if not self.direct_chat_only or (usage.context_id == self.user_id):
                     _LOG.info("ALLOW: Found usage with matching user ID")
+                    _count_decision("user_pass", "allow", "matching_user")
                     return None
 
             _LOG.warning("INDECISION: Usage found, but no match")
+            _count_decision("user_pass", "fallback", "no_match")
         else:
             _LOG.info("INDECISION: No usages found. Falling back.")
+            _count_decision("user_pass", "fallback", "no_usages")
 
         return await self.fallback.get_offending_usage(
             at_time=at_time,
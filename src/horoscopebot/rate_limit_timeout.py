@@ -0,0 +1,54 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from rate_limiter import RateLimitingRepo, Usage
+
+
+class TimeoutRateLimitingRepo(RateLimitingRepo):
+    """Bounds the duration of the queries made while handling an update.
+
+    The rate limiter library doesn't expose connection options, so its connections
+    can't get a statement timeout. Cancelling a query from psycopg also cancels it
+    on the server. Housekeeping isn't bounded, since its DELETE may run for much
+    longer.
+    """
+
+    def __init__(self, delegate: RateLimitingRepo, *, timeout: timedelta):
+        self._delegate = delegate
+        self._timeout = timeout.total_seconds()
+
+    async def add_usage(
+        self,
+        context_id: str,
+        user_id: str,
+        utc_time: datetime,
+        reference_id: str | None,
+        response_id: str | None,
+    ) -> None:
+        async with asyncio.timeout(self._timeout):
+            await self._delegate.add_usage(
+                context_id=context_id,
+                user_id=user_id,
+                utc_time=utc_time,
+                reference_id=reference_id,
+                response_id=response_id,
+            )
+
+    async def get_usages(
+        self,
+        context_id: str,
+        user_id: str,
+        limit: int = 1,
+    ) -> list[Usage]:
+        async with asyncio.timeout(self._timeout):
+            return await self._delegate.get_usages(
+                context_id=context_id,
+                user_id=user_id,
+                limit=limit,
+            )
+
+    async def housekeeping(self, keep_after: datetime) -> None:
+        await self._delegate.housekeeping(keep_after)
+
+    async def close(self) -> None:
+        await self._delegate.close()
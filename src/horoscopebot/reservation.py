@@ -0,0 +1,84 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+
+from opentelemetry import metrics
+from rate_limiter import RateLimiter, Usage
+
+from horoscopebot.metrics import record_duration
+
+_LOG = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+_lookup_duration = meter.create_histogram(
+    "horoscope.rate_limit.lookup.duration",
+    unit="s",
+    description="Duration of rate limit checks",
+)
+
+
+@dataclass
+class Reservation:
+    context_id: int
+    user_id: int
+    time: datetime
+    reference_id: str
+    conflicting_usage: Usage | None = None
+
+
+class UsageReservations:
+    """Records a usage before the expensive work for it is done.
+
+    The usage is recorded right after the rate limit check and before the job for it
+    is enqueued, so a second roll of the same user is denied while the first
+    horoscope is still being generated.
+
+    Checking and recording aren't atomic. Nothing here guards against concurrent
+    reservations: updates of a chat are handled one after the other
+    (ChatOrderedUpdateProcessor), and each chat is handled by a single replica
+    (ChatPartitions).
+    """
+
+    def __init__(self, rate_limiter: RateLimiter):
+        self._rate_limiter = rate_limiter
+
+    async def reserve(
+        self,
+        *,
+        context_id: int,
+        user_id: int,
+        at_time: datetime,
+        reference_id: str,
+    ) -> Reservation:
+        """Records a usage unless there is a conflicting one.
+
+        If `conflicting_usage` is set on the returned reservation, nothing has been
+        recorded. The usage has no response ID, because the horoscope is only sent
+        afterwards by a generation worker.
+        """
+        reservation = Reservation(
+            context_id=context_id,
+            user_id=user_id,
+            time=at_time,
+            reference_id=reference_id,
+        )
+
+        with record_duration(_lookup_duration):
+            reservation.conflicting_usage = (
+                await self._rate_limiter.get_offending_usage(
+                    context_id=context_id,
+                    user_id=user_id,
+                    at_time=at_time,
+                )
+            )
+
+        if reservation.conflicting_usage is None:
+            await self._rate_limiter.add_usage(
+                context_id=context_id,
+                user_id=user_id,
+                time=at_time,
+                reference_id=reference_id,
+                response_id=None,
+            )
+
+        return reservation
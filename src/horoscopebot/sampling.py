@@ -0,0 +1,135 @@
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.sdk.trace.export import SpanExporter
+from opentelemetry.sdk.trace.sampling import (
+    Decision,
+    ParentBased,
+    Sampler,
+    SamplingResult,
+    StaticSampler,
+    TraceIdRatioBased,
+)
+from opentelemetry.trace import Link, SpanKind, StatusCode
+from opentelemetry.trace.span import TraceState
+from opentelemetry.util.types import Attributes
+
+_LOG = logging.getLogger(__name__)
+
+
+class _RecordingRatioSampler(Sampler):
+    """Like TraceIdRatioBased, but records the traces it doesn't sample."""
+
+    def __init__(self, ratio: float):
+        self._delegate = TraceIdRatioBased(ratio)
+
+    def should_sample(
+        self,
+        parent_context: Context | None,
+        trace_id: int,
+        name: str,
+        kind: SpanKind | None = None,
+        attributes: Attributes = None,
+        links: Sequence[Link] | None = None,
+        trace_state: TraceState | None = None,
+    ) -> SamplingResult:
+        result = self._delegate.should_sample(
+            parent_context,
+            trace_id,
+            name,
+            kind,
+            attributes,
+            links,
+            trace_state,
+        )
+        if result.decision == Decision.DROP:
+            return SamplingResult(
+                Decision.RECORD_ONLY,
+                result.attributes,
+                result.trace_state,
+            )
+
+        return result
+
+    def get_description(self) -> str:
+        return f"RecordingRatio{{{self._delegate.rate}}}"
+
+
+def create_sampler(ratio: float) -> Sampler:
+    """Samples a ratio of traces up front and records the rest.
+
+    The recorded but unsampled traces are only exported by ErrorTailSpanProcessor
+    if one of their spans failed.
+    """
+    if ratio >= 1:
+        return StaticSampler(Decision.RECORD_AND_SAMPLE)
+
+    return ParentBased(
+        root=_RecordingRatioSampler(ratio),
+        local_parent_not_sampled=StaticSampler(Decision.RECORD_ONLY),
+    )
+
+
+class ErrorTailSpanProcessor(SpanProcessor):
+    """Exports unsampled traces once their local root span ends, if any span failed.
+
+    Spans are buffered per trace, and only the `max_traces` most recently active
+    traces are kept.
+    """
+
+    def __init__(self, exporter: SpanExporter, *, max_traces: int = 1024):
+        self._exporter = exporter
+        self._max_traces = max_traces
+        self._traces: OrderedDict[int, list[ReadableSpan]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="error-span-export",
+        )
+
+    def on_start(self, span: Span, parent_context: Context | None = None) -> None:
+        pass
+
+    def on_end(self, span: ReadableSpan) -> None:
+        context = span.context
+        if context is None or context.trace_flags.sampled:
+            return
+
+        trace_id = context.trace_id
+        with self._lock:
+            spans = self._traces.setdefault(trace_id, [])
+            self._traces.move_to_end(trace_id)
+            spans.append(span)
+            while len(self._traces) > self._max_traces:
+                self._traces.popitem(last=False)
+
+            if span.parent is not None and not span.parent.is_remote:
+                return
+
+            del self._traces[trace_id]
+
+        if any(s.status.status_code == StatusCode.ERROR for s in spans):
+            self._executor.submit(self._export, spans)
+
+    def _export(self, spans: list[ReadableSpan]) -> None:
+        try:
+            self._exporter.export(spans)
+        except Exception as e:
+            _LOG.error("Could not export failed trace", exc_info=e)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+        self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        # The executor only has one thread, so this runs after all pending exports
+        flushed = self._executor.submit(self._exporter.force_flush, timeout_millis)
+        try:
+            return flushed.result(timeout=timeout_millis / 1000)
+        except TimeoutError:
+            return False
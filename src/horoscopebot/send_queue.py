@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable, Sequence
+from datetime import timedelta
+
+from opentelemetry import metrics
+from telegram.error import RetryAfter
+
+from horoscopebot.config import SendRateConfig
+
+_LOG = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+_throttle_duration = meter.create_histogram(
+    "horoscope.telegram.send.throttled",
+    unit="s",
+    description="Time sends waited for the outbound rate limits",
+)
+_retry_after = meter.create_counter(
+    "horoscope.telegram.retry_after",
+    description="Flood control errors received from Telegram",
+)
+
+
+class TokenBucket:
+    """Allows `rate` operations per second with bursts of up to `capacity`.
+
+    Tokens are reserved in call order and the balance may go negative, so waiting
+    callers are served first come, first served without polling.
+    """
+
+    def __init__(
+        self,
+        *,
+        rate: float,
+        capacity: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._rate = rate
+        self._capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated_at = clock()
+
+    def reserve(self) -> float:
+        """Takes a token and returns the number of seconds until it's available."""
+        now = self._clock()
+        elapsed = now - self._updated_at
+        self._tokens = min(self._capacity, self._tokens + elapsed * self._rate)
+        self._updated_at = now
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return 0.0
+
+        return -self._tokens / self._rate
+
+    def delay(self, seconds: float) -> None:
+        """Stops handing out tokens for the given number of seconds."""
+        self._tokens = min(self._tokens, 0) - seconds * self._rate
+
+    async def acquire(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _retry_after_seconds(e: RetryAfter) -> float:
+    retry_after = e.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+
+    return retry_after
+
+
+class SendScheduler:
+    """Paces outbound messages to stay within Telegram's rate limits.
+
+    Every message takes a token from a global bucket and one for its chat. Group
+    chats are limited per minute, private chats per second. All parts of a split
+    message are sent back to back, without messages for the same chat in between.
+    If Telegram still asks to retry later, the chat is paused for as long as
+    requested and the part is sent again.
+    """
+
+    def __init__(self, config: SendRateConfig, *, max_retries: int = 3):
+        self._config = config
+        self._max_retries = max_retries
+        self._global_bucket = TokenBucket(
+            rate=config.global_per_second,
+            capacity=config.global_per_second,
+        )
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._chat_locks: dict[int, asyncio.Lock] = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if chat_id < 0:
+                rate = self._config.group_per_minute / 60
+            else:
+                rate = self._config.private_per_second
+            bucket = TokenBucket(rate=rate, capacity=self._config.burst)
+            self._chat_buckets[chat_id] = bucket
+
+        return bucket
+
+    async def send[T](
+        self,
+        chat_id: int,
+        parts: Sequence[Callable[[], Awaitable[T]]],
+    ) -> list[T]:
+        """Sends the parts of a message in order and returns their results.
+
+        If a part fails, the remaining parts are not sent.
+        """
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            return [await self._send_part(chat_id, part) for part in parts]
+
+    async def _send_part[T](self, chat_id: int, part: Callable[[], Awaitable[T]]) -> T:
+        chat_bucket = self._chat_bucket(chat_id)
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            await chat_bucket.acquire()
+            await self._global_bucket.acquire()
+            _throttle_duration.record(time.perf_counter() - start)
+
+            try:
+                return await part()
+            except RetryAfter as e:
+                _retry_after.add(1)
+                attempt += 1
+                if attempt > self._max_retries:
+                    raise
+
+                seconds = _retry_after_seconds(e)
+                _LOG.warning("Flood control for chat %d, waiting %ss", chat_id, seconds)
+                chat_bucket.delay(seconds)
@@ -1,43 +1,60 @@
 import logging
 
-from opentelemetry import trace
-from opentelemetry._logs import set_logger_provider
-from opentelemetry.exporter.otlp.proto.grpc._log_exporter import OTLPLogExporter
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.instrumentation.asyncio import AsyncioInstrumentor
-from opentelemetry.instrumentation.openai import OpenAIInstrumentor
-from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
-from opentelemetry.sdk._logs._internal.export import BatchLogRecordProcessor
-from opentelemetry.sdk.resources import SERVICE_NAME, Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.sdk.trace.sampling import Decision, StaticSampler
+from opentelemetry import metrics, trace
 
 from horoscopebot.config import Config
 
 
 def setup_telemetry(config: Config) -> None:
+    if not config.enable_telemetry:
+        return
+
+    # The SDK, the gRPC exporters and the instrumentations take a while to import,
+    # so they are only loaded if they are used.
+    from opentelemetry._logs import set_logger_provider
+    from opentelemetry.exporter.otlp.proto.grpc._log_exporter import OTLPLogExporter
+    from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import (
+        OTLPMetricExporter,
+    )
+    from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+    from opentelemetry.instrumentation.asyncio import AsyncioInstrumentor
+    from opentelemetry.instrumentation.openai import OpenAIInstrumentor
+    from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
+    from opentelemetry.sdk._logs._internal.export import BatchLogRecordProcessor
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+    from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    from horoscopebot.sampling import ErrorTailSpanProcessor, create_sampler
+
     resource = Resource(attributes={SERVICE_NAME: "telegram-horoscope-bot"})
 
+    # Without a tracer provider, all tracers are no-ops and spans cost nothing
     trace_provider = TracerProvider(
         resource=resource,
-        sampler=StaticSampler(Decision.RECORD_AND_SAMPLE),
+        sampler=create_sampler(config.trace_sample_ratio),
     )
-
-    if config.enable_telemetry:
-        exporter = OTLPSpanExporter()
-        processor = BatchSpanProcessor(exporter)
-        trace_provider.add_span_processor(processor)
-
+    trace_provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    if config.trace_sample_ratio < 1:
+        trace_provider.add_span_processor(ErrorTailSpanProcessor(OTLPSpanExporter()))
     trace.set_tracer_provider(trace_provider)
 
-    if config.enable_telemetry:
-        logger_provider = LoggerProvider(resource=resource)
-        set_logger_provider(logger_provider)
-        log_exporter = OTLPLogExporter()
-        logger_provider.add_log_record_processor(BatchLogRecordProcessor(log_exporter))
-        handler = LoggingHandler(logger_provider=logger_provider)
-        logging.root.addHandler(handler)
+    metric_reader = PeriodicExportingMetricReader(OTLPMetricExporter())
+    meter_provider = MeterProvider(
+        resource=resource,
+        metric_readers=[metric_reader],
+    )
+    metrics.set_meter_provider(meter_provider)
+
+    logger_provider = LoggerProvider(resource=resource)
+    set_logger_provider(logger_provider)
+    log_exporter = OTLPLogExporter()
+    logger_provider.add_log_record_processor(BatchLogRecordProcessor(log_exporter))
+    handler = LoggingHandler(logger_provider=logger_provider)
+    logging.root.addHandler(handler)
 
+    # The instrumentations only produce no-op spans without a tracer provider
     AsyncioInstrumentor().instrument()
     OpenAIInstrumentor().instrument()
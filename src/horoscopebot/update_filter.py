@@ -0,0 +1,40 @@
+from collections.abc import Iterable
+
+from telegram import Message
+from telegram.constants import DiceEmoji
+from telegram.ext import filters
+
+from horoscopebot.partitions import ChatPartitions
+
+
+class EnabledSlotMachineFilter(filters.MessageFilter):
+    """Matches slot machine rolls in enabled chats.
+
+    This is checked for every update the bot receives, most of which are discarded,
+    so it only does a set lookup and an attribute comparison.
+
+    When running multiple replicas, each one only handles the enabled chats in the
+    partitions it currently owns.
+    """
+
+    __slots__ = ("_chat_ids", "_partitions")
+
+    def __init__(
+        self,
+        chat_ids: Iterable[int],
+        *,
+        partitions: ChatPartitions | None = None,
+    ):
+        super().__init__(name="EnabledSlotMachineFilter")
+        self._chat_ids = frozenset(chat_ids)
+        self._partitions = partitions
+
+    def filter(self, message: Message) -> bool:
+        dice = message.dice
+        chat_id = message.chat.id
+        return (
+            dice is not None
+            and dice.emoji == DiceEmoji.SLOT_MACHINE
+            and chat_id in self._chat_ids
+            and (self._partitions is None or self._partitions.owns_chat(chat_id))
+        )
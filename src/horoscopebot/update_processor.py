@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Coroutine
+from typing import Any, cast
+
+from opentelemetry import metrics
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from telegram.ext.filters import BaseFilter
+
+_LOG = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+_dropped_updates = meter.create_counter(
+    "horoscope.updates.dropped",
+    description="Updates discarded before dispatch because no handler wants them",
+)
+_queue_depth = meter.create_up_down_counter(
+    "horoscope.updates.queued",
+    description="Updates waiting for an earlier update from the same chat",
+)
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently across chats, but in order within a chat.
+
+    Updates not matching `update_filter` are discarded right away, without taking
+    a chat lock or running the handler coroutine.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_updates: int,
+        update_filter: BaseFilter | None = None,
+    ):
+        super().__init__(max_concurrent_updates)
+        self._update_filter = update_filter
+        self._chat_locks: dict[int, asyncio.Lock] = {}
+        self._chat_users: dict[int, int] = {}
+
+    async def do_process_update(
+        self,
+        update: object,
+        coroutine: Awaitable[Any],
+    ) -> None:
+        if (
+            self._update_filter is not None
+            and isinstance(update, Update)
+            and not self._update_filter.check_update(update)
+        ):
+            _dropped_updates.add(1)
+            # Avoids the "coroutine was never awaited" warning
+            cast(Coroutine[Any, Any, Any], coroutine).close()
+            return
+
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await coroutine
+            return
+
+        chat_id = chat.id
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        self._chat_users[chat_id] = self._chat_users.get(chat_id, 0) + 1
+        _queue_depth.add(1)
+        is_queued = True
+        try:
+            async with lock:
+                _queue_depth.add(-1)
+                is_queued = False
+                await coroutine
+        finally:
+            if is_queued:
+                _queue_depth.add(-1)
+
+            remaining_users = self._chat_users[chat_id] - 1
+            if remaining_users:
+                self._chat_users[chat_id] = remaining_users
+            else:
+                del self._chat_users[chat_id]
+                del self._chat_locks[chat_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,176 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
+from typing import cast
+
+import pytest
+from bs_nats_updater import NatsConfig
+from rate_limiter import RateLimiter
+from telegram import Bot as TelegramBot
+from telegram import Chat
+
+from horoscopebot.bot import Bot
+from horoscopebot.config import JobQueueConfig, SendRateConfig, TelegramConfig
+from horoscopebot.dementia_responder import WeekDementiaResponder
+from horoscopebot.horoscope.horoscope import Horoscope, HoroscopeResult
+from horoscopebot.housekeeping import Housekeeper
+from horoscopebot.idempotency import LocalUpdateGuard
+from horoscopebot.job_queue import GenerationJob, LocalJobQueue
+from horoscopebot.partitions import LocalChatPartitions
+
+_JOB = GenerationJob(
+    chat_id=-1,
+    chat_type="group",
+    user_id=2,
+    message_id=3,
+    message_time=datetime(2025, 2, 14, tzinfo=UTC),
+    dice=1,
+)
+_LEASE = timedelta(seconds=300)
+
+
+class _BlockingHoroscope(Horoscope):
+    def __init__(self) -> None:
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def provide_horoscope(
+        self,
+        dice: int,
+        context_id: int,
+        user_id: int,
+        message_id: int,
+        message_time: datetime,
+    ) -> list[HoroscopeResult]:
+        self.started.set()
+        await self.release.wait()
+        return []
+
+
+def _create_bot(horoscope: Horoscope, job_queue: LocalJobQueue) -> Bot:
+    return Bot(
+        TelegramConfig(
+            drain_timeout_seconds=10,
+            enabled_chats=[-1],
+            max_concurrent_generations=1,
+            max_concurrent_updates=1,
+            partition_count=1,
+            partition_index=0,
+            send_rate=SendRateConfig(
+                burst=100,
+                global_per_second=100,
+                group_per_minute=6000,
+                private_per_second=100,
+            ),
+            token="123456:test",
+        ),
+        cast(NatsConfig, None),
+        horoscope=horoscope,
+        rate_limiter=cast(RateLimiter, None),
+        dementia_responder=WeekDementiaResponder(),
+        housekeeper=cast(Housekeeper, None),
+        update_guard=LocalUpdateGuard(),
+        partitions=LocalChatPartitions(count=1, index=0),
+        job_queue=job_queue,
+        job_queue_config=JobQueueConfig(
+            lease_seconds=300,
+            max_attempts=3,
+            # Long enough to notice if idle workers aren't woken up
+            poll_interval_seconds=60,
+            retry_base_seconds=1,
+            retry_max_seconds=1,
+        ),
+        timezone=UTC,
+    )
+
+
+@pytest.fixture()
+def horoscope() -> _BlockingHoroscope:
+    return _BlockingHoroscope()
+
+
+async def _drain_finishes_jobs(horoscope: _BlockingHoroscope) -> None:
+    job_queue = LocalJobQueue()
+    bot = _create_bot(horoscope, job_queue)
+    await job_queue.enqueue(_JOB)
+    workers = [
+        asyncio.create_task(bot._run_generation_worker(cast(TelegramBot, None)))
+        for _ in range(2)
+    ]
+    await horoscope.started.wait()
+
+    bot._request_termination()
+    loop = asyncio.get_running_loop()
+    loop.call_later(0.01, horoscope.release.set)
+    # The idle worker would otherwise wait for the whole poll interval
+    async with asyncio.timeout(1):
+        await bot._drain_workers(workers, loop.time() + 10)
+
+    assert all(worker.done() and not worker.cancelled() for worker in workers)
+    assert await job_queue.claim(_LEASE) is None
+
+
+def test_drain_finishes_jobs(horoscope: _BlockingHoroscope):
+    asyncio.run(_drain_finishes_jobs(horoscope))
+
+
+async def _drain_timeout_hands_back_jobs(horoscope: _BlockingHoroscope) -> None:
+    job_queue = LocalJobQueue()
+    bot = _create_bot(horoscope, job_queue)
+    await job_queue.enqueue(_JOB)
+    worker = asyncio.create_task(
+        bot._run_generation_worker(cast(TelegramBot, None)),
+    )
+    await horoscope.started.wait()
+
+    bot._request_termination()
+    loop = asyncio.get_running_loop()
+    await bot._drain_workers([worker], loop.time() + 0.01)
+
+    assert worker.cancelled()
+    claimed = await job_queue.claim(_LEASE)
+    assert claimed is not None
+    assert claimed.job == _JOB
+    assert claimed.attempt == 2
+
+
+def test_drain_timeout_hands_back_jobs(horoscope: _BlockingHoroscope):
+    asyncio.run(_drain_timeout_hands_back_jobs(horoscope))
+
+
+class _FailingHoroscope(Horoscope):
+    async def provide_horoscope(
+        self,
+        dice: int,
+        context_id: int,
+        user_id: int,
+        message_id: int,
+        message_time: datetime,
+    ) -> list[HoroscopeResult]:
+        raise ValueError("rejected")
+
+    def is_retryable(self, e: Exception) -> bool:
+        return False
+
+
+async def _give_up_replies() -> list[tuple[int, int | None]]:
+    job_queue = LocalJobQueue()
+    bot = _create_bot(_FailingHoroscope(), job_queue)
+    replies: list[tuple[int, int | None]] = []
+
+    async def send_message(
+        chat: Chat,
+        text: str,
+        reply_to_message_id: int | None,
+    ) -> None:
+        replies.append((chat.id, reply_to_message_id))
+
+    bot._send_message = send_message  # type: ignore[method-assign,assignment]
+    await job_queue.enqueue(_JOB)
+
+    assert await bot._process_next_job(cast(TelegramBot, None))
+    assert await job_queue.claim(_LEASE) is None
+    return replies
+
+
+def test_give_up_replies():
+    assert asyncio.run(_give_up_replies()) == [(-1, 3)]
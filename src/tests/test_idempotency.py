@@ -0,0 +1,21 @@
+import asyncio
+
+from horoscopebot.idempotency import LocalUpdateGuard
+
+
+async def _claim_all(guard: LocalUpdateGuard, update_ids: list[int]) -> list[bool]:
+    return [await guard.claim(update_id) for update_id in update_ids]
+
+
+def test_claim_once():
+    guard = LocalUpdateGuard()
+
+    assert asyncio.run(_claim_all(guard, [1, 1, 2])) == [True, False, True]
+
+
+def test_forgets_oldest():
+    guard = LocalUpdateGuard(max_entries=2)
+
+    claims = asyncio.run(_claim_all(guard, [0, 1, 2, 0, 2]))
+
+    assert claims == [True, True, True, True, False]
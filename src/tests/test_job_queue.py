@@ -0,0 +1,198 @@
+import asyncio
+from dataclasses import replace
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from horoscopebot.config import JobQueueConfig
+from horoscopebot.horoscope.horoscope import HoroscopeResult
+from horoscopebot.job_queue import (
+    GenerationJob,
+    JobProgress,
+    LocalJobQueue,
+    _progress_from_json,
+    _progress_to_json,
+    backoff_delay,
+)
+from tests.conftest import FakeClock
+
+_JOB = GenerationJob(
+    chat_id=-1,
+    chat_type="group",
+    user_id=2,
+    message_id=3,
+    message_time=datetime(2025, 2, 14, tzinfo=UTC),
+    dice=1,
+)
+_LEASE = timedelta(seconds=60)
+
+
+async def _claim_complete(queue: LocalJobQueue) -> None:
+    await queue.enqueue(_JOB)
+
+    claimed = await queue.claim(_LEASE)
+    assert claimed is not None
+    assert claimed.job == _JOB
+    assert claimed.attempt == 1
+
+    await queue.complete(claimed)
+    assert await queue.claim(_LEASE) is None
+
+
+def test_claim_complete():
+    asyncio.run(_claim_complete(LocalJobQueue()))
+
+
+async def _lease_expires(queue: LocalJobQueue, clock: FakeClock) -> None:
+    await queue.enqueue(_JOB)
+    first = await queue.claim(_LEASE)
+    assert first is not None
+    assert await queue.claim(_LEASE) is None
+
+    clock.now += 61
+    second = await queue.claim(_LEASE)
+    assert second is not None
+    assert second.id == first.id
+    assert second.attempt == 2
+
+
+def test_lease_expires(clock: FakeClock):
+    asyncio.run(_lease_expires(LocalJobQueue(clock), clock))
+
+
+async def _retry(queue: LocalJobQueue, clock: FakeClock) -> None:
+    await queue.enqueue(_JOB)
+    claimed = await queue.claim(_LEASE)
+    assert claimed is not None
+
+    await queue.retry(claimed, delay=timedelta(seconds=10))
+    assert await queue.claim(_LEASE) is None
+
+    clock.now += 10
+    retried = await queue.claim(_LEASE)
+    assert retried is not None
+    assert retried.attempt == 2
+
+
+def test_retry(clock: FakeClock):
+    asyncio.run(_retry(LocalJobQueue(clock), clock))
+
+
+async def _retry_stays_ahead(queue: LocalJobQueue) -> None:
+    await queue.enqueue(_JOB)
+    await queue.enqueue(replace(_JOB, message_id=4))
+    await queue.enqueue(replace(_JOB, chat_id=-2))
+
+    first = await queue.claim(_LEASE)
+    assert first is not None
+    assert first.job == _JOB
+
+    other_chat = await queue.claim(_LEASE)
+    assert other_chat is not None
+    assert other_chat.job.chat_id == -2
+
+    await queue.retry(first, delay=timedelta())
+    retried = await queue.claim(_LEASE)
+    assert retried is not None
+    assert retried.id == first.id
+
+    await queue.complete(retried)
+    later = await queue.claim(_LEASE)
+    assert later is not None
+    assert later.job.message_id == 4
+
+
+def test_retry_stays_ahead():
+    asyncio.run(_retry_stays_ahead(LocalJobQueue()))
+
+
+async def _retry_keeps_progress(queue: LocalJobQueue) -> None:
+    await queue.enqueue(_JOB)
+    claimed = await queue.claim(_LEASE)
+    assert claimed is not None
+
+    claimed.progress = JobProgress(results=[HoroscopeResult(message="a")])
+    await queue.save_progress(claimed)
+    claimed.progress.sent_results = 1
+    await queue.save_progress(claimed)
+    await queue.retry(claimed, delay=timedelta())
+
+    retried = await queue.claim(_LEASE)
+    assert retried is not None
+    assert retried.progress == JobProgress(
+        results=[HoroscopeResult(message="a")],
+        sent_results=1,
+    )
+
+
+def test_retry_keeps_progress():
+    asyncio.run(_retry_keeps_progress(LocalJobQueue()))
+
+
+async def _complete_remembers_response(queue: LocalJobQueue) -> None:
+    await queue.enqueue(_JOB)
+    claimed = await queue.claim(_LEASE)
+    assert claimed is not None
+    assert await queue.find_response(chat_id=-1, user_id=2, reference_id="3") is None
+
+    claimed.progress = JobProgress(results=[], response_id=42)
+    await queue.complete(claimed)
+
+    assert await queue.find_response(chat_id=-1, user_id=2, reference_id="3") == 42
+    assert await queue.find_response(chat_id=-1, user_id=5, reference_id="3") is None
+
+
+def test_complete_remembers_response():
+    asyncio.run(_complete_remembers_response(LocalJobQueue()))
+
+
+def test_progress_json_roundtrip():
+    progress = JobProgress(
+        results=[
+            HoroscopeResult(message="sent", image_file_id="file", image_cache_id=1),
+            HoroscopeResult(message="unsent", store_id=2),
+        ],
+        sent_results=1,
+        response_id=42,
+    )
+
+    assert _progress_from_json(_progress_to_json(progress)) == progress
+
+
+def test_progress_json_drops_images():
+    progress = JobProgress(
+        results=[
+            HoroscopeResult(message="a", image=b"image", store_id=2),
+            HoroscopeResult(message="b", image=b"image", image_file_id="file"),
+        ],
+    )
+
+    restored = _progress_from_json(_progress_to_json(progress))
+
+    assert restored.results == [
+        HoroscopeResult(message="a", store_id=2, image_dropped=True),
+        HoroscopeResult(message="b", image_file_id="file"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "attempt,maximum",
+    [
+        (1, 5),
+        (2, 10),
+        (3, 20),
+        (10, 60),
+    ],
+)
+def test_backoff_delay(attempt: int, maximum: int):
+    config = JobQueueConfig(
+        lease_seconds=300,
+        max_attempts=5,
+        poll_interval_seconds=2,
+        retry_base_seconds=5,
+        retry_max_seconds=60,
+    )
+
+    delay = backoff_delay(attempt, config)
+
+    assert timedelta(seconds=maximum / 2) <= delay <= timedelta(seconds=maximum)
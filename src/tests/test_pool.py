@@ -0,0 +1,154 @@
+import asyncio
+from datetime import UTC, timedelta
+from pathlib import Path
+
+import pytest
+
+from horoscopebot.horoscope.horoscope import HoroscopeResult
+from horoscopebot.horoscope.pool import HoroscopePool, import_dir, store_key
+from horoscopebot.horoscope.store import ResultStore
+
+
+async def _generate(dice: int) -> HoroscopeResult:
+    return HoroscopeResult(message=str(dice))
+
+
+@pytest.fixture()
+def pool() -> HoroscopePool:
+    return HoroscopePool(
+        generate=_generate,
+        prompt_hashes={1: "a", 2: "b"},
+        size=2,
+        refill_hours=[],
+        refill_delay=timedelta(),
+        timezone=UTC,
+    )
+
+
+def test_take_empty(pool: HoroscopePool):
+    assert pool.take(1) is None
+
+
+def test_take_unknown_dice(pool: HoroscopePool):
+    assert pool.take(43) is None
+
+
+def test_refill_until_full(pool: HoroscopePool):
+    refills = 0
+    while asyncio.run(pool.refill_once()):
+        refills += 1
+
+    assert refills == 4
+    for dice in [1, 2]:
+        for _ in range(2):
+            result = pool.take(dice)
+            assert result is not None
+            assert result.message == str(dice)
+        assert pool.take(dice) is None
+
+
+def test_refill_emptiest_first(pool: HoroscopePool):
+    pool.put(1, HoroscopeResult(message="1"))
+    assert asyncio.run(pool.refill_once())
+    result = pool.take(2)
+    assert result is not None
+    assert result.message == "2"
+
+
+def test_take_keeps_stored_result_until_deleted(tmp_path: Path):
+    store = ResultStore(tmp_path / "results.seg")
+    stored = store.append(store_key(1, "a"), HoroscopeResult(message="stored"))
+    store.append(store_key(1, "a"), HoroscopeResult(message="other"))
+    pool = HoroscopePool(
+        generate=_generate,
+        prompt_hashes={1: "a"},
+        size=2,
+        refill_hours=[],
+        refill_delay=timedelta(),
+        timezone=UTC,
+        store=store,
+    )
+
+    result = pool.take(1)
+    assert result is not None
+    assert result.store_id == stored.id
+    assert store.get(stored.id) == stored
+    store.close()
+
+
+def test_take_skips_deleted_result(tmp_path: Path):
+    store = ResultStore(tmp_path / "results.seg")
+    stored = store.append(store_key(1, "a"), HoroscopeResult(message="sent"))
+    store.append(store_key(1, "a"), HoroscopeResult(message="unsent"))
+    pool = HoroscopePool(
+        generate=_generate,
+        prompt_hashes={1: "a"},
+        size=2,
+        refill_hours=[],
+        refill_delay=timedelta(),
+        timezone=UTC,
+        store=store,
+    )
+
+    store.delete(stored)
+
+    result = pool.take(1)
+    assert result is not None
+    assert result.message == "unsent"
+    assert pool.take(1) is None
+    store.close()
+
+
+def test_restore_drops_stale_prompts(tmp_path: Path):
+    store = ResultStore(tmp_path / "results.seg")
+    stale = store.append(store_key(1, "stale"), HoroscopeResult(message="stale"))
+    store.append(store_key(1, "a"), HoroscopeResult(message="current"))
+    pool = HoroscopePool(
+        generate=_generate,
+        prompt_hashes={1: "a"},
+        size=2,
+        refill_hours=[],
+        refill_delay=timedelta(),
+        timezone=UTC,
+        store=store,
+    )
+
+    result = pool.take(1)
+    assert result is not None
+    assert result.message == "current"
+    assert pool.take(1) is None
+    assert store.get(stale.id) is None
+    store.close()
+
+
+def test_import_segments(tmp_path: Path):
+    store = ResultStore(tmp_path / "results.seg")
+    pool = HoroscopePool(
+        generate=_generate,
+        prompt_hashes={1: "a"},
+        size=2,
+        refill_hours=[],
+        refill_delay=timedelta(),
+        timezone=UTC,
+        store=store,
+    )
+    segment_dir = import_dir(store.path)
+    segment_dir.mkdir()
+    segment = ResultStore(segment_dir / "batch.seg")
+    segment.append(store_key(1, "a"), HoroscopeResult(message="imported", image=b"1"))
+    segment.append(store_key(43, "a"), HoroscopeResult(message="unknown"))
+    segment.append(store_key(1, "stale"), HoroscopeResult(message="stale"))
+    segment.close()
+    ResultStore(segment_dir / "other.seg.partial").close()
+
+    assert asyncio.run(pool.import_once()) == 1
+    assert sorted(path.name for path in segment_dir.iterdir()) == ["other.seg.partial"]
+
+    result = pool.take(1)
+    assert result is not None
+    assert result.message == "imported"
+    assert result.image == b"1"
+    assert result.store_id is not None
+    assert store.get(result.store_id) is not None
+    assert asyncio.run(pool.import_once()) == 0
+    store.close()
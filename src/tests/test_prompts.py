@@ -0,0 +1,22 @@
+import pytest
+
+from horoscopebot.horoscope.horoscope import SLOT_MACHINE_VALUES
+from horoscopebot.horoscope.weekly_openai import get_prompt
+
+
+@pytest.mark.parametrize("dice", SLOT_MACHINE_VALUES.keys())
+def test_prompt_for_every_dice(dice: int):
+    prompt = get_prompt(dice)
+    assert prompt.dice == dice
+    assert prompt.text.endswith("Horoskop:")
+
+
+def test_hashes_are_unique():
+    hashes = {get_prompt(dice).hash for dice in SLOT_MACHINE_VALUES}
+    assert len(hashes) == len(SLOT_MACHINE_VALUES)
+
+
+@pytest.mark.parametrize("dice", [0, 65])
+def test_invalid_dice(dice: int):
+    with pytest.raises(ValueError):
+        get_prompt(dice)
@@ -0,0 +1,81 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from rate_limiter import Usage, repo
+
+from horoscopebot.rate_limit_cache import CachingRateLimitingRepo
+
+
+class _CountingRepo(repo.InMemoryRateLimitingRepo):
+    def __init__(self) -> None:
+        super().__init__()
+        self.reads = 0
+
+    async def get_usages(
+        self,
+        context_id: str,
+        user_id: str,
+        limit: int = 1,
+    ) -> list[Usage]:
+        self.reads += 1
+        return await super().get_usages(
+            context_id=context_id,
+            user_id=user_id,
+            limit=limit,
+        )
+
+
+@pytest.fixture()
+def delegate() -> _CountingRepo:
+    return _CountingRepo()
+
+
+@pytest.fixture()
+def cache(delegate: _CountingRepo) -> CachingRateLimitingRepo:
+    return CachingRateLimitingRepo(
+        delegate,
+        max_entries=1,
+        ttl=timedelta(hours=1),
+        timezone=UTC,
+    )
+
+
+async def _read_write_read(cache: CachingRateLimitingRepo) -> list[Usage]:
+    assert await cache.get_usages(context_id="c", user_id="u") == []
+    await cache.add_usage(
+        context_id="c",
+        user_id="u",
+        utc_time=datetime.now(UTC),
+        reference_id="1",
+        response_id="2",
+    )
+    return await cache.get_usages(context_id="c", user_id="u")
+
+
+def test_write_through(cache: CachingRateLimitingRepo, delegate: _CountingRepo):
+    usages = asyncio.run(_read_write_read(cache))
+    assert [usage.response_id for usage in usages] == ["2"]
+    assert delegate.reads == 1
+
+
+async def _read_two_users(cache: CachingRateLimitingRepo) -> None:
+    await cache.get_usages(context_id="c", user_id="a")
+    await cache.get_usages(context_id="c", user_id="b")
+    await cache.get_usages(context_id="c", user_id="a")
+
+
+def test_lru_eviction(cache: CachingRateLimitingRepo, delegate: _CountingRepo):
+    asyncio.run(_read_two_users(cache))
+    assert delegate.reads == 3
+
+
+async def _read_with_larger_limit(cache: CachingRateLimitingRepo) -> None:
+    await cache.get_usages(context_id="c", user_id="a", limit=1)
+    await cache.get_usages(context_id="c", user_id="a", limit=2)
+    await cache.get_usages(context_id="c", user_id="a", limit=1)
+
+
+def test_larger_limit(cache: CachingRateLimitingRepo, delegate: _CountingRepo):
+    asyncio.run(_read_with_larger_limit(cache))
+    assert delegate.reads == 2
@@ -0,0 +1,59 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from rate_limiter import Usage, repo
+
+from horoscopebot.rate_limit_timeout import TimeoutRateLimitingRepo
+
+
+class _SlowRepo(repo.InMemoryRateLimitingRepo):
+    def __init__(self, delay: float) -> None:
+        super().__init__()
+        self._delay = delay
+        self.did_housekeeping = False
+
+    async def get_usages(
+        self,
+        context_id: str,
+        user_id: str,
+        limit: int = 1,
+    ) -> list[Usage]:
+        await asyncio.sleep(self._delay)
+        return await super().get_usages(
+            context_id=context_id,
+            user_id=user_id,
+            limit=limit,
+        )
+
+    async def housekeeping(self, keep_after: datetime) -> None:
+        await asyncio.sleep(self._delay)
+        self.did_housekeeping = True
+
+
+def test_times_out():
+    repository = TimeoutRateLimitingRepo(
+        _SlowRepo(delay=1),
+        timeout=timedelta(milliseconds=10),
+    )
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(repository.get_usages(context_id="c", user_id="u"))
+
+
+def test_passes_through():
+    repository = TimeoutRateLimitingRepo(
+        _SlowRepo(delay=0),
+        timeout=timedelta(seconds=1),
+    )
+
+    assert asyncio.run(repository.get_usages(context_id="c", user_id="u")) == []
+
+
+def test_housekeeping_is_not_bounded():
+    delegate = _SlowRepo(delay=0.05)
+    repository = TimeoutRateLimitingRepo(delegate, timeout=timedelta(milliseconds=10))
+
+    asyncio.run(repository.housekeeping(keep_after=datetime.now(UTC)))
+
+    assert delegate.did_housekeeping
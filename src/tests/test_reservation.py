@@ -0,0 +1,64 @@
+import asyncio
+from datetime import UTC, datetime
+
+import pytest
+from rate_limiter import RateLimiter, repo
+
+from horoscopebot.rate_limit_policy import WeeklyLimitPolicy
+from horoscopebot.reservation import UsageReservations
+
+
+@pytest.fixture()
+def rate_limiter() -> RateLimiter:
+    return RateLimiter(
+        policy=WeeklyLimitPolicy(),
+        repo=repo.InMemoryRateLimitingRepo(),
+    )
+
+
+async def _reserve_twice(reservations: UsageReservations) -> None:
+    time = datetime.now(UTC)
+    first = await reservations.reserve(
+        context_id=1,
+        user_id=2,
+        at_time=time,
+        reference_id="10",
+    )
+    assert first.conflicting_usage is None
+
+    # The first usage counts before its horoscope has been generated
+    second = await reservations.reserve(
+        context_id=1,
+        user_id=2,
+        at_time=time,
+        reference_id="11",
+    )
+    usage = second.conflicting_usage
+    assert usage is not None
+    assert usage.reference_id == "10"
+
+
+def test_reservation_conflicts(rate_limiter: RateLimiter):
+    asyncio.run(_reserve_twice(UsageReservations(rate_limiter)))
+
+
+async def _reserve_for_other_user(reservations: UsageReservations) -> bool:
+    time = datetime.now(UTC)
+    await reservations.reserve(
+        context_id=1,
+        user_id=2,
+        at_time=time,
+        reference_id="10",
+    )
+    reservation = await reservations.reserve(
+        context_id=1,
+        user_id=3,
+        at_time=time,
+        reference_id="11",
+    )
+    return reservation.conflicting_usage is None
+
+
+def test_reservation_is_per_user(rate_limiter: RateLimiter):
+    reservations = UsageReservations(rate_limiter)
+    assert asyncio.run(_reserve_for_other_user(reservations))
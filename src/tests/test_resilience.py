@@ -0,0 +1,125 @@
+import pytest
+
+from horoscopebot.horoscope.resilience import (
+    AdaptiveTimeout,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+from tests.conftest import FakeClock
+
+
+@pytest.fixture()
+def breaker(clock: FakeClock) -> CircuitBreaker:
+    return CircuitBreaker(
+        "test",
+        failure_threshold=2,
+        reset_timeout=10,
+        clock=clock,
+    )
+
+
+def _fail(breaker: CircuitBreaker) -> None:
+    with pytest.raises(TimeoutError), breaker.guard():
+        raise TimeoutError()
+
+
+def test_opens_after_threshold(breaker: CircuitBreaker):
+    _fail(breaker)
+    assert not breaker.is_open
+    _fail(breaker)
+    assert breaker.is_open
+
+    with pytest.raises(CircuitOpenError), breaker.guard():
+        pytest.fail("Call should not be made")
+
+
+def test_success_resets_failures(breaker: CircuitBreaker):
+    _fail(breaker)
+    with breaker.guard():
+        pass
+    _fail(breaker)
+    assert not breaker.is_open
+
+
+def test_ignored_failure(breaker: CircuitBreaker):
+    for _ in range(3):
+        with (
+            pytest.raises(ValueError),
+            breaker.guard(lambda e: not isinstance(e, ValueError)),
+        ):
+            raise ValueError()
+
+    assert not breaker.is_open
+
+
+def test_inconclusive_neither_succeeds_nor_fails(
+    breaker: CircuitBreaker,
+    clock: FakeClock,
+):
+    def inconclusive() -> None:
+        with (
+            pytest.raises(TimeoutError),
+            breaker.guard(is_inconclusive=lambda e: True),
+        ):
+            raise TimeoutError()
+
+    _fail(breaker)
+    inconclusive()
+    _fail(breaker)
+    assert breaker.is_open
+
+    clock.now = 10
+    inconclusive()
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError), breaker.guard():
+        pass
+
+
+def test_half_open_probe_success(breaker: CircuitBreaker, clock: FakeClock):
+    _fail(breaker)
+    _fail(breaker)
+    clock.now = 10
+
+    with breaker.guard():
+        # Only a single probe may pass
+        with pytest.raises(CircuitOpenError), breaker.guard():
+            pass
+
+    assert not breaker.is_open
+
+
+def test_half_open_probe_failure(breaker: CircuitBreaker, clock: FakeClock):
+    _fail(breaker)
+    _fail(breaker)
+    clock.now = 10
+    _fail(breaker)
+    assert breaker.is_open
+
+    clock.now = 19
+    with pytest.raises(CircuitOpenError), breaker.guard():
+        pass
+
+
+def test_timeout_defaults_to_maximum():
+    timeout = AdaptiveTimeout(minimum=1, maximum=60, min_samples=3)
+    timeout.observe(2)
+    timeout.observe(2)
+    assert timeout.timeout == 60
+
+
+def test_timeout_follows_latency():
+    timeout = AdaptiveTimeout(minimum=1, maximum=60, multiplier=2, min_samples=3)
+    for _ in range(3):
+        timeout.observe(2)
+    assert timeout.timeout == pytest.approx(4)
+
+
+def test_timeout_is_clamped():
+    timeout = AdaptiveTimeout(minimum=5, maximum=60, min_samples=3)
+    for _ in range(3):
+        timeout.observe(0.1)
+    assert timeout.timeout == 5
+
+    for _ in range(3):
+        timeout.observe(100)
+    assert timeout.timeout == 60
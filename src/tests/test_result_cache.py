@@ -0,0 +1,96 @@
+import random
+from datetime import datetime
+
+import pytest
+
+from horoscopebot.horoscope.result_cache import CachedValue, CacheKey, ResultCache
+
+_KEY = CacheKey(prompt_hash="abc", model="model", week="2025-W07")
+
+
+def _cache(max_bytes: int = 100, reuse_probability: float = 1) -> ResultCache:
+    return ResultCache(
+        max_bytes=max_bytes,
+        reuse_probability=reuse_probability,
+        rng=random.Random(42),
+    )
+
+
+def test_get_empty():
+    assert _cache().get(_KEY) is None
+
+
+def test_reuse():
+    cache = _cache()
+    entry_id = cache.put(_KEY, b"image")
+    assert entry_id is not None
+    assert cache.get(_KEY) == CachedValue(id=entry_id, value=b"image", file_id=None)
+
+
+def test_file_id():
+    cache = _cache()
+    entry_id = cache.put(_KEY, b"image")
+    assert entry_id is not None
+    cache.set_file_id(entry_id, "file")
+
+    cached = cache.get(_KEY)
+    assert cached is not None
+    assert cached.file_id == "file"
+
+
+def test_never_reuse():
+    cache = _cache(reuse_probability=0)
+    cache.put(_KEY, b"image")
+    assert cache.get(_KEY) is None
+
+
+def test_evicts_oldest_by_size():
+    cache = _cache(max_bytes=10)
+    cache.put(_KEY, b"12345")
+    other_key = CacheKey(prompt_hash="def", model="model", week=_KEY.week)
+    cache.put(other_key, b"123456")
+
+    assert cache.size == 6
+    assert cache.get(_KEY) is None
+    cached = cache.get(other_key)
+    assert cached is not None
+    assert cached.value == b"123456"
+
+
+def test_skips_values_larger_than_budget():
+    cache = _cache(max_bytes=4)
+    assert cache.put(_KEY, b"12345") is None
+    assert cache.size == 0
+
+
+def test_text_size_in_bytes():
+    cache = _cache()
+    cache.put(_KEY, "ä")
+    assert cache.size == 2
+
+
+def test_new_week_drops_old_values():
+    cache = _cache()
+    cache.put(_KEY, b"old")
+    next_week = CacheKey(prompt_hash="abc", model="model", week="2025-W08")
+    cache.put(next_week, b"new")
+
+    assert cache.get(_KEY) is None
+    cached = cache.get(next_week)
+    assert cached is not None
+    assert cached.value == b"new"
+
+    # Late values for the previous week are ignored
+    cache.put(_KEY, b"late")
+    assert cache.get(_KEY) is None
+
+
+@pytest.mark.parametrize(
+    "year,month,day,week",
+    [
+        (2025, 2, 10, "2025-W07"),
+        (2024, 12, 30, "2025-W01"),
+    ],
+)
+def test_week_of(year: int, month: int, day: int, week: str):
+    assert CacheKey.week_of(datetime(year, month, day)) == week
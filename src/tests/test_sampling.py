@@ -0,0 +1,119 @@
+import pytest
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+from opentelemetry.sdk.trace.sampling import Decision
+from opentelemetry.trace import Status, StatusCode
+
+from horoscopebot.sampling import (
+    ErrorTailSpanProcessor,
+    _RecordingRatioSampler,
+    create_sampler,
+)
+
+
+@pytest.mark.parametrize(
+    "ratio,decision",
+    [
+        (0, Decision.RECORD_ONLY),
+        (1, Decision.RECORD_AND_SAMPLE),
+    ],
+)
+def test_recording_ratio_sampler(ratio: float, decision: Decision):
+    sampler = _RecordingRatioSampler(ratio)
+
+    result = sampler.should_sample(None, trace_id=1, name="test")
+
+    assert result.decision == decision
+
+
+def test_sample_everything():
+    result = create_sampler(1).should_sample(None, trace_id=1, name="test")
+    assert result.decision == Decision.RECORD_AND_SAMPLE
+
+
+@pytest.fixture()
+def exporter() -> InMemorySpanExporter:
+    return InMemorySpanExporter()
+
+
+def _create_provider(
+    exporter: InMemorySpanExporter,
+    *,
+    ratio: float = 0,
+    max_traces: int = 1024,
+) -> tuple[TracerProvider, ErrorTailSpanProcessor]:
+    provider = TracerProvider(sampler=create_sampler(ratio))
+    processor = ErrorTailSpanProcessor(exporter, max_traces=max_traces)
+    provider.add_span_processor(processor)
+    return provider, processor
+
+
+def test_exports_failed_trace(exporter: InMemorySpanExporter):
+    provider, processor = _create_provider(exporter)
+    tracer = provider.get_tracer(__name__)
+
+    with tracer.start_as_current_span("root"):
+        with tracer.start_as_current_span("child") as child:
+            child.set_status(Status(StatusCode.ERROR))
+        # Nothing is exported before the root span ends
+        assert processor.force_flush()
+        assert not exporter.get_finished_spans()
+
+    assert processor.force_flush()
+    assert [span.name for span in exporter.get_finished_spans()] == [
+        "child",
+        "root",
+    ]
+
+
+def test_drops_successful_trace(exporter: InMemorySpanExporter):
+    provider, processor = _create_provider(exporter)
+    tracer = provider.get_tracer(__name__)
+
+    with tracer.start_as_current_span("root"):
+        with tracer.start_as_current_span("child"):
+            pass
+
+    assert processor.force_flush()
+    assert not exporter.get_finished_spans()
+
+
+def test_ignores_sampled_trace(exporter: InMemorySpanExporter):
+    provider, processor = _create_provider(exporter, ratio=1)
+    tracer = provider.get_tracer(__name__)
+
+    with tracer.start_as_current_span("root") as root:
+        root.set_status(Status(StatusCode.ERROR))
+
+    # Sampled traces are exported by the regular batch processor
+    assert processor.force_flush()
+    assert not exporter.get_finished_spans()
+
+
+def test_evicts_oldest_trace(exporter: InMemorySpanExporter):
+    provider, processor = _create_provider(exporter, max_traces=1)
+    tracer = provider.get_tracer(__name__)
+
+    first = tracer.start_span("first")
+    with tracer.start_as_current_span(
+        "first-child",
+        context=trace.set_span_in_context(first),
+    ) as child:
+        child.set_status(Status(StatusCode.ERROR))
+
+    second = tracer.start_span("second")
+    with tracer.start_as_current_span(
+        "second-child",
+        context=trace.set_span_in_context(second),
+    ):
+        pass
+
+    # The failed child was evicted by the second trace
+    first.end()
+    second.end()
+
+    assert processor.force_flush()
+    assert not exporter.get_finished_spans()
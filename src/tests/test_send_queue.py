@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+from telegram.error import RetryAfter
+
+from horoscopebot.config import SendRateConfig
+from horoscopebot.send_queue import SendScheduler, TokenBucket
+from tests.conftest import FakeClock
+
+
+def test_bucket_allows_burst(clock: FakeClock):
+    bucket = TokenBucket(rate=1, capacity=3, clock=clock)
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    assert bucket.reserve() == pytest.approx(1)
+    assert bucket.reserve() == pytest.approx(2)
+
+
+def test_bucket_refills(clock: FakeClock):
+    bucket = TokenBucket(rate=2, capacity=1, clock=clock)
+    assert bucket.reserve() == 0
+    clock.now = 0.5
+    assert bucket.reserve() == 0
+    clock.now = 10
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.5)
+
+
+def test_bucket_delay(clock: FakeClock):
+    bucket = TokenBucket(rate=1, capacity=3, clock=clock)
+    bucket.delay(5)
+    assert bucket.reserve() == pytest.approx(6)
+
+
+@pytest.fixture()
+def scheduler() -> SendScheduler:
+    return SendScheduler(
+        SendRateConfig(
+            burst=100,
+            global_per_second=100,
+            group_per_minute=6000,
+            private_per_second=100,
+        ),
+        max_retries=1,
+    )
+
+
+def test_parts_are_not_interleaved(scheduler: SendScheduler):
+    sent: list[str] = []
+
+    def part(name: str):
+        async def send() -> str:
+            await asyncio.sleep(0)
+            sent.append(name)
+            return name
+
+        return send
+
+    async def run() -> None:
+        await asyncio.gather(
+            scheduler.send(1, [part("a1"), part("a2")]),
+            scheduler.send(1, [part("b1"), part("b2")]),
+        )
+
+    asyncio.run(run())
+    assert sent == ["a1", "a2", "b1", "b2"]
+
+
+def test_retry_after(scheduler: SendScheduler):
+    attempts = 0
+
+    async def send() -> int:
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise RetryAfter(0)
+        return attempts
+
+    assert asyncio.run(scheduler.send(1, [send])) == [2]
+
+
+def test_retry_after_gives_up(scheduler: SendScheduler):
+    async def send() -> None:
+        raise RetryAfter(0)
+
+    with pytest.raises(RetryAfter):
+        asyncio.run(scheduler.send(1, [send]))
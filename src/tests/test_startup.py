@@ -0,0 +1,58 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# Only needed if telemetry or Sentry are enabled
+_LAZY_MODULES = [
+    "grpc",
+    "opentelemetry.exporter.otlp.proto.grpc",
+    "opentelemetry.instrumentation.asyncio",
+    "opentelemetry.instrumentation.openai",
+    "opentelemetry.sdk",
+    "sentry_sdk",
+]
+
+# Needed to handle any update. Their import time is the yardstick for the rest, so
+# the budget doesn't depend on the speed of the machine running the tests.
+_REQUIRED_MODULES = ["openai", "telegram", "telegram.ext"]
+
+# Everything else took about 0.65 times as long as the required modules when this
+# was last measured. Raise this deliberately if a new import at startup is worth
+# its cost.
+_IMPORT_BUDGET_RATIO = 1.5
+
+
+@pytest.fixture(scope="module")
+def import_times() -> dict[str, int]:
+    """Cumulative import time in microseconds by module, as reported by Python."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import horoscopebot.__main__"],
+        cwd=Path(__file__).parents[1],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or line.endswith("imported package"):
+            continue
+
+        _, cumulative, module = line.removeprefix("import time:").split("|")
+        times[module.strip()] = int(cumulative)
+
+    return times
+
+
+@pytest.mark.parametrize("module", _LAZY_MODULES)
+def test_lazy_import(import_times: dict[str, int], module: str):
+    assert module not in import_times
+
+
+def test_import_budget(import_times: dict[str, int]):
+    required = sum(import_times[module] for module in _REQUIRED_MODULES)
+    rest = import_times["horoscopebot.__main__"] - required
+    assert rest < _IMPORT_BUDGET_RATIO * required
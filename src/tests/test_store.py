@@ -0,0 +1,121 @@
+from pathlib import Path
+
+import pytest
+
+from horoscopebot.horoscope.horoscope import HoroscopeResult
+from horoscopebot.horoscope.store import ResultStore
+
+
+@pytest.fixture()
+def path(tmp_path: Path) -> Path:
+    return tmp_path / "results.seg"
+
+
+def test_roundtrip(path: Path):
+    store = ResultStore(path)
+    stored = store.append("key", HoroscopeResult(message="Hällo", image=b"image"))
+
+    assert store.read_text(stored) == "Hällo"
+    image = store.read_image(stored)
+    assert image is not None
+    assert image.tobytes() == b"image"
+    assert store.load(stored) == HoroscopeResult(
+        message="Hällo",
+        image=b"image",
+        store_id=stored.id,
+    )
+
+
+def test_without_image(path: Path):
+    store = ResultStore(path)
+    stored = store.append("key", HoroscopeResult(message="text"))
+
+    assert store.read_image(stored) is None
+
+
+def test_reopen(path: Path):
+    store = ResultStore(path)
+    first = store.append("a", HoroscopeResult(message="first", image=b"1"))
+    store.append("b", HoroscopeResult(message="second"))
+    store.delete(first)
+    store.close()
+
+    store = ResultStore(path)
+    entries = list(store.entries())
+    assert [entry.key for entry in entries] == ["b"]
+    assert store.read_text(entries[0]) == "second"
+
+
+def test_entries_by_key(path: Path):
+    store = ResultStore(path)
+    store.append("a", HoroscopeResult(message="first"))
+    store.append("b", HoroscopeResult(message="second"))
+
+    assert [store.read_text(entry) for entry in store.entries("a")] == ["first"]
+
+
+def test_truncated_tail(path: Path):
+    store = ResultStore(path)
+    store.append("a", HoroscopeResult(message="first"))
+    store.close()
+
+    with path.open("ab") as f:
+        f.write(b"HRS2")
+
+    store = ResultStore(path)
+    assert len(list(store.entries())) == 1
+    stored = store.append("b", HoroscopeResult(message="second"))
+    store.close()
+
+    store = ResultStore(path)
+    assert [entry.key for entry in store.entries()] == ["a", "b"]
+    assert store.read_text(stored) == "second"
+
+
+def test_discards_older_format(path: Path):
+    store = ResultStore(path)
+    store.append("a", HoroscopeResult(message="old"))
+    store.close()
+    data = path.read_bytes()
+    path.write_bytes(b"HRS1" + data[4:])
+
+    store = ResultStore(path)
+    assert list(store.entries()) == []
+    assert path.stat().st_size == 0
+    store.close()
+
+
+def test_exclusive(path: Path):
+    store = ResultStore(path)
+
+    with pytest.raises(ValueError):
+        ResultStore(path)
+
+    store.close()
+    ResultStore(path).close()
+
+
+def test_compact(path: Path):
+    store = ResultStore(path)
+    stored = [
+        store.append(str(i), HoroscopeResult(message=str(i), image=b"x" * 1000))
+        for i in range(10)
+    ]
+    for entry in stored[:-2]:
+        store.delete(entry)
+    store.close()
+    size = path.stat().st_size
+
+    store = ResultStore(path, compact_min_bytes=0)
+    assert path.stat().st_size < size
+    assert [entry.id for entry in store.entries()] == [s.id for s in stored[-2:]]
+    assert [store.read_text(entry) for entry in store.entries()] == ["8", "9"]
+    assert store.get(stored[-1].id) is not None
+
+    new = store.append("new", HoroscopeResult(message="new"))
+    assert new.id not in {s.id for s in stored}
+    store.close()
+
+    store = ResultStore(path)
+    assert [entry.key for entry in store.entries()] == ["8", "9", "new"]
+    store.close()
@@ -0,0 +1,164 @@
+import asyncio
+import base64
+import json
+from datetime import UTC
+from typing import Any
+
+import pytest
+from openai.types import ImagesResponse
+from openai.types.chat import ChatCompletion
+
+from horoscopebot.config import (
+    CircuitBreakerConfig,
+    HttpClientConfig,
+    OpenAiConfig,
+    PoolConfig,
+    ResultCacheConfig,
+    TimeoutConfig,
+)
+from horoscopebot.horoscope.weekly_openai import (
+    WeeklyOpenAiHoroscope,
+    _parse_structured,
+    _StructuredHoroscope,
+)
+
+_IMAGE = b"image"
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        None,
+        "",
+        "not json",
+        "[]",
+        '"horoscope"',
+        '{"horoscope": "Text"}',
+        '{"image_description": "Prompt"}',
+        '{"horoscope": 1, "image_description": "Prompt"}',
+        '{"horoscope": "Text", "image_description": null}',
+        '{"horoscope": "", "image_description": "Prompt"}',
+    ],
+)
+def test_parse_invalid(content: str | None):
+    assert _parse_structured(content) is None
+
+
+def test_parse():
+    content = json.dumps({"horoscope": "Text", "image_description": "Prompt"})
+    assert _parse_structured(content) == _StructuredHoroscope(
+        text="Text",
+        image_prompt="Prompt",
+    )
+
+
+def _completion(content: str) -> ChatCompletion:
+    return ChatCompletion.model_validate(
+        {
+            "id": "completion",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "model",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }
+            ],
+        }
+    )
+
+
+class _FakeOpenAi:
+    """Answers like OpenAI, recording the completion requests."""
+
+    def __init__(self, structured_content: str):
+        self._structured_content = structured_content
+        self.requests: list[dict[str, Any]] = []
+        self.chat = self
+        self.completions = self
+        self.images = self
+
+    async def create(self, **kwargs: Any) -> ChatCompletion:
+        self.requests.append(kwargs)
+        if "response_format" in kwargs:
+            return _completion(self._structured_content)
+        return _completion(f"Answer {len(self.requests)}")
+
+    async def generate(self, **kwargs: Any) -> ImagesResponse:
+        return ImagesResponse.model_validate(
+            {"created": 0, "data": [{"b64_json": base64.b64encode(_IMAGE).decode()}]}
+        )
+
+
+def _create_horoscope(open_ai: _FakeOpenAi) -> WeeklyOpenAiHoroscope:
+    horoscope = WeeklyOpenAiHoroscope(
+        OpenAiConfig(
+            breaker=CircuitBreakerConfig(failure_threshold=5, reset_seconds=30),
+            cache=ResultCacheConfig(
+                image_reuse_probability=0,
+                max_bytes=0,
+                text_reuse_probability=0,
+            ),
+            deadline_seconds=90,
+            debug_mode=False,
+            http=HttpClientConfig(
+                connect_timeout_seconds=5,
+                http2=False,
+                keepalive_expiry_seconds=120,
+                max_connections=1,
+                max_keepalive_connections=1,
+                read_timeout_seconds=120,
+            ),
+            image_compression=None,
+            image_format="png",
+            image_model_name="image-model",
+            image_moderation_level="low",
+            image_quality="low",
+            model_name="model",
+            pipeline_images=False,
+            pool=PoolConfig(size=0, refill_delay_seconds=0, refill_hours=[]),
+            structured_output=True,
+            timeouts=TimeoutConfig(
+                completion_max_seconds=10,
+                completion_min_seconds=1,
+                image_max_seconds=10,
+                image_min_seconds=1,
+                image_prompt_max_seconds=10,
+                image_prompt_min_seconds=1,
+            ),
+            token="token",
+        ),
+        UTC,
+    )
+    horoscope._client = open_ai  # type: ignore[assignment]
+    return horoscope
+
+
+def test_structured_completion():
+    open_ai = _FakeOpenAi(
+        json.dumps({"horoscope": "Text", "image_description": "Prompt"})
+    )
+    horoscope = _create_horoscope(open_ai)
+
+    result = asyncio.run(horoscope._create_completion(1, "Prompt"))
+
+    assert result.message == "Text"
+    assert result.image == _IMAGE
+    # The image prompt came with the text
+    assert len(open_ai.requests) == 1
+
+
+@pytest.mark.parametrize("content", ["", "not json", '{"horoscope": 1}'])
+def test_fallback_to_two_completions(content: str):
+    open_ai = _FakeOpenAi(content)
+    horoscope = _create_horoscope(open_ai)
+
+    result = asyncio.run(horoscope._create_completion(1, "Prompt"))
+
+    # Structured attempt, plain text and image prompt
+    assert len(open_ai.requests) == 3
+    assert "response_format" not in open_ai.requests[1]
+    assert result.message == "Answer 2"
+    assert result.image == _IMAGE
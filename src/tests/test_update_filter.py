@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+import pytest
+from telegram import Update
+
+from horoscopebot.partitions import LocalChatPartitions
+from horoscopebot.update_filter import EnabledSlotMachineFilter
+
+
+def _update(chat_id: int, emoji: str | None) -> Update:
+    message: dict = {
+        "message_id": 1,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "group", "title": "Test"},
+        "from": {"id": 2, "is_bot": False, "first_name": "User"},
+    }
+    if emoji is None:
+        message["text"] = "hello"
+    else:
+        message["dice"] = {"emoji": emoji, "value": 1}
+
+    return Update.de_json({"update_id": 1, "message": message}, None)
+
+
+@pytest.mark.parametrize(
+    "chat_id,emoji,expected",
+    [
+        (-1, "🎰", True),
+        (-2, "🎰", False),
+        (-1, "🎲", False),
+        (-1, None, False),
+    ],
+)
+def test_filter(chat_id: int, emoji: str | None, expected: bool):
+    update_filter = EnabledSlotMachineFilter([-1])
+    assert bool(update_filter.check_update(_update(chat_id, emoji))) is expected
+
+
+@pytest.mark.parametrize("partition_index", [0, 1, 2])
+def test_partition(partition_index: int):
+    chat_ids = [-1001725586482, -1, -2, 133399998]
+    partitions = LocalChatPartitions(count=3, index=partition_index)
+    update_filter = EnabledSlotMachineFilter(chat_ids, partitions=partitions)
+
+    for chat_id in chat_ids:
+        assert not update_filter.check_update(_update(chat_id, "🎰"))
+
+    asyncio.run(partitions.acquire())
+    for chat_id in chat_ids:
+        expected = chat_id % 3 == partition_index
+        assert bool(update_filter.check_update(_update(chat_id, "🎰"))) is expected
@@ -0,0 +1,117 @@
+import asyncio
+import inspect
+import time
+
+from telegram import Update
+
+from horoscopebot.update_filter import EnabledSlotMachineFilter
+from horoscopebot.update_processor import ChatOrderedUpdateProcessor
+
+
+def _update(chat_id: int, update_id: int = 1) -> Update:
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "group", "title": "Test"},
+        "from": {"id": 2, "is_bot": False, "first_name": "User"},
+        "dice": {"emoji": "🎰", "value": 1},
+    }
+    return Update.de_json({"update_id": update_id, "message": message}, None)
+
+
+async def _order_within_chat() -> list[str]:
+    processor = ChatOrderedUpdateProcessor(max_concurrent_updates=8)
+    events: list[str] = []
+    release_first = asyncio.Event()
+
+    async def handle(name: str, release: asyncio.Event | None = None) -> None:
+        events.append(f"start {name}")
+        if release is not None:
+            await release.wait()
+        events.append(f"end {name}")
+
+    first = asyncio.create_task(
+        processor.process_update(_update(-1, 1), handle("first", release_first))
+    )
+    second = asyncio.create_task(
+        processor.process_update(_update(-1, 2), handle("second"))
+    )
+    await asyncio.sleep(0.01)
+    release_first.set()
+    await asyncio.gather(first, second)
+    return events
+
+
+def test_order_within_chat():
+    assert asyncio.run(_order_within_chat()) == [
+        "start first",
+        "end first",
+        "start second",
+        "end second",
+    ]
+
+
+async def _concurrency_across_chats() -> None:
+    processor = ChatOrderedUpdateProcessor(max_concurrent_updates=8)
+    other_chat_started = asyncio.Event()
+
+    async def wait_for_other_chat() -> None:
+        await other_chat_started.wait()
+
+    async def start() -> None:
+        other_chat_started.set()
+
+    # Deadlocks if the second chat has to wait for the first one
+    async with asyncio.timeout(1):
+        await asyncio.gather(
+            processor.process_update(_update(-1), wait_for_other_chat()),
+            processor.process_update(_update(-2), start()),
+        )
+
+
+def test_concurrency_across_chats():
+    asyncio.run(_concurrency_across_chats())
+
+
+async def _cleanup(processor: ChatOrderedUpdateProcessor) -> None:
+    async def fail() -> None:
+        raise ValueError()
+
+    async def succeed() -> None:
+        pass
+
+    await asyncio.gather(
+        processor.process_update(_update(-1, 1), succeed()),
+        processor.process_update(_update(-1, 2), fail()),
+        processor.process_update(_update(-2, 3), succeed()),
+        return_exceptions=True,
+    )
+
+
+def test_cleanup():
+    processor = ChatOrderedUpdateProcessor(max_concurrent_updates=8)
+
+    asyncio.run(_cleanup(processor))
+
+    assert not processor._chat_locks
+    assert not processor._chat_users
+
+
+def test_drops_filtered_update():
+    processor = ChatOrderedUpdateProcessor(
+        max_concurrent_updates=8,
+        update_filter=EnabledSlotMachineFilter([-1]),
+    )
+    was_handled = False
+
+    async def handle() -> None:
+        nonlocal was_handled
+        was_handled = True
+
+    coroutine = handle()
+    asyncio.run(processor.process_update(_update(-2), coroutine))
+
+    assert not was_handled
+    # Closed, so it doesn't warn about never being awaited
+    assert inspect.getcoroutinestate(coroutine) == inspect.CORO_CLOSED
+    assert not processor._chat_locks